@@ -9,9 +9,11 @@
 #
 from collections import defaultdict, OrderedDict
 from operator import itemgetter
+from itertools import chain
 import time
 import re
 import sqlite3
+import os
 import logging
 from unittest import signals
 import requests
@@ -24,8 +26,27 @@ import requests
 import signal
 import sys
 from adslib.constants import STATIC_CALL_SIGNS, STATIC_CATEGORIES, sql_create_flight_cache_table, sql_create_flights_table, sql_create_plane_days_table, sql_create_planes_table, sql_create_types_table
+from adslib.constants import sql_upsert_planes, sql_upsert_plane_days, sql_update_plane_day, sql_upsert_flights, sql_create_lookup_indexes, AIRCRAFT_COLUMNS
+from adslib.constants import sql_new_planes, sql_new_plane_days, sql_new_flights
 from adslib.display import print_planes, print_flights, print_plane_days, lookup_ptypes, get_db_stats
-from adslib.helpers import check_quiet_time, dict_gen, get_call_signs, get_route_type
+from adslib.helpers import check_quiet_time, dict_gen, get_call_signs, get_route_type, page_sql, planes_where, flights_where, connect_read_only, aircraft_fields, upsert, dup_serials_sql
+from adslib.compact import icao_key
+from adslib import archive
+from adslib import compact
+from adslib import retention
+from adslib import snapshot
+from adslib import stats
+from adslib import rollup
+from adslib import search
+from adslib import export
+from adslib import server
+from adslib import live
+from adslib import events
+from adslib import alerts
+from adslib import logs
+from adslib import receivers
+from adslib import scheduler
+from adslib import shards
 from adslib import display
 from adslib import helpers
 
@@ -41,6 +62,11 @@ ptype_alerted = dict()
 pdict = dict()
 cdict = defaultdict(int)
 local_flights = dict()
+# Routes looked up this cycle by enrichment workers (shards.py), flight -> (flight cache, RouteView)
+shard_routes = dict()
+day_idents = dict()
+day_idents_date = None
+serials = dict()
 local_fixed = 10
 local_correct = 2
 lookup = None
@@ -61,19 +87,8 @@ def setup_logger(logfile="ads-db.log", level=logging.INFO):
 
     logging.getLogger("urllib3").setLevel(logging.WARNING)
 
-    logFormatter = logging.Formatter("%(asctime)s %(levelname)-8s %(message)s")
-    logger = logging.getLogger()
-
-    fileHandler = logging.FileHandler(logfile)
-    fileHandler.setFormatter(logFormatter)
-    logger.addHandler(fileHandler)
-
-    consoleHandler = logging.StreamHandler()
-    consoleHandler.setFormatter(logFormatter)
-    logger.addHandler(consoleHandler)
-    logger.setLevel(level)
-
-    return logger
+    # Records are queued, the file and console handlers run on the listener thread
+    return logs.setup(logfile, level)
 
 
 def create_connection(db_file):
@@ -101,23 +116,21 @@ def connect_ads_db(db_file):
     conn_db = sqlite3.connect(
         db_file,
         detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES,
+        factory=compact.Connection,
     )
 
+    # Compact (v2) databases already have their keys
+    if compact.setup(conn_db):
+        create_indexes(conn_db)
+        return load_reactivated(conn_db)
 
     create_table(conn_db, sql_create_flight_cache_table)
 
     # Try to populated reactived database
     try:
-        rcount = 0
-        cur = conn_db.cursor()
-        cur.execute("SELECT icao FROM planes WHERE status=?", ("R",))
-        rows = cur.fetchall()
-        for row in rows:
-            reactivated[row[0]] = 1
-            rcount +=1
-        if rcount:
-            logger.debug(f"Connected to DB: {rcount} Reactivated Planes")
+        load_reactivated(conn_db)
     except sqlite3.OperationalError as e:
+        cur = conn_db.cursor()
         logger.warning(f"New Database: Trying to create DB: {e}")
 
         create_table(conn_db, sql_create_planes_table)
@@ -132,11 +145,12 @@ def connect_ads_db(db_file):
             "pragma synchronous = normal;",
             "pragma temp_store = memory;",
             "pragma mmap_size = 30000000000;",
-            "CREATE INDEX icao_day_idx ON plane_days(icao);",
+            "CREATE UNIQUE INDEX plane_days_key_idx ON plane_days(icao, day, ident);",
             "CREATE INDEX plane_day_idx ON plane_days(day);",
             "CREATE INDEX plane_ident_idx ON plane_days(ident);",
             "CREATE INDEX icao_idx ON planes(icao);",
             "CREATE INDEX ptype_idx ON planes(ptype);",
+            "CREATE INDEX ptype_serial_idx ON planes(ptype, serial);",
             "CREATE INDEX flights_flight_idx ON flights(flight);",
             "CREATE INDEX flights_icao_idx ON flights(icao);",
         ]
@@ -146,9 +160,89 @@ def connect_ads_db(db_file):
             res = cur.execute(cmd)
         conn_db.commit()
 
+    create_plane_days_key(conn_db)
+    create_indexes(conn_db)
+
     return conn_db
 
 
+def load_reactivated(conn_db):
+    "Populate reactivated planes from database"
+
+    cur = conn_db.cursor()
+    cur.execute("SELECT icao FROM planes WHERE status=?", ("R",))
+    rows = cur.fetchall()
+    for row in rows:
+        reactivated[row[0]] = 1
+    if rows:
+        logger.debug(f"Connected to DB: {len(rows)} Reactivated Planes")
+
+    return conn_db
+
+
+def load_serials():
+    "Index known airframes by (ptype, serial) -> (icao, registration) for re-registration checks"
+
+    cur = conn.cursor()
+    cur.execute(
+        "SELECT icao, ptype, serial, registration FROM planes WHERE serial != '' AND NOT status = 'D' ORDER BY lastseen ASC"
+    )
+    for (icao, ptype, serial, reg) in cur.fetchall():
+        serials[(ptype, serial)] = (icao, reg)
+    logger.debug(f"Loaded {len(serials)} airframe serials")
+
+
+def check_serial(icao, ptype, serial, reg, new):
+    "Detect re-registration (new ICAO for a known airframe) and ICAO toggling"
+
+    key = (ptype, serial)
+    old = serials.get(key)
+    serials[key] = (icao, reg)
+    if not old or old[0] == icao:
+        return
+
+    (old_icao, old_reg) = old
+    if new:
+        if "dups" in config and config["dups"].get("deregister") in ["true", "True", "1"]:
+            logger.warning(f"Deactivate Registration ({ptype}): nr:{reg} ni:{icao} ns:{serial} VS or:{old_reg} oi:{old_icao}")
+            events.publish("reregistration", action="deregister", icao=icao, ptype=ptype, serial=serial, reg=reg, old_icao=old_icao, old_reg=old_reg)
+            degregister_plane({"icao": old_icao}, {"icao": icao})
+        else:
+            logger.warning(f"Re-registration ({ptype}): nr:{reg} ni:{icao} ns:{serial} VS or:{old_reg} oi:{old_icao}")
+            events.publish("reregistration", action="new_icao", icao=icao, ptype=ptype, serial=serial, reg=reg, old_icao=old_icao, old_reg=old_reg)
+    elif (icao, date.today(), 'toggle') not in alerted:
+        alerted[(icao, date.today(), 'toggle')] = 1
+        logger.warning(f"ICAO Toggling ({ptype}): nr:{reg} ni:{icao} ns:{serial} VS or:{old_reg} oi:{old_icao}")
+        events.publish("reregistration", action="toggle", icao=icao, ptype=ptype, serial=serial, reg=reg, old_icao=old_icao, old_reg=old_reg)
+
+
+def create_indexes(conn_db):
+    "Add lookup indexes missing from older databases"
+
+    cur = conn_db.cursor()
+    for sql in sql_create_lookup_indexes:
+        cur.execute(sql)
+    conn_db.commit()
+
+
+def create_plane_days_key(conn_db):
+    "Add the unique plane_days key used by upserts, squashing older duplicate entries"
+
+    cur = conn_db.cursor()
+    cur.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND name = 'plane_days_key_idx'")
+    if cur.fetchall():
+        return
+
+    logger.warning("Upgrading Database: Adding unique key to plane_days")
+    cur.execute(
+        "DELETE FROM plane_days WHERE rowid NOT IN (SELECT MAX(rowid) FROM plane_days GROUP BY icao, day, ident)"
+    )
+    if cur.rowcount:
+        logger.warning(f"Removed {cur.rowcount} duplicate plane_days entries")
+    cur.execute("CREATE UNIQUE INDEX plane_days_key_idx ON plane_days(icao, day, ident);")
+    conn_db.commit()
+
+
 def create_table(conn, create_table_sql):
     """create a table from the create_table_sql statement
     :param conn: Connection object
@@ -221,117 +315,76 @@ def update_plane(
     else:
         local_distance = 40
 
+    params = {
+        "icao": icao_key(icao),
+        "ident": ident,
+        "ptype": ptype,
+        "squawk": squawk,
+        "speed": speed,
+        "altitude": altitude,
+        "distance": distance,
+        "heading": heading,
+        "now": now,
+        "today": now.replace(hour=0, minute=0, second=0, microsecond=0),
+        "reg": reg,
+        "country": country,
+        "owner": owner,
+        "military": military,
+        "category": category,
+        "status": status,
+        "opcode": opcode,
+        "model": model,
+        "serial": serial,
+    }
     try:
         cur = conn.cursor()
-        cur.execute("SELECT * FROM planes WHERE icao=?", (icao,))
-        rows = cur.fetchall()
+        new = upsert(cur, sql_upsert_planes, params, sql_new_planes)
+        if new:
+            stats.count("planes")
+        rollup.record(icao, ident, ptype, category, military, owner, now)
+        if serial:
+            check_serial(icao, ptype, serial, reg, new)
     except sqlite3.OperationalError as e:
         logger.warning(f"Database Error: {e}")
         return
 
     # print(f'ic:{icao}, ident:{ident}, sq:{squawk}, pt:{ptype}, dist:{distance}, alt:{altitude}, head:{heading}, spd:{speed}')
-    if not rows:
+    if new:
         model_str = model[:11]
         dist_int = int(distance)
         category = get_category(ptype)
         size = 0
         if re.search(r'A\d', category):
             size = int(category[1])
+        events.publish(
+            "new_plane",
+            icao=icao,
+            ident=ident,
+            ptype=ptype,
+            model=model,
+            mfr=mfr,
+            reg=reg,
+            country=country,
+            owner=owner,
+            military=military,
+            category=category,
+            distance=distance,
+            altitude=altitude,
+            site=site,
+            alert=ptype in alert_types or size == 5,
+        )
         if ptype in alert_types or size == 5:
-            logger.warning(
-                f"NEW PLANE {model_str:>11} ({ptype:>4}) {category:<2} [{dist_int:>3}nm {flight_level:<5}] {ident:>7} {reg} {country} {owner} {mfr} {icao} site:{site}"
-            )
-            play_sound("/Users/yantisj/dev/ads-db/sounds/ding.mp3")
-            play_sound("/Users/yantisj/dev/ads-db/sounds/ding.mp3")
+            message = f"NEW PLANE {model_str:>11} ({ptype:>4}) {category:<2} [{dist_int:>3}nm {flight_level:<5}] {ident:>7} {reg} {country} {owner} {mfr} {icao} site:{site}"
+            logger.warning(message, extra=logs.fields(icao, ident, ptype, site))
+            alerts.alert("new_plane", ("new_plane", icao), ["ding.mp3", "ding.mp3"], message, icao=icao, ptype=ptype, reg=reg)
         else:
             logger.info(
-                f"New Plane {model_str:>11} ({ptype:>4}) {category:<2} [{dist_int:>3}nm {flight_level:<5}] {ident:>7} {reg} {country} {owner} {mfr} {icao} site:{site}"
+                "New Plane %11s (%4s) %-2s [%3snm %-5s] %7s %s %s %s %s %s site:%s",
+                model_str, ptype, category, dist_int, flight_level, ident, reg, country, owner, mfr, icao, site,
+                extra=logs.fields(icao, ident, ptype, site),
             )
-        sql = """INSERT INTO planes(icao,ident,ptype,speed,altitude,lowest_altitude,distance,closest,heading,firstseen,lastseen,registration,country,owner,military,day_count,category,status,opcode,model,serial)
-              VALUES(?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?) """
-        cur.execute(
-            sql,
-            (
-                icao,
-                ident,
-                ptype,
-                speed,
-                altitude,
-                altitude,
-                distance,
-                distance,
-                heading,
-                now,
-                now,
-                reg,
-                country,
-                owner,
-                military,
-                1,
-                category,
-                status,
-                opcode,
-                model,
-                serial
-            ),
-        )
     else:
         try:
-            day_count = get_day_count(icao)
-            # print('updating icao', icao, day_count)
-            row = rows[0]
-            low_dist = row[4]
-            if not low_dist and distance:
-                low_dist = distance
-            elif distance and distance < low_dist:
-                # print('New Low Distance', icao, distance)
-                low_dist = distance
-            low_alt = row[6]
-            if not low_alt and altitude:
-                low_alt = altitude
-            elif altitude and altitude < low_alt:
-                # print('New Low Altitude', icao, altitude)
-                low_alt = altitude
-            nident = row[1]
-            if ident:
-                nident = ident
-            nsquawk = row[9]
-            if squawk:
-                nsquawk = squawk
-            # Reset low/distance stats once per day
-            if row[12].date() < today:
-                # print('Lastseen date reset plane', row)
-                # print(distance, altitude)
-                low_dist = distance
-                low_alt = altitude
-            sql = """UPDATE planes SET ident = ?, ptype = ?, squawk = ?, speed = ?, altitude = ?, lowest_altitude = ?, distance = ?, closest = ?, heading = ?, lastseen = ?, registration = ?, country = ?, owner = ?, military = ?, day_count = ?, category = ?, status = ?, opcode = ?, model = ?, serial = ?
-                WHERE icao = ? """
-            cur.execute(
-                sql,
-                (
-                    nident,
-                    ptype,
-                    nsquawk,
-                    speed,
-                    altitude,
-                    low_alt,
-                    distance,
-                    low_dist,
-                    heading,
-                    now,
-                    reg,
-                    country,
-                    owner,
-                    military,
-                    day_count,
-                    category,
-                    status,
-                    opcode,
-                    model,
-                    serial,
-                    icao,
-                ),
-            )
             if (
                 (ptype in local_types or reg in local_types or ident in local_types)
                 and (icao, today, 'local') not in alerted
@@ -341,11 +394,13 @@ def update_plane(
                 alerted[(icao, today, 'local')] = 1
                 dist_int = int(distance)
                 category = get_category(ptype)
-                logger.warning(
-                    f"Local Alert! {ident:>8} ({ptype:<4}) {category:<2} [{dist_int:>3}nm {flight_level:<5}] {ident:<7} {reg} {country} {owner} {mfr} {icao} site:{site}"
+                events.publish(
+                    "local_plane", icao=icao, ident=ident, ptype=ptype, reg=reg, owner=owner,
+                    category=category, distance=distance, altitude=altitude, site=site,
                 )
-                play_sound("/Users/yantisj/dev/ads-db/sounds/ding.mp3")
-                play_sound("/Users/yantisj/dev/ads-db/sounds/ding-high.mp3")
+                message = f"Local Alert! {ident:>8} ({ptype:<4}) {category:<2} [{dist_int:>3}nm {flight_level:<5}] {ident:<7} {reg} {country} {owner} {mfr} {icao} site:{site}"
+                logger.warning(message, extra=logs.fields(icao, ident, ptype, site))
+                alerts.alert("local_plane", ("local_plane", icao), ["ding.mp3", "ding-high.mp3"], message, icao=icao, ptype=ptype, reg=reg)
 
         except TypeError as e:
             logger.critical(
@@ -376,7 +431,7 @@ def update_plane_day(
     now_date = datetime.now().date()
 
     if not ident:
-        logger.debug(f"no ident, returning: {icao}")
+        logger.debug("no ident, returning: %s", icao)
         return
 
     signs = get_call_signs()
@@ -398,159 +453,80 @@ def update_plane_day(
 
     (from_airport, to_airport, route_distance) = get_flight_data(ident, distance=distance, altitude=altitude, vs=baro_rate, force=call_sign)
 
+    params = {
+        "icao": icao_key(icao),
+        "day": now_date,
+        "ident": ident,
+        "squawk": squawk,
+        "speed": speed,
+        "altitude": altitude,
+        "distance": distance,
+        "heading": heading,
+        "now": now,
+    }
     try:
         cur = conn.cursor()
         if call_sign:
-
-            cur.execute(
-                "SELECT * FROM plane_days WHERE icao = ? and day = ? and ident = ?",
-                (
-                    icao,
-                    now_date,
-                    ident,
-                ),
-            )
-            rows = cur.fetchall()
-            # print(icao, ident, now_date, rows)
+            new = upsert(cur, sql_upsert_plane_days, params, sql_new_plane_days)
         else:
-            cur.execute(
-                "SELECT * FROM plane_days WHERE icao=? and day = ?",
-                (
-                    icao,
-                    now_date,
-                ),
-            )
-            rows = cur.fetchall()
+            # Single row per plane per day, insert when nothing to update
+            cur.execute(sql_update_plane_day, params)
+            new = False
+            if not cur.rowcount:
+                new = upsert(cur, sql_upsert_plane_days, params, sql_new_plane_days)
     except sqlite3.OperationalError as e:
         logger.warning(f"DB Load Error: {e}")
         return
 
     # print(f'ic:{icao}, ident:{ident}, sq:{squawk}, pt:{ptype}, dist:{distance}, alt:{altitude}, head:{heading}, spd:{speed}')
-    if not rows:
-        cur = conn.cursor()
-        dist_int = int(distance)
-        category = get_category(ptype)
-        if call_sign:
-            route_type = get_route_type(route_distance)
-            if route_type:
-                flight_text = 'FLT ' + route_type
-            else:
-                flight_text = 'Flight'
-            fstr = f"Todays {flight_text:<6} {ident:>7} ({ptype}) {category:<2} [{dist_int:>3}nm {flight_level:<5}] {ident:>7} {from_airport:>4}->{to_airport:<4}{route_distance:>5}nm {reg:<6} {icao} site:{site}"
-
-            logger.debug(fstr)
-        else:
-            logger.debug(
-                f"Todays Plane  {ident:>7} ({ptype}) {category:<2} [{dist_int:>3}nm {flight_level:<5}] {ident:>7} {reg} {owner} {icao} site:{site}"
-            )
-
-        sql = """INSERT INTO plane_days(icao,day,ident,speed,altitude,lowest_altitude,distance,closest,heading,firstseen,lastseen)
-              VALUES(?,?,?,?,?,?,?,?,?,?,?) """
-        # print(
-        #         icao,
-        #         now_date,
-        #         ident,
-        #         speed,
-        #         altitude,
-        #         altitude,
-        #         distance,
-        #         distance,
-        #         heading,
-        #         now,
-        #         now,
-        #     )
-        cur.execute(
-            sql,
-            (
-                icao,
-                now_date,
-                ident,
-                speed,
-                altitude,
-                altitude,
-                distance,
-                distance,
-                heading,
-                now,
-                now,
-            ),
-        )
-    else:
-        try:
-            cur = conn.cursor()
-            row = rows[0]
-            low_dist = row[4]
-            if not low_dist and distance:
-                low_dist = distance
-            elif distance and distance < low_dist:
-                # print('New Low Distance', icao, distance)
-                low_dist = distance
-            low_alt = row[6]
-            if not low_alt and altitude:
-                low_alt = altitude
-            elif altitude and altitude < low_alt:
-                # print('New Low Altitude', icao, altitude)
-                low_alt = altitude
-
-            # Use Cache ident
-            nident = row[2]
-            size = 0
-            if re.search(r'A\d', category):
-                size = int(category[1])
-            if ident and nident != ident and size >= 3:
-                if ident not in alerted:
-                    alerted[ident] = 1
-                    logger.info(f"Day Ident mismatch ({ptype}) {category} {ident}  <-> {nident}")
-            if ident:
-                nident = ident
-            elif not nident:
-                print("No ident!", nident, icao)
-            nsquawk = row[9]
-            if squawk:
-                nsquawk = squawk
+    if new:
+        # Only build the debug line (category, route type) when it will be logged
+        if logger.isEnabledFor(logging.DEBUG):
+            category = get_category(ptype)
             if call_sign:
-                sql = """UPDATE plane_days SET squawk =?, speed = ?, altitude = ?, lowest_altitude = ?, distance = ?, closest = ?, heading = ?, lastseen = ?
-                    WHERE icao = ? AND ident = ? AND day = ?"""
-                cur.execute(
-                    sql,
-                    (
-                        nsquawk,
-                        speed,
-                        altitude,
-                        low_alt,
-                        distance,
-                        low_dist,
-                        heading,
-                        now,
-                        icao,
-                        nident,
-                        now_date,
-                    ),
+                route_type = get_route_type(route_distance)
+                if route_type:
+                    flight_text = 'FLT ' + route_type
+                else:
+                    flight_text = 'Flight'
+                logger.debug(
+                    "Todays %-6s %7s (%s) %-2s [%3dnm %-5s] %7s %4s->%-4s%5snm %-6s %s site:%s",
+                    flight_text, ident, ptype, category, distance, flight_level, ident,
+                    from_airport, to_airport, route_distance, reg, icao, site,
+                    extra=logs.fields(icao, ident, ptype, site),
                 )
             else:
-                sql = """UPDATE plane_days SET ident = ?, squawk =?, speed = ?, altitude = ?, lowest_altitude = ?, distance = ?, closest = ?, heading = ?, lastseen = ?
-                    WHERE icao = ? AND day = ?"""
-                cur.execute(
-                    sql,
-                    (
-                        nident,
-                        nsquawk,
-                        speed,
-                        altitude,
-                        low_alt,
-                        distance,
-                        low_dist,
-                        heading,
-                        now,
-                        icao,
-                        now_date,
-                    ),
+                logger.debug(
+                    "Todays Plane  %7s (%s) %-2s [%3dnm %-5s] %7s %s %s %s site:%s",
+                    ident, ptype, category, distance, flight_level, ident, reg, owner, icao, site,
+                    extra=logs.fields(icao, ident, ptype, site),
                 )
-        except TypeError as e:
-            logger.critical(
-                f"Error updating plane: {icao} t:{ptype} id:{ident} alt:{altitude}: {e}"
-            )
-            pass
+    elif not call_sign:
+        size = 0
+        if re.search(r'A\d', category):
+            size = int(category[1])
+        prune_day_idents(now_date)
+        (day, nident) = day_idents.get(icao, (None, None))
+        if day == now_date and nident != ident and size >= 3:
+            if ident not in alerted:
+                alerted[ident] = 1
+                logger.info(
+                    "Day Ident mismatch (%s) %s %s  <-> %s", ptype, category, ident, nident,
+                    extra=logs.fields(icao, ident, ptype),
+                )
+    if not call_sign:
+        day_idents[icao] = (now_date, ident)
+
+
+def prune_day_idents(today):
+    "Drop previous days' idents when the date rolls over"
+    global day_idents_date
+
+    if today == day_idents_date:
+        return
+    for icao in [icao for (icao, (day, ident)) in day_idents.items() if day != today]:
+        del day_idents[icao]
+    day_idents_date = today
 
 
 def update_flight(
@@ -600,23 +576,28 @@ def update_flight(
 
 
     now = datetime.now()
-    today = date.today()
 
+    params = {
+        "flight": flight,
+        "icao": icao_key(icao),
+        "ptype": ptype,
+        "distance": distance,
+        "altitude": altitude,
+        "speed": speed,
+        "squawk": squawk,
+        "heading": heading,
+        "reg": reg,
+        "from_airport": from_airport,
+        "to_airport": to_airport,
+        "now": now,
+        "today": now.replace(hour=0, minute=0, second=0, microsecond=0),
+        "route_distance": route_distance,
+    }
     try:
         cur = conn.cursor()
-
-        # Check plane types first because of holddown
-        cur.execute("SELECT * FROM plane_types WHERE ptype=?", (ptype,))
-        count = cur.fetchall()
-
-        cur.execute("SELECT count(1) FROM flights WHERE flight=?", (flight,))
-        count = cur.fetchall()[0][0]
-        if count:
-            rows = dict_gen(
-                cur.execute("SELECT * FROM flights WHERE flight=?", (flight,))
-            )
-        else:
-            rows = None
+        new = upsert(cur, sql_upsert_flights, params, sql_new_flights)
+        if new:
+            stats.count("flights")
     except sqlite3.OperationalError as e:
         logger.warning(f"New Database: Trying to create DB: {e}")
 
@@ -636,115 +617,40 @@ def update_flight(
         return
 
     # print(f'ic:{icao}, ident:{ident}, sq:{squawk}, pt:{ptype}, dist:{distance}, alt:{altitude}, head:{heading}, spd:{speed}')
-    if not rows:
+    if new:
         dist_int = int(distance)
         route_type = get_route_type(route_distance)
         if route_type:
             flight_text = 'Flight ' + route_type
         else:
             flight_text = 'Flight'
+        events.publish(
+            "new_flight",
+            flight=flight,
+            icao=icao,
+            ptype=ptype,
+            reg=reg,
+            owner=owner,
+            category=category,
+            from_airport=from_airport,
+            to_airport=to_airport,
+            route_distance=route_distance,
+            distance=distance,
+            altitude=altitude,
+            alert=flight in alert_flights,
+        )
 
         if flight in alert_flights:
-            logger.warning(
-                f"ALERT FLT    {flight:>8} ({ptype}) {category:<2} [{dist_int:>3}nm {flight_level:<5}] {reg:<6} {icao} {owner}"
-            )
-            play_sound("/Users/yantisj/dev/ads-db/sounds/ding.mp3")
-            time.sleep(0.5)
-            play_sound("/Users/yantisj/dev/ads-db/sounds/ding.mp3")
+            message = f"ALERT FLT    {flight:>8} ({ptype}) {category:<2} [{dist_int:>3}nm {flight_level:<5}] {reg:<6} {icao} {owner}"
+            logger.warning(message, extra=logs.fields(icao, flight, ptype))
+            alerts.alert("flight", ("flight", flight), ["ding.mp3", 0.5, "ding.mp3"], message, icao=icao, flight=flight, ptype=ptype)
         else:
             logger.info(
-                f"New {flight_text:<9} {flight:>7} ({ptype}) {category:<2} [{dist_int:>3}nm {flight_level:<5}] {flight:>7} {from_airport:>4}->{to_airport:<4}{route_distance:>5}nm {reg:<6} {icao} {owner}"
+                "New %-9s %7s (%s) %-2s [%3snm %-5s] %7s %4s->%-4s%5snm %-6s %s %s",
+                flight_text, flight, ptype, category, dist_int, flight_level, flight,
+                from_airport, to_airport, route_distance, reg, icao, owner,
+                extra=logs.fields(icao, flight, ptype),
             )
-        sql = """INSERT INTO flights(flight,icao,ptype,distance,closest,altitude,lowest_altitude,speed,lowest_speed,squawk,heading,registration,from_airport,to_airport,firstseen,lastseen,route_distance)
-              VALUES(?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?) """
-        cur.execute(
-            sql,
-            (
-                flight,
-                icao,
-                ptype,
-                distance,
-                distance,
-                altitude,
-                altitude,
-                speed,
-                speed,
-                squawk,
-                heading,
-                reg,
-                from_airport,
-                to_airport,
-                now,
-                now,
-                route_distance
-            ),
-        )
-    else:
-        for row in rows:
-            try:
-                # print('updating icao', icao, flight)
-
-                low_dist = row["closest"]
-                if not low_dist and distance:
-                    low_dist = distance
-                elif distance and distance < low_dist:
-                    # print('New Low Distance', icao, distance)
-                    low_dist = distance
-                low_alt = row["lowest_altitude"]
-                if not low_alt and altitude:
-                    low_alt = altitude
-                elif altitude and altitude < low_alt:
-                    # print('New Low Altitude', icao, altitude)
-                    low_alt = altitude
-                low_speed = row["lowest_speed"]
-                if not low_speed and speed:
-                    low_speed = speed
-                elif speed and speed < low_speed:
-                    # print('New Low speed', icao, altitude)
-                    low_speed = speed
-                nsquawk = row["squawk"]
-                if squawk:
-                    nsquawk = squawk
-
-                if row["lastseen"].date() < today:
-                    # print('Lastseen date reset', row)
-                    low_dist = distance
-                    low_alt = altitude
-
-                sql = """UPDATE flights SET icao=?, ptype=?, distance=?, closest=?, altitude=?, lowest_altitude=?, speed=?, lowest_speed=?, squawk=?, heading=?, registration=?, from_airport=?, to_airport=?, lastseen=?, route_distance=?
-                    WHERE flight = ? """
-                cur.execute(
-                    sql,
-                    (
-                        icao,
-                        ptype,
-                        distance,
-                        low_dist,
-                        altitude,
-                        low_alt,
-                        speed,
-                        low_speed,
-                        nsquawk,
-                        heading,
-                        reg,
-                        from_airport,
-                        to_airport,
-                        now,
-                        route_distance,
-                        flight,
-                    ),
-                )
-                # if ptype in local_flights and (icao, today) not in alerted and altitude < local_altitude and distance < local_distance:
-                #     alerted[(icao, today)] = 1
-                #     logger.info(f"Local Alert: {icao} t:{ptype} d:{distance} alt:{altitude} id:{ident} site:{site}")
-                #     play_sound("/Users/yantisj/dev/ads-db/sounds/ding.mp3")
-                break
-
-            except TypeError as e:
-                logger.critical(
-                    f"Error updating plane: {icao} t:{ptype} id:{flight} alt:{altitude}: {e}"
-                )
-                pass
 
 
 def update_ptype(ptype, icao, mfr, model, lastseen=None):
@@ -827,14 +733,6 @@ def update_ptype(ptype, icao, mfr, model, lastseen=None):
     return new
 
 
-def get_day_count(icao):
-
-    cur = conn.cursor()
-    cur.execute("SELECT count(*) FROM plane_days WHERE icao = ?", (icao,))
-    (count,) = cur.fetchone()
-    return count
-
-
 def get_flight_level(altitude):
 
     if altitude >= 18000:
@@ -848,102 +746,70 @@ def lookup_ptype(
 ):
 
     cur = conn.cursor()
-    if owner:
-        cur.execute(
-            "SELECT * FROM planes WHERE ptype LIKE ? AND owner LIKE ? AND NOT status = 'D' ORDER BY lastseen DESC", (ptype,owner,)
-        )
-    else:
-        cur.execute(
-            "SELECT * FROM planes WHERE ptype LIKE ? AND NOT status = 'D' ORDER BY lastseen DESC", (ptype,)
-        )
+    (where, params) = planes_where(
+        ptype,
+        count=count,
+        cat_min=cat_min,
+        low_alt=low_alt,
+        no_a0=no_a0,
+        military=military,
+        hours=hours,
+        owner=owner,
+    )
+    rows = cur.execute(f"SELECT * FROM planes WHERE {where} ORDER BY lastseen DESC{display.page}", params)
+    total = print_planes(rows)
 
-    rows = cur.fetchall()
-    new_rows = list()
+    print("\nTotal:", total)
 
-    hours_ago = None
-    if hours:
-        hours_ago = datetime.now() - timedelta(hours=hours)
 
-    for row in rows:
-        add = True
-        if count and not row[17]:
-            continue
-        if count and row[17] and row[17] < count:
-            # print('too low', row, row[17])
-            continue
-        if hours_ago and row[12] < hours_ago:
-            continue
-        if cat_min:
-            if row[18]:
-                cat_re = re.search(r"A(\d)", row[18])
-                if cat_re:
-                    cat = int(cat_re.group(1))
-                    if cat and cat < cat_min:
-                        continue
-                    elif cat and cat > 5:
-                        continue
-                    elif not cat and no_a0:
-                        continue
-            else:
-                continue
-        if low_alt:
-            if not row[6]:
-                continue
-            if row[6] > low_alt:
-                continue
-        if military:
-            if row[16] != "M":
-                continue
-        if add:
-            new_rows.append(row)
-    total = print_planes(new_rows)
+def lookup_flight(flight, hours=0, low_alt=0, route_distance=0, airport=None):
 
-    print("\nTotal:", total)
+    cur = conn.cursor()
+    (where, params) = flights_where(flight, hours=hours, low_alt=low_alt, route_distance=route_distance, airport=airport)
+    rows = dict_gen(cur.execute(f"SELECT * FROM flights WHERE {where} ORDER BY lastseen DESC{display.page}", params))
+    total = print_flights(rows)
+    if total == 1 and not export.fmt:
+        lookup_plane_days("ident", flight, hours=hours)
 
 
-def lookup_flight(flight, hours=0, low_alt=0, route_distance=0, airport=None):
+def lookup_plane_days(column, value, hours=0):
+    "Print plane days by icao or ident with each plane's type and registration in one query"
 
     cur = conn.cursor()
-    rows = dict_gen(
-        cur.execute(
-            "SELECT * FROM flights WHERE flight LIKE ? ORDER BY lastseen DESC",
-            (flight,),
-        )
+    where = f"plane_days.{column} = :value"
+    params = {"value": value}
+    if hours:
+        where += " AND plane_days.lastseen >= :hours_ago"
+        params["hours_ago"] = datetime.now() - timedelta(hours=hours)
+
+    cur.execute(
+        f"""SELECT plane_days.*, COALESCE(p.ptype, '') AS ptype, COALESCE(p.registration, '') AS registration
+            FROM {archive.plane_days_table()} LEFT JOIN planes p ON p.icao = plane_days.icao
+            WHERE {where} ORDER BY plane_days.lastseen DESC""",
+        params,
     )
-    total = print_flights(rows, hours=hours, low_alt=low_alt, route_distance=route_distance, airport=airport)
-    if total == 1:
-        cur.execute(
-            "SELECT * FROM plane_days WHERE ident = ? ORDER BY lastseen DESC", (flight,)
-        )
-        rows = cur.fetchall()
-        print_plane_days(rows, hours=hours)
+    return print_plane_days(cur)
 
 
 def lookup_icao(icao):
 
     cur = conn.cursor()
-    cur.execute("SELECT * FROM planes WHERE icao = ?", (icao,))
+    cur.execute("SELECT * FROM planes WHERE icao = ?", (icao_key(icao),))
     rows = cur.fetchall()
     total = print_planes(rows)
-    if total == 1:
-        cur.execute(
-            "SELECT * FROM plane_days WHERE icao = ? ORDER BY lastseen DESC", (icao,)
-        )
-        rows = cur.fetchall()
-        print_plane_days(rows)
+    if total == 1 and not export.fmt:
+        lookup_plane_days("icao", icao_key(icao))
 
 
 def lookup_ident(ident):
 
     cur = conn.cursor()
-    cur.execute("SELECT * FROM planes WHERE ident LIKE ? ORDER by lastseen DESC", (ident,))
-    rows = cur.fetchall()
-    total = print_planes(rows)
-    if total == 1:
-        row = rows[0]
-        cur.execute("SELECT * FROM plane_days WHERE icao = ? ORDER by lastseen DESC", (row[0],))
-        rows = cur.fetchall()
-        print_plane_days(rows)
+    (where, params) = search.match_sql("ident", ident)
+    cur.execute(f"SELECT * FROM planes WHERE {where} ORDER by lastseen DESC{display.page}", params)
+    rows = cur.fetchmany(2)
+    total = print_planes(chain(rows, cur))
+    if total == 1 and not export.fmt:
+        lookup_plane_days("icao", icao_key(rows[0][0]))
     else:
         print("\nTotal:", total)
 
@@ -951,81 +817,16 @@ def lookup_ident(ident):
 def lookup_reg(reg):
 
     cur = conn.cursor()
-    cur.execute("SELECT * FROM planes WHERE registration LIKE ? ORDER BY lastseen DESC", (reg,))
-    rows = cur.fetchall()
-    total = print_planes(rows)
-    if total == 1:
-        row = rows[0]
-        cur.execute(
-            "SELECT * FROM plane_days WHERE icao = ? ORDER BY lastseen DESC", (row[0],)
-        )
-        rows = cur.fetchall()
-        print_plane_days(rows)
+    (where, params) = search.match_sql("registration", reg)
+    cur.execute(f"SELECT * FROM planes WHERE {where} ORDER BY lastseen DESC{display.page}", params)
+    rows = cur.fetchmany(2)
+    total = print_planes(chain(rows, cur))
+    if total == 1 and not export.fmt:
+        lookup_plane_days("icao", icao_key(rows[0][0]))
     else:
         print("\nTotal:", total)
 
 
-def lookup_model_mfr(icao):
-
-    cur = lookup.cursor()
-    # cur.execute("SELECT * FROM Aircraft LEFT JOIN Model ON Aircraft.ModelID = Model.ModelID LEFT JOIN Operator ON Aircraft.OperatorID = Operator.OperatorID WHERE Aircraft.Icao = ?", (icao,))
-    # cur.execute("select Icao,Engines,Model,Manufacturer from AircraftTypeView WHERE Icao = ? LIMIT 1;", (ptype,))
-    cur.execute(
-        "SELECT ModeS,OperatorFlagCode,CurrentRegDate,ModeSCountry,Country,AircraftClass,Engines,PopularName,Manufacturer,Type,RegisteredOwners,Registration,ICAOTypeCode,Status,OperatorFlagCode,SerialNo FROM Aircraft WHERE ModeS = ?",
-        (icao,),
-    )
-    rows = cur.fetchall()
-    # mfr = None
-    # pname = None
-    # country = None
-    # owner = None
-    # ptype = None
-    # military = None
-    # reg = None
-
-    ptype = ""
-    reg = ""
-    country = ""
-    model = ""
-    mfr = ""
-    owner = ""
-    military = "."
-    status = ""
-    opcode = ""
-    serial = ""
-
-    for r in rows:
-        # print(r)
-        mfr = r[8]
-        if mfr:
-            mfr = mfr.title()
-        model = r[9]
-        reg = r[11]
-        country = r[3]
-        if r[10]:
-            owner = r[10].rstrip()
-            if re.search(r"United States Air Force", owner):
-                military = "M"
-            elif re.search(r"United States Marine", owner):
-                military = "M"
-            elif re.search(r"United States Navy", owner):
-                military = "M"
-            elif re.search(r"United States Army", owner):
-                military = "M"
-
-        ptype = r[12]
-        status = r[13]
-        opcode = r[14]
-        serial = r[15]
-
-        model = model[:50]
-
-        if re.search(r"United\sStates", country):
-            country = "USA"
-
-    return (ptype, mfr, model, country, owner, military, reg, status, opcode, serial)
-
-
 def alert_landing(
     icao,
     ident,
@@ -1054,7 +855,7 @@ def alert_landing(
     parent_cat = get_category(ptype)
     if category and parent_cat and parent_cat != category and (icao, 'catmiss') not in alerted:
         alerted[(icao, 'catmiss')] = 1
-        logger.debug(f"Category Mistmatch    ({ptype}) {parent_cat} (vs {category}) {icao}")
+        logger.debug("Category Mistmatch    (%s) %s (vs %s) %s", ptype, parent_cat, category, icao)
     if parent_cat:
         category = parent_cat
 
@@ -1086,20 +887,40 @@ def alert_landing(
                     dist_int = int(distance)
                     (from_airport, to_airport, route_distance) = get_flight_data(ident, distance=distance, altitude=altitude, vs=baro_rate)
 
+                    events.publish(
+                        "landing",
+                        icao=icao,
+                        ident=ident,
+                        ptype=ptype,
+                        reg=reg,
+                        category=category,
+                        from_airport=from_airport,
+                        to_airport=to_airport,
+                        route_distance=route_distance,
+                        distance=distance,
+                        altitude=altitude,
+                        speed=speed,
+                        baro_rate=baro_rate,
+                        heading=heading,
+                        lat=lat,
+                        lon=lon,
+                        alert=size >= alert_size or bool(re.search(r'^BOE', ident)),
+                    )
+
                     # Only alert on larger sizes or tracked types, otherwise log landing
                     if size >= alert_size or re.search(r'^BOE', ident):
-                        logger.warning(
-                            f"Landing Alert {reg:>7} ({ptype:<4}) {category:<2} [{dist_int:>3}nm {flight_level:<5}] {ident:>7} {from_airport:>4}->{to_airport:<4}{route_distance:>5}nm lat:{lat} lon:{lon}"
-                        )
-                        if sounds and check_quiet_time():
-                            play_sound("/Users/yantisj/dev/ads-db/sounds/ding-low.mp3")
-                            if size == 5 or ptype in local_types or re.search(r'^BOE', ident):
-                                play_sound(
-                                    "/Users/yantisj/dev/ads-db/sounds/ding-low-fast.mp3"
-                                )
+                        message = f"Landing Alert {reg:>7} ({ptype:<4}) {category:<2} [{dist_int:>3}nm {flight_level:<5}] {ident:>7} {from_airport:>4}->{to_airport:<4}{route_distance:>5}nm lat:{lat} lon:{lon}"
+                        logger.warning(message, extra=logs.fields(icao, ident, ptype))
+                        play = ["ding-low.mp3"]
+                        if size == 5 or ptype in local_types or re.search(r'^BOE', ident):
+                            play.append("ding-low-fast.mp3")
+                        alerts.alert("landing", ("landing", icao, ident), play, message, icao=icao, ident=ident, ptype=ptype)
                     # Log details on all landing aircraft
                     logger.info(
-                        f"Plane Landing {ident:>7} ({ptype:<4}) {category:<2} [{dist_int:>3}nm {flight_level:<5}] {ident:>7} {from_airport:>4}->{to_airport:<4}{route_distance:>5}nm {reg:<6} {icao} s:{speed} vs:{baro_rate} h:{heading} lat:{lat} lon:{lon}"
+                        "Plane Landing %7s (%-4s) %-2s [%3snm %-5s] %7s %4s->%-4s%5snm %-6s %s s:%s vs:%s h:%s lat:%s lon:%s",
+                        ident, ptype, category, dist_int, flight_level, ident, from_airport, to_airport, route_distance,
+                        reg, icao, speed, baro_rate, heading, lat, lon,
+                        extra=logs.fields(icao, ident, ptype),
                     )
 
         except TypeError as e:
@@ -1125,12 +946,13 @@ def alert_b787(icao, ident, reg, squawk, ptype, distance, altitude, heading, spe
                 today = date.today()
                 if (icao, ident, today) not in ptype_alerted:
                     ptype_alerted[(icao, ident, today)] = 1
-                    logger.warning(
-                        f"!!!Boeing 787 Airborne!!!  ic:{icao}, ident:{ident}, reg:{reg}, sq:{squawk}, pt:{ptype}, dist:{distance}, alt:{altitude}, head:{heading}, spd:{speed}"
+                    events.publish(
+                        "boeing_787", icao=icao, ident=ident, ptype=ptype, reg=reg, squawk=squawk,
+                        distance=distance, altitude=altitude, heading=heading, speed=speed,
                     )
-                    # print(f'ic:{icao}, ident:{ident}, sq:{squawk}, pt:{ptype}, dist:{distance}, alt:{altitude}, head:{heading}, spd:{speed}')
-                    if sounds and check_quiet_time():
-                        play_sound("/Users/yantisj/dev/ads-db/sounds/warnone.mp3")
+                    message = f"!!!Boeing 787 Airborne!!!  ic:{icao}, ident:{ident}, reg:{reg}, sq:{squawk}, pt:{ptype}, dist:{distance}, alt:{altitude}, head:{heading}, spd:{speed}"
+                    logger.warning(message, extra=logs.fields(icao, ident, ptype))
+                    alerts.alert("boeing_787", ("boeing_787", icao, ident), ["warnone.mp3"], message, icao=icao, ident=ident, ptype=ptype)
         except TypeError as e:
             logger.critical(
                 f"Error updating plane: {icao} t:{ptype} id:{ident} alt:{altitude}: {e}"
@@ -1139,7 +961,7 @@ def alert_b787(icao, ident, reg, squawk, ptype, distance, altitude, heading, spe
 
 
 def alert_ident(ident, sites=["127.0.0.1"], min_distance=0):
-    "Play alert on ident when called from CLI"
+    "Play alert on ident when called from CLI (from the daemon's live feed, or polling the receivers)"
 
     global sounds
 
@@ -1147,95 +969,116 @@ def alert_ident(ident, sites=["127.0.0.1"], min_distance=0):
 
     tracking = ident.split(",")
 
+    def check_aircraft(aircraft):
+        for a in aircraft:
+            for ident in [a["flight"], a["icao"]]:
+                if ident in tracking and (not min_distance or a["distance"] < min_distance):
+                    logger.warning(f"Located Plane!!: {ident} from {a['site']}")
+                    lookup_icao(a["icao"])
+                    play_sound("/Users/yantisj/dev/ads-db/sounds/ding.mp3")
+                    time.sleep(3)
+                    play_sound("/Users/yantisj/dev/ads-db/sounds/ding.mp3")
+                    tracking.remove(ident)
+
+    try:
+        for aircraft in live.subscribe():
+            check_aircraft(aircraft)
+            if not tracking:
+                return
+    except requests.exceptions.RequestException as e:
+        logger.info(f"Daemon live feed not available, polling receivers: {e}")
+
+    # One request per receiver per cycle
     while tracking:
+        aircraft = list()
         for site in sites:
-            for ident in tracking:
-                r = requests.get(
-                    f"http://{site}/skyaware/data/aircraft.json", timeout=5
-                )
-                planes = r.json()
-
-                for p in planes["aircraft"]:
-                    flight = ""
-                    icao = ""
-                    distance = 100.0
-                    if "flight" in p:
-                        flight = p["flight"].rstrip()
-                    if "hex" in p:
-                        icao = p["hex"].upper().replace("~", "")
-                    if "lat" in p:
-                        distance = mpu.haversine_distance(
-                            (p["lat"], p["lon"]),
-                            (
-                                float(config["global"]["lat"]),
-                                float(config["global"]["lon"]),
-                            ),
-                        )
-                        distance = round(distance * 0.621371, 1)
-                    if flight == ident or icao == ident:
-                        if not min_distance or distance < min_distance:
-                            logger.warning(f"Located Plane!!: {ident} from {site}")
-                            lookup_icao(icao)
-                            play_sound("/Users/yantisj/dev/ads-db/sounds/ding.mp3")
-                            time.sleep(3)
-                            play_sound("/Users/yantisj/dev/ads-db/sounds/ding.mp3")
-                            tracking.remove(ident)
+            r = requests.get(
+                f"http://{site}/skyaware/data/aircraft.json", timeout=5
+            )
+            planes = r.json()
+
+            for p in planes["aircraft"]:
+                flight = ""
+                icao = ""
+                distance = 100.0
+                if "flight" in p:
+                    flight = p["flight"].rstrip()
+                if "hex" in p:
+                    icao = p["hex"].upper().replace("~", "")
+                if "lat" in p:
+                    distance = mpu.haversine_distance(
+                        (p["lat"], p["lon"]),
+                        (
+                            float(config["global"]["lat"]),
+                            float(config["global"]["lon"]),
+                        ),
+                    )
+                    distance = round(distance * 0.621371, 1)
+                aircraft.append({"icao": icao, "flight": flight, "distance": distance, "site": site})
 
+        check_aircraft(aircraft)
         time.sleep(3)
 
 
-def mark_dups():
-    "Check for duplicate serials and registration counts"
+def mark_dups(incremental=False):
+    "Check for duplicate serials and registration counts (incremental: only planes seen since the last run)"
 
     cur = conn.cursor()
+    cur.execute("CREATE INDEX IF NOT EXISTS ptype_serial_idx ON planes(ptype, serial);")
+    start = datetime.now()
+    since = retention.get_checkpoint("mark_dups")
+    year_ago = datetime.now() - timedelta(days=365)
+
+    # Only (ptype, serial) groups with a plane seen since the last run
+    planes = "planes p"
+    params = dict(year_ago=year_ago)
+    if incremental and since is not None:
+        logger.info(f"Checking duplicate serials seen since {since}")
+        planes = """planes p JOIN (SELECT DISTINCT ptype, serial FROM planes WHERE serial != '' AND lastseen >= :since) k
+            ON p.ptype IS k.ptype AND p.serial = k.serial"""
+        params["since"] = since
+
+    # Every older plane compared to the latest plane with the same type and serial
     rows = dict_gen(
-        cur.execute(
-            'SELECT * FROM planes ORDER BY lastseen DESC'
-        )
+        cur.execute(dup_serials_sql(planes), params)
     )
 
-    planes = dict()
     count = 0
     reg_count = 0
-    noserial = 0
-    year_ago = datetime.now() - timedelta(days=365)
-
+    deregister = list()
     for r in rows:
-        if not r['serial']:
-            noserial += 1
-            continue
-        elif (r['ptype'], r['serial']) not in planes:
-            planes[(r['ptype'], r['serial'])] = r
-        else:
-            count += 1
-            n = planes[(r['ptype'], r['serial'])]
-
-            if r['registration'] != n['registration']:
-                reg_count += 1
-
-            # print('OLD REG!', r)
-            n = planes[(r['ptype'], r['serial'])]
-            
-            # print('LATEST!', planes[(r['ptype'], r['serial'])])
-            if r['lastseen'] < n['firstseen'] or r['lastseen'] < year_ago:
-                if r['status'] != 'D':
-                    logger.info(f"Deactivate Registration ({r['ptype']}): nr:{n['registration']} ns:{n['serial']} nl:{n['lastseen']} VS or:{r['registration']} os:{r['serial']} ol:{r['lastseen']}")
-                    degregister_plane(r, n)
-                else:
-                    print(f"Registration Dup Deactive ({r['ptype']}): nr:{n['registration']} ni:{n['icao']} ns:{n['serial']} nl:{n['lastseen']} VS or:{r['registration']} ni:{n['icao']} os:{r['serial']} ol:{r['lastseen']}")
+        count += 1
+        if r['registration'] != r['n_registration']:
+            reg_count += 1
+
+        if r['aged']:
+            if r['status'] != 'D':
+                logger.info(f"Deactivate Registration ({r['ptype']}): nr:{r['n_registration']} ns:{r['serial']} nl:{r['n_lastseen']} VS or:{r['registration']} os:{r['serial']} ol:{r['lastseen']}")
+                deregister.append(r['icao'])
             else:
-                print(f"ICAO Toggling ({r['ptype']}): nr:{n['registration']} ni:{n['icao']} ns:{n['serial']} nl:{n['lastseen']} VS or:{r['registration']} ni:{n['icao']} os:{r['serial']} ol:{r['lastseen']}")
+                print(f"Registration Dup Deactive ({r['ptype']}): nr:{r['n_registration']} ni:{r['n_icao']} ns:{r['serial']} nl:{r['n_lastseen']} VS or:{r['registration']} ni:{r['n_icao']} os:{r['serial']} ol:{r['lastseen']}")
+        else:
+            print(f"ICAO Toggling ({r['ptype']}): nr:{r['n_registration']} ni:{r['n_icao']} ns:{r['serial']} nl:{r['n_lastseen']} VS or:{r['registration']} ni:{r['n_icao']} os:{r['serial']} ol:{r['lastseen']}")
 
-    print('Total Duplicate Serials:', count, 'Reg Mismatch:', reg_count, 'No serial:', noserial)
+    degregister_planes(deregister)
+    (noserial,) = cur.execute("SELECT COUNT(*) FROM planes WHERE serial IS NULL OR serial = ''").fetchone()
+    print('Total Duplicate Serials:', count, 'Reg Mismatch:', reg_count, 'No serial:', noserial, 'Deregistered:', len(deregister))
+    retention.set_checkpoint("mark_dups", start)
     conn.commit()
 
 
 def degregister_plane(old, new):
     "Deregister plane/icao"
 
+    degregister_planes([old['icao']])
+
+
+def degregister_planes(icaos):
+    "Deregister a batch of planes/icaos"
+
     cur = conn.cursor()
-    cur.execute(
-            'UPDATE planes SET status = "D" WHERE icao = ?', (old['icao'],)
+    cur.executemany(
+            'UPDATE planes SET status = "D" WHERE icao = ?', [(icao_key(icao),) for icao in icaos]
         )
 
 
@@ -1255,11 +1098,18 @@ def get_flight_data(flight, distance=0, altitude=0, vs=0, force=False):
         return local_flights[flight]
 
     # Check local flight DB cache populated via API
-    (from_airport, to_airport, route_distance) = flight_cache_check(flight)
+    if flight in shard_routes:
+        (from_airport, to_airport, route_distance) = shard_routes[flight][0]
+    else:
+        (from_airport, to_airport, route_distance) = flight_cache_check(flight)
     if from_airport and to_airport:
         local_flights[flight] = (from_airport, to_airport, route_distance)
         return (from_airport, to_airport, route_distance)
 
+    # Route lookups are skipped when cycles are over budget (stored routes are kept)
+    if not scheduler.enabled("routes"):
+        return (from_airport, to_airport, route_distance)
+
     # Local Airport DST/SRC detection via altitude and distance
     if "local_airport" in config["flights"]:
         LOCAL_AIRPORT = config["flights"]["local_airport"]
@@ -1271,7 +1121,10 @@ def get_flight_data(flight, distance=0, altitude=0, vs=0, force=False):
     if not flight_conn and not LOCAL_AIRPORT and 'flightaware_api' not in config['db'] :
         return (from_airport, to_airport, route_distance)
 
-    if flight_conn:
+    if flight in shard_routes:
+        if shard_routes[flight][1]:
+            (from_airport, to_airport) = shard_routes[flight][1]
+    elif flight_conn:
         cur = flight_conn.cursor()
         rows = dict_gen(
             cur.execute("SELECT * FROM RouteView WHERE Callsign = ?", (flight,))
@@ -1303,13 +1156,13 @@ def get_flight_data(flight, distance=0, altitude=0, vs=0, force=False):
                 local_flights[flight] = (from_airport, to_airport, route_distance)
                 local_fixed += 1
                 broken = round(local_fixed / (local_correct + local_fixed)*100)
-                logger.debug(f"Local Flight Fix {flight} ({broken}%): {from_airport} <-> {to_airport} {vs}")
+                logger.debug("Local Flight Fix %s (%s%%): %s <-> %s %s", flight, broken, from_airport, to_airport, vs)
 
             elif vs_range:
                 local_flights[flight] = (from_airport, to_airport, route_distance)
                 local_correct += 1
                 broken = round(local_fixed / (local_correct + local_fixed)*100)
-                logger.debug(f"Local Flight OK {flight} ({broken}%): {from_airport} <-> {to_airport}")
+                logger.debug("Local Flight OK %s (%s%%): %s <-> %s", flight, broken, from_airport, to_airport)
 
     if 'flightaware_api' in config['db'] and force:
         (from_airport, to_airport, route_distance) = flight_api_lookup(flight, from_airport, to_airport)
@@ -1415,22 +1268,43 @@ def get_category(ptype):
     return category  
 
 
-def update_missing_data():
-    "Refresh all data from databases on missing info"
+def update_missing_data(batch=1000, changed=False):
+    "Refresh plane data from BaseStation, updating only planes whose data changed (or only changed since the last snapshot)"
 
     cur = conn.cursor()
-    cur2 = conn.cursor()
     now = datetime.now()
-    rows = dict_gen(cur.execute("SELECT * FROM planes ORDER BY lastseen ASC"))
-    # rows = cur.fetchall()
     count = 0
-    models = dict()
-    ptyped = dict()
-    ptype_count = defaultdict(int)
 
-    for row in rows:
+    # Only rows where a field used below differs from BaseStation
+    aircraft = ",".join(f"a.{c}" for c in AIRCRAFT_COLUMNS)
+    snapshot_filter = ""
+    if changed:
+        snapshot_filter = "a.ModeS IN (SELECT modes FROM temp.snapshot_changes) AND"
+    sql = f"""SELECT p.icao, p.ptype, p.owner, p.registration, p.status, p.opcode, p.model, p.serial, p.lastseen, {aircraft}
+        FROM planes p JOIN bs.Aircraft a ON a.ModeS = {compact.icao_sql('p.icao')}
+        WHERE {snapshot_filter} ((RTRIM(a.RegisteredOwners) != '' AND RTRIM(a.RegisteredOwners) IS NOT p.owner)
+            OR (a.ICAOTypeCode != '' AND a.ICAOTypeCode IS NOT p.ptype)
+            OR (a.Registration != '' AND a.Registration != 'None' AND a.Registration IS NOT p.registration)
+            OR (a.Status != '' AND a.Status IS NOT p.status)
+            OR (a.OperatorFlagCode != '' AND a.OperatorFlagCode IS NOT p.opcode)
+            OR (a.Type != '' AND substr(a.Type, 1, 50) IS NOT p.model)
+            OR (a.SerialNo != '' AND a.SerialNo IS NOT p.serial))
+        ORDER BY p.lastseen ASC"""
+
+    conn.commit()
+    cur.execute("ATTACH DATABASE ? AS bs", (config["db"]["base_station"],))
+    if changed:
+        changes = snapshot.stage()
+    rows = cur.execute(sql).fetchall()
+    logger.info(f"Checking {len(rows)} changed planes")
+
+    ptypes = {row[0] for row in cur.execute("SELECT ptype FROM plane_types")}
+    new_types = list()
+    updates = list()
+
+    for r in rows:
         update = False
-        # print(row)
+        row = dict(zip(["icao", "ptype", "owner", "registration", "status", "opcode", "model", "serial", "lastseen"], r[:9]))
         icao = row["icao"]
         (
             ptype,
@@ -1443,12 +1317,7 @@ def update_missing_data():
             status,
             opcode,
             serial
-        ) = lookup_model_mfr(icao)
-        if model:
-            models[ptype] = model
-        ptype_count[ptype] += 1
-        if ptype and ptype not in ptyped:
-            ptyped[ptype] = (mfr, model)
+        ) = aircraft_fields(r[9:])
         if owner and owner != row["owner"]:
             logger.info(f"Owner needs updating: {icao} {owner}")
             update = True
@@ -1485,125 +1354,302 @@ def update_missing_data():
             logger.info(f"Serial Update {icao} {serial}")
             update = True
         if update:
-            if ptype:
-                cur2.execute("SELECT * FROM plane_types WHERE ptype=?", (ptype,))
-                ptypes = cur2.fetchall()
-                new = False
-                if not ptypes:
-                    new = True
-                    logger.warning(
-                        f"!!    New Hull Type    !!: t:{ptype} m:{model} {icao} "
-                    )
-                    sql = """INSERT INTO plane_types(ptype,last_icao,firstseen,lastseen,count,manufacturer,model)
-                        VALUES(?,?,?,?,?,?,?) """
-                    cur2.execute(sql, (ptype, icao, now, now, 1, mfr, model))
+            if ptype and ptype not in ptypes:
+                ptypes.add(ptype)
+                logger.warning(
+                    f"!!    New Hull Type    !!: t:{ptype} m:{model} {icao} "
+                )
+                new_types.append((ptype, icao, now, now, 1, mfr, model))
 
             count += 1
-            sql = """UPDATE planes SET ptype = ?, registration = ?, country = ?, owner = ?, military = ?, status = ?, opcode = ?, model = ?, serial = ?
-                WHERE icao = ? """
-            cur2.execute(sql, (ptype, reg, country, owner, military, status, opcode, model, serial, icao))
+            updates.append((ptype, reg, country, owner, military, status, opcode, model, serial, icao_key(icao)))
+            if len(updates) >= batch:
+                update_planes_data(updates)
+                updates = list()
+
+    update_planes_data(updates)
+    cur.executemany(
+        """INSERT INTO plane_types(ptype,last_icao,firstseen,lastseen,count,manufacturer,model)
+        VALUES(?,?,?,?,?,?,?) """,
+        new_types,
+    )
 
-    cur4 = conn.cursor()
-    # Update missing fields and remove bad plane type objects
-    rows = dict_gen(cur.execute("SELECT * from plane_types"))
-    for row in rows:
-        if row["ptype"] not in ptyped:
-            print("Missing ptype", row["ptype"])
-            # cur4.execute("DELETE FROM plane_types WHERE ptype = ?", (row["ptype"],))
-        # elif not row["active"]:
-        #     count += 1
-        #     update_ptype(row["ptype"], row["last_icao"], row["manufacturer"], row["model"], lastseen=row["lastseen"])
-        # elif row["model"] != models[ptype]:
-        #     count += 1
-        else:
-            update_ptype(row["ptype"], row["last_icao"], row["manufacturer"], row["model"], lastseen=row["lastseen"])
-            count += 1
+    # Plane types no longer matching any plane in BaseStation
+    missing = set()
+    rows = cur.execute(
+        f"""SELECT pt.ptype FROM plane_types pt WHERE NOT EXISTS (
+            SELECT 1 FROM planes p JOIN bs.Aircraft a ON a.ModeS = {compact.icao_sql('p.icao')}
+            WHERE p.ptype = pt.ptype AND a.ICAOTypeCode = pt.ptype)"""
+    ).fetchall()
+    for (ptype,) in rows:
+        print("Missing ptype", ptype)
+        missing.add(ptype)
+
+    count += refresh_ptypes(skip=missing)
     if count:
         logger.warning(f"Total Updates: {count}")
-        conn.commit()
     else:
         logger.info("No updates required")
+    if changed:
+        snapshot.save()
+    conn.commit()
+    cur.execute("DETACH DATABASE bs")
+    if changed:
+        snapshot.print_summary(changes)
 
 
-def cleanup_db(days=365):
-    "Make entries weekly after so many days: (use indexes)"
+def update_planes_data(updates):
+    "Apply a batch of registration data updates"
+
+    sql = """UPDATE planes SET ptype = ?, registration = ?, country = ?, owner = ?, military = ?, status = ?, opcode = ?, model = ?, serial = ?
+        WHERE icao = ? """
+    conn.cursor().executemany(sql, updates)
+
+
+def refresh_ptypes(skip=()):
+    "Recompute plane type counts, top category, active percent and top model from planes"
 
     cur = conn.cursor()
+    stats = dict()
+    for (ptype, pcount, active) in cur.execute(
+        "SELECT ptype, COUNT(*), SUM(status IN ('A', 'R', '')) FROM planes WHERE NOT status = 'D' GROUP BY ptype"
+    ).fetchall():
+        stats[ptype] = (pcount, active)
+
+    # Most common category and model per type (ascending, last wins)
+    categories = dict()
+    for (ptype, category, cnt) in cur.execute(
+        "SELECT ptype, category, COUNT(*) AS cnt FROM planes WHERE NOT status = 'D' AND category != '' GROUP BY ptype, category ORDER BY cnt ASC"
+    ).fetchall():
+        categories[ptype] = category
+    models = dict()
+    for (ptype, model, cnt) in cur.execute(
+        "SELECT ptype, model, COUNT(*) AS cnt FROM planes WHERE NOT status = 'D' AND model != '' GROUP BY ptype, model ORDER BY cnt ASC"
+    ).fetchall():
+        models[ptype] = model
+
+    full = list()
+    partial = list()
+    for (ptype, mfr, model) in cur.execute("SELECT ptype, manufacturer, model FROM plane_types").fetchall():
+        if ptype in skip:
+            continue
+        (pcount, active) = stats.get(ptype, (0, 0))
+        inactive = pcount - active
+        perc_active = 100
+        if active and inactive:
+            # Round down to 99% if any inactive
+            perc_active = min(round(active / pcount * 100), 99)
 
-    now = datetime.now()
-    time_ago = datetime.now() - timedelta(days=days)
-    rows = dict_gen(cur.execute("SELECT * FROM planes"))
-    total = 0
-    total_lastsave = 0
+        top_cat = categories.get(ptype, "A0")
+        if ptype in STATIC_CATEGORIES:
+            top_cat = STATIC_CATEGORIES[ptype]
+        top_model = models.get(ptype, model)
 
-    for row in rows:
-        count = 0
-        update = False
-        cur2 = conn.cursor()
-        cur_week = 0
-        first_day = None
-        extra_days = list()
-        lastseen = None
-        lowest_altitude = 0
-
-        cur2.execute("SELECT COUNT(*) from plane_days WHERE icao = ?", (row["icao"],))
-        day_count = cur2.fetchone()[0]
-
-        if int(day_count) > 100:
-            print("Squash", row["icao"], day_count)
-            days = dict_gen(
-                cur2.execute(
-                    "SELECT * FROM plane_days WHERE icao = ? ORDER BY day ASC",
-                    (row["icao"],),
-                )
-            )
-            for d in days:
-                if d["day"] < time_ago.date():
-                    if cur_week != d["day"].isocalendar()[1]:
-                        if extra_days:
-                            squash_plane_days(
-                                first_day, lastseen, lowest_altitude, extra_days
-                            )
-                            total += 1
-                        first_day = d
-                        lowest_altitude = d["lowest_altitude"]
-                        extra_days = list()
-                        lastseen = d["lastseen"]
-                        cur_week = d["day"].isocalendar()[1]
-                    else:
-                        extra_days.append(d)
-                        lastseen = d["lastseen"]
-                        if (
-                            d["lowest_altitude"]
-                            and d["lowest_altitude"] < lowest_altitude
-                            and d["lowest_altitude"] > 0
-                        ):
-                            lowest_altitude = d["lowest_altitude"]
-
-                        # if d['day'].isoweekday() != 5 and d['day'].isoweekday() != 6:
-                        #     print('DELETE', d, d['day'].isoweekday())
-                        #     total += 1
-        if total - total_lastsave > 10000:
-            print("Saving DB:", total)
-            total_lastsave = total
-            conn.commit()
+        # Full data update, partial data doesn't update type
+        if model and mfr:
+            full.append((pcount, top_model, top_cat, perc_active, ptype))
+        else:
+            partial.append((pcount, ptype))
 
-    conn.commit()
-    print("TOTAL DELETE", total)
+    cur.executemany(
+        "UPDATE plane_types SET count = ?, model = ?, category = ?, active = ? WHERE ptype = ?", full
+    )
+    cur.executemany("UPDATE plane_types SET count = ? WHERE ptype = ?", partial)
 
+    return len(full) + len(partial)
 
-def squash_plane_days(entry, lastseen, lowest_altitude, delete):
-    "Squash plane day entries into single entry with lastseen (day to week)"
 
-    cur = conn.cursor()
-    # print('Squash ', len(delete), ' plane_day entries:', entry['icao'], lowest_altitude, entry['firstseen'], ' - ', lastseen)
+def cleanup_db(days=365):
+    "Squash plane days older than days into weekly entries (resumes after interruption)"
+
+    cutoff = date.today() - timedelta(days=days)
+    retention.squash_plane_days(cutoff, period="week")
+
+
+def update_aircraft(a):
+    "Store, publish and alert on one enriched aircraft (shards.enrich)"
+
+    (icao, site, flight, squawk, category, baro_rate, lat, lon, distance, heading, altitude, speed) = itemgetter(
+        "icao", "site", "flight", "squawk", "category", "baro_rate", "lat", "lon", "distance", "heading", "altitude", "speed"
+    )(a)
+    (ptype, mfr, model, country, owner, military, reg, status, opcode, serial) = itemgetter(
+        "ptype", "mfr", "model", "country", "owner", "military", "reg", "status", "opcode", "serial"
+    )(a)
+    if a["routes"]:
+        shard_routes[flight] = a["routes"]
+
+    flight_level = get_flight_level(altitude)
+    dist_int = int(distance)
+
+    live.update(
+        icao,
+        site,
+        flight=flight,
+        ptype=ptype,
+        reg=reg,
+        model=model,
+        mfr=mfr,
+        owner=owner,
+        country=country,
+        military=military,
+        category=category,
+        squawk=squawk,
+        lat=lat,
+        lon=lon,
+        altitude=altitude,
+        baro_rate=baro_rate,
+        heading=heading,
+        speed=speed,
+        distance=distance,
+    )
 
-    sql = "UPDATE plane_days SET lastseen = ?, lowest_altitude = ? WHERE icao = ? AND day = ?"
-    cur.execute(sql, (lastseen, lowest_altitude, entry["icao"], entry["day"]))
+    # Reactivate airframes that were marked parked/retired and cache
+    if not status:
+        status = 'A'
+    elif status != 'A':
+        if (icao) not in reactivated:
+            if not flight and holddown[(icao, 'reactivate')] < 5:
+                holddown[(icao, 'reactivate')] += 1
+            else:
+                reactivated[icao] = 1
+                model_str = model[:6]
+                message = f"Reactivate ({status}) {model_str:>6} ({ptype:>4}) {category:<2} [{dist_int:>3}nm {flight_level:<5}] {flight:>7} {reg} {country} {owner} {mfr} {icao} site:{site}"
+                logger.warning(message, extra=logs.fields(icao, flight, ptype, site))
+                events.publish(
+                    "reactivate", icao=icao, ident=flight, ptype=ptype, reg=reg, owner=owner,
+                    status=status, category=category, distance=distance, altitude=altitude, site=site,
+                )
+                alerts.alert("reactivate", ("reactivate", icao), ["ding.mp3"], message, icao=icao, ptype=ptype, reg=reg)
+        status = 'R'
+
+    # print(f'{icao} {reg} {ptype} {flight} {category} {squawk} {lat} {lon} {altitude} {heading} {distance} {speed}')
+
+    # Play sounds on emergency bit set
+    if a["emergency"]:
+        if a["emergency"] and a["emergency"] != "none":
+            if (icao, 'emerg') not in alerted:
+                alerted[(icao, 'emerg')] = 1
+                events.publish(
+                    "emergency", icao=icao, ident=flight, ptype=ptype, reg=reg, emergency=a["emergency"],
+                    squawk=squawk, category=category, distance=distance, altitude=altitude,
+                    heading=heading, speed=speed, lat=lat, lon=lon, site=site,
+                )
+                message = f'Emergency Bit Set! {a["emergency"]}: i:{icao} r:{reg} t:{ptype} f:{flight} c:{category} a:{altitude} h:{heading} d:{distance} s:{speed}'
+                logger.critical(message)
+                alerts.alert(
+                    "emergency", ("emergency", icao), ["warnone.mp3", "warntwo.mp3"], message,
+                    icao=icao, ident=flight, ptype=ptype, emergency=a["emergency"],
+                )
 
-    for dentry in delete:
-        sql = "DELETE FROM plane_days WHERE icao = ? AND day = ?"
-        cur.execute(sql, (dentry["icao"], dentry["day"]))
+    # Plane days and flight tracking require ident set
+    if flight:
+        update_flight(
+            flight,
+            icao,
+            ptype,
+            distance,
+            altitude,
+            flight_level,
+            speed,
+            squawk,
+            heading,
+            reg,
+            owner,
+            category,
+            baro_rate,
+        )
+        # Only update plane_days if flight info
+        update_plane_day(
+            icao,
+            flight,
+            squawk,
+            ptype,
+            distance,
+            altitude,
+            flight_level,
+            heading,
+            speed,
+            reg,
+            category,
+            site,
+            owner,
+            baro_rate
+        )
+    update_plane(
+        icao,
+        flight,
+        squawk,
+        ptype,
+        model,
+        distance,
+        altitude,
+        flight_level,
+        heading,
+        speed,
+        reg,
+        country,
+        owner,
+        military,
+        category,
+        site,
+        mfr,
+        status,
+        opcode,
+        serial
+    )
+    if ptype:
+        # Type aggregates are refreshed on later cycles when over budget
+        new = False
+        if scheduler.enabled("ptypes"):
+            new = update_ptype(ptype, icao, mfr, model)
+        model_str = model[:11]
+        if new:
+            events.publish(
+                "new_type", ptype=ptype, icao=icao, ident=flight, mfr=mfr, model=model, reg=reg,
+                category=category, country=country, owner=owner, distance=distance,
+            )
+            message = f"!! NEW HULL TYPE !!   ({ptype:<4}) {category:<2}: {mfr} {model_str:<8} r:{reg} fl:{flight} c:{country} o:{owner} d:{distance} {icao}"
+            logger.warning(message, extra=logs.fields(icao, flight, ptype, site))
+            alerts.alert(
+                "new_type", ("new_type", ptype), ["ding-high.mp3", "ding-high.mp3"], message,
+                icao=icao, ptype=ptype, reg=reg,
+            )
+    else:
+        if (icao, "notype") not in alerted:
+            alerted[(icao, "notype")] = 1
+            logger.debug(
+                "No Plane Type: %s %s %s %s %s %s %s %s %s %s %s",
+                icao, reg, ptype, flight, squawk, lat, lon, altitude, heading, distance, speed,
+                extra=logs.fields(icao, flight, ptype, site),
+            )
+    if config["alerts"]["landing"] in ["true", "True", "1"]:
+        alert_landing(
+            icao,
+            flight,
+            squawk,
+            ptype,
+            distance,
+            altitude,
+            heading,
+            speed,
+            lat,
+            lon,
+            baro_rate,
+            category,
+            reg,
+        )
+    if config["alerts"]["boeing"] in ["true", "True", "1"]:
+        alert_b787(
+            icao,
+            flight,
+            reg,
+            squawk,
+            ptype,
+            distance,
+            altitude,
+            heading,
+            speed,
+        )
 
 
 def run_daemon(refresh=10, sites=["127.0.0.1"]):
@@ -1619,240 +1665,63 @@ def run_daemon(refresh=10, sites=["127.0.0.1"]):
     first_run = False
     fail_count = defaultdict(int)
     while True:
+        scheduler.start_cycle()
         cdict_counter += 1
         plane_count = 0
+        received = list()
         for site in sites:
-            site_url = f"http://{site}/skyaware/data/aircraft.json"
-            try:
-                r = requests.get(
-                    site_url, timeout=5
-                )
-                planes = r.json()
-                fail_count[site] = 0
-
-                for p in planes["aircraft"]:
-
-                    if "hex" in p and p["hex"] and "lat" in p and p["lat"]:
-                        plane_count += 1
-
-                        category = ""
-                        if "category" in p:
-                            category = p["category"]
-                        baro_rate = 0
-                        if "baro_rate" in p:
-                            baro_rate = p["baro_rate"]
-
-                        icao = p["hex"].upper().replace("~", "")
-                        flight = ""
-                        if "flight" in p:
-                            flight = p["flight"].rstrip()
-
-                        squawk = ""
-                        if "squawk" in p:
-                            squawk = p["squawk"].rstrip()
-
-                        lat = p["lat"]
-                        lon = p["lon"]
-
-                        # KM -> NM
-                        distance = mpu.haversine_distance(
-                            (lat, lon),
-                            (
-                                float(config["global"]["lat"]),
-                                float(config["global"]["lon"]),
-                            ),
-                        )
-                        distance = round(distance * 0.621371, 1)
-                        # print('distance', distance)
-
-                        heading = 0
-                        if "track" in p:
-                            heading = int(p["track"])
-
-                        altitude = 0
-                        if "alt_baro" in p:
-                            altitude = p["alt_baro"]
-                        if altitude == "ground":
-                            altitude = 0
-
-                        speed = 0
-                        if "gs" in p:
-                            speed = int(p["gs"])
+            # Failing receivers back off instead of costing a timeout every cycle
+            if not receivers.due(site):
+                continue
+            site_url = receivers.url(site)
+            planes = receivers.fetch(site, refresh)
+            if not planes:
+                continue
+            for p in planes.get("aircraft", []):
+                if "hex" in p and p["hex"] and "lat" in p and p["lat"]:
+                    received.append((site, p))
 
-                        (
-                            ptype,
-                            mfr,
-                            model,
-                            country,
-                            owner,
-                            military,
-                            reg,
-                            status,
-                            opcode,
-                            serial
-                        ) = lookup_model_mfr(icao)
-                        flight_level = get_flight_level(altitude)
-                        dist_int = int(distance)
-
-                        # Reactivate airframes that were marked parked/retired and cache
-                        if not status:
-                            status = 'A'
-                        elif status != 'A':
-                            if (icao) not in reactivated:
-                                if not flight and holddown[(icao, 'reactivate')] < 5:
-                                    holddown[(icao, 'reactivate')] += 1
-                                else:
-                                    reactivated[icao] = 1
-                                    model_str = model[:6]
-                                    logger.warning(f"Reactivate ({status}) {model_str:>6} ({ptype:>4}) {category:<2} [{dist_int:>3}nm {flight_level:<5}] {flight:>7} {reg} {country} {owner} {mfr} {icao} site:{site}")
-                                    play_sound(
-                                        "/Users/yantisj/dev/ads-db/sounds/ding.mp3"
-                                    )
-                            status = 'R'
-
-                        # print(f'{icao} {reg} {ptype} {flight} {category} {squawk} {lat} {lon} {altitude} {heading} {distance} {speed}')
-
-                        # Play sounds on emergency bit set
-                        if "emergency" in p:
-                            if p["emergency"] and p["emergency"] != "none":
-                                if (icao, 'emerg') not in alerted:
-                                    alerted[(icao, 'emerg')] = 1
-                                    logger.critical(
-                                        f'Emergency Bit Set! {p["emergency"]}: i:{icao} r:{reg} t:{ptype} f:{flight} c:{category} a:{altitude} h:{heading} d:{distance} s:{speed}'
-                                    )
-                                    play_sound(
-                                        "/Users/yantisj/dev/ads-db/sounds/warnone.mp3"
-                                    )
-                                    play_sound(
-                                        "/Users/yantisj/dev/ads-db/sounds/warntwo.mp3"
-                                    )
-
-                        # Plane days and flight tracking require ident set
-                        if flight:
-                            update_flight(
-                                flight,
-                                icao,
-                                ptype,
-                                distance,
-                                altitude,
-                                flight_level,
-                                speed,
-                                squawk,
-                                heading,
-                                reg,
-                                owner,
-                                category,
-                                baro_rate,
-                            )
-                            # Only update plane_days if flight info
-                            update_plane_day(
-                                icao,
-                                flight,
-                                squawk,
-                                ptype,
-                                distance,
-                                altitude,
-                                flight_level,
-                                heading,
-                                speed,
-                                reg,
-                                category,
-                                site,
-                                owner,
-                                baro_rate
-                            )
-                        update_plane(
-                            icao,
-                            flight,
-                            squawk,
-                            ptype,
-                            model,
-                            distance,
-                            altitude,
-                            flight_level,
-                            heading,
-                            speed,
-                            reg,
-                            country,
-                            owner,
-                            military,
-                            category,
-                            site,
-                            mfr,
-                            status,
-                            opcode,
-                            serial
-                        )
-                        if ptype:
-                            new = update_ptype(ptype, icao, mfr, model)
-                            model_str = model[:11]
-                            if new:
-                                logger.warning(
-                                    f"!! NEW HULL TYPE !!   ({ptype:<4}) {category:<2}: {mfr} {model_str:<8} r:{reg} fl:{flight} c:{country} o:{owner} d:{distance} {icao}"
-                                )
-                                if sounds and check_quiet_time():
-                                    play_sound(
-                                        "/Users/yantisj/dev/ads-db/sounds/ding-high.mp3"
-                                    )
-                                    play_sound(
-                                        "/Users/yantisj/dev/ads-db/sounds/ding-high.mp3"
-                                    )
-                        else:
-                            if (icao, "notype") not in alerted:
-                                alerted[(icao, "notype")] = 1
-                                logger.debug(
-                                    f"No Plane Type: {icao} {reg} {ptype} {flight} {squawk} {lat} {lon} {altitude} {heading} {distance} {speed}"
-                                )
-                        if config["alerts"]["landing"] in ["true", "True", "1"]:
-                            alert_landing(
-                                icao,
-                                flight,
-                                squawk,
-                                ptype,
-                                distance,
-                                altitude,
-                                heading,
-                                speed,
-                                lat,
-                                lon,
-                                baro_rate,
-                                category,
-                                reg,
-                            )
-                        if config["alerts"]["boeing"] in ["true", "True", "1"]:
-                            alert_b787(
-                                icao,
-                                flight,
-                                reg,
-                                squawk,
-                                ptype,
-                                distance,
-                                altitude,
-                                heading,
-                                speed,
-                            )
-
-            except requests.exceptions.ConnectionError as e:
-                fail_count[site] += 1
-                if fail_count[site] <= 5:
-                    logger.warning(f"ConnectionError {site}: {e}")
-                pass
+        # BaseStation lookups, distances and routes (sharded across worker processes when enabled),
+        # then all writes, events and alerts from this process
+        shard_routes.clear()
+        try:
+            enriched = shards.enrich(received, routes=scheduler.enabled("routes"))
+        except sqlite3.Error as e:
+            logger.critical(f"Enrichment Error: {e}")
+            enriched = list()
+        for a in enriched:
+            plane_count += 1
+            try:
+                update_aircraft(a)
             except Exception as e:
                 fail_count[str(e)] += 1
                 if fail_count[str(e)] <= 5:
-                    logger.critical(f"General Update Exception {site}: {e}")
-                time.sleep(1)
-                pass
+                    logger.critical(f"General Update Exception {a['site']}: {e}")
+        cycle_aircraft = live.publish()
         if not first_run:
             first_run = True
             logger.info(f"Daemon Started: Received {plane_count} planes from {site_url}")
+
+        # Enforce retention tiers a slice at a time in quiet cycles
+        try:
+            retention.run_slice(plane_count)
+        except sqlite3.OperationalError as e:
+            logger.warning(f"Retention Error: {e}")
+
         if cdict_counter > save_cycle:
             cdict_counter = 0
             if save_cycle > 50:
                 logger.info("Committing Data to DB")
+            try:
+                stats.flush()
+                rollup.flush()
+            except sqlite3.OperationalError as e:
+                logger.warning(f"Stats Error: {e}")
             conn.commit()
 
-        time.sleep(refresh)
+        # Poll faster with aircraft close in and low or descending, slower when the sky is empty,
+        # at a fixed rate from the start of this cycle
+        time.sleep(scheduler.end_cycle(receivers.next_refresh(refresh, cycle_aircraft)))
 
 
 def load_fadb():
@@ -1932,6 +1801,8 @@ parser.add_argument("-fm", action="store_true", help="Filter Military Planes")
 parser.add_argument("-fh", type=float, help="Filter by hours since seen")
 parser.add_argument("-fd", type=int, help="Filter by Days Seen Above Count")
 parser.add_argument("-frd", type=int, help="Filter by Route Distance")
+parser.add_argument("--limit", type=int, help="Limit lookup results")
+parser.add_argument("--offset", type=int, help="Skip lookup results (with --limit for paging)")
 parser.add_argument("-S", action="store_true", help="Play Sounds")
 parser.add_argument("-rf", type=int, help="Refresh Interval (default 10sec)")
 parser.add_argument("-db", type=str, help="Different Database File")
@@ -1942,12 +1813,61 @@ parser.add_argument("-v", action="store_true", help="Debug Mode")
 parser.add_argument(
     "--update_db", action="store_true", help="Update all planes with latest DB info"
 )
+parser.add_argument(
+    "--update_snapshot", action="store_true", help="Update planes changed since the last applied BaseStation snapshot"
+)
+parser.add_argument(
+    "--serve", type=int, nargs="?", const=0, metavar="PORT", help="Run the read-only JSON query server (default port 8090)"
+)
+parser.add_argument(
+    "--rebuild_stats", "--rebuild-stats", action="store_true", help="Recompute the database stats table"
+)
+parser.add_argument(
+    "--report",
+    type=str,
+    choices=["hour", "day", "week", "month", "year"],
+    help="Traffic report per period from rollups (filters: -lt -lo -fm -fc -fh)",
+)
+parser.add_argument(
+    "--build_fts", action="store_true", help="Build full text search indexes for -lo/-lr/-ld/-lm"
+)
+parser.add_argument(
+    "--bench_fts", action="store_true", help="Compare LIKE and full text search lookup times"
+)
+parser.add_argument(
+    "--bench_shards", type=int, metavar="WORKERS", help="Compare enrichment throughput from 1 to WORKERS processes"
+)
+parser.add_argument(
+    "--bench_logging", action="store_true", help="Compare daemon logging overhead per cycle (INFO and DEBUG)"
+)
+parser.add_argument(
+    "--rebuild_rollups", action="store_true", help="Backfill daily rollups from plane days"
+)
 parser.add_argument(
     "--mark_dups", action="store_true", help="Check for duplicate serial numbers"
 )
+parser.add_argument(
+    "--incremental", action="store_true", help="Only check planes seen since the last run (--mark_dups)"
+)
 parser.add_argument(
     "--cleanup_db", action="store_true", help="Cleanup excess plane days"
 )
+parser.add_argument(
+    "--compact_db", type=str, help="Convert database to new compact schema (v2) file"
+)
+parser.add_argument(
+    "--archive_db", action="store_true", help="Move old plane days to yearly archive databases"
+)
+parser.add_argument("-H", action="store_true", help="Include archived history in lookups")
+parser.add_argument(
+    "--export", type=str, choices=export.TABLES, help="Export a table as NDJSON/CSV (with -H plane_days includes archives)"
+)
+parser.add_argument(
+    "--format", type=str, choices=["ndjson", "csv"], help="Export format, with a lookup exports its results (default ndjson)"
+)
+parser.add_argument("--since", type=str, help="Only export rows seen since a lastseen watermark (YYYY-MM-DD HH:MM:SS)")
+parser.add_argument("--gzip", action="store_true", help="Gzip compress the export")
+parser.add_argument("-o", "--output", type=str, help="Export file (default stdout)")
 args = parser.parse_args()
 
 # http://www.virtualradarserver.co.uk/Files/StandingData.sqb.gz
@@ -1965,9 +1885,37 @@ database_file = "./sqb/ads-db-planes.sqb"
 if args.db:
     database_file = "./sqb/" + args.db
 
+# Lookups and reports open the database read-only, without DDL, so they never
+# wait on or block the daemon's write transactions (WAL snapshot reads)
+read_only = any(
+    [args.st, args.lt, args.lts, args.lf, args.lm, args.li, args.ld, args.lr, args.lo, args.af, args.report,
+     args.export, args.format, args.bench_fts, args.bench_logging, args.bench_shards, args.serve is not None]
+) and not any(
+    [args.D, args.update_db, args.update_snapshot, args.cleanup_db, args.mark_dups, args.archive_db,
+     args.compact_db, args.rebuild_stats, args.build_fts, args.rebuild_rollups]
+)
+
 # Connect to database
-conn = connect_ads_db(database_file)
+if read_only:
+    try:
+        conn = connect_read_only(database_file)
+        compact.setup(conn)
+    except sqlite3.OperationalError as e:
+        logger.critical(f"Unable to open {database_file} read-only: {e}")
+        exit(1)
+else:
+    conn = connect_ads_db(database_file)
 display.conn = conn
+archive.conn = conn
+retention.conn = conn
+snapshot.conn = conn
+stats.conn = conn
+rollup.conn = conn
+search.conn = conn
+export.conn = conn
+search.setup()
+if args.H:
+    archive.attach_archives(database_file, read_only=read_only)
 
 if "standing_data" in config["db"]:
     flight_conn = sqlite3.connect(
@@ -1983,24 +1931,64 @@ if args.sc:
     save_cycle = args.sc
     logger.debug(f"Increasing Save Cycle to {args.sc}")
 
+display.page = page_sql(args.limit, args.offset)
+
+# Lookup results exported instead of printed, summaries to stderr
+if args.format and not args.export:
+    export.open_output(args.output, export_format=args.format, compress=args.gzip)
+    sys.stdout = sys.stderr
+
 if args.lo and not args.lt:
     args.lt = '%'
 
 if args.update_db:
-    load_fadb()
     logger.info("Updating All Plane Data")
     update_missing_data()
+elif args.update_snapshot:
+    logger.info("Updating Plane Data from BaseStation Snapshot Changes")
+    update_missing_data(changed=True)
 elif args.cleanup_db:
     cleanup_db()
 elif args.mark_dups:
-    mark_dups()
+    mark_dups(incremental=args.incremental)
+elif args.archive_db:
+    archive_days = archive.ARCHIVE_DAYS
+    if "archive" in config and "days" in config["archive"]:
+        archive_days = int(config["archive"]["days"])
+    archive.archive_plane_days(database_file, days=archive_days)
+elif args.compact_db:
+    compact.convert_db(database_file, os.path.join(os.path.dirname(database_file), args.compact_db))
 
 elif args.D:
     load_fadb()
+    load_serials()
+    stats.rebuild()
+    rollup.load_current()
+
+    # Enrichment runs in this process unless [shards] workers is set (forked before other threads start)
+    shards.home = (float(config["global"]["lat"]), float(config["global"]["lon"]))
+    shards.lookup = lookup
+    shards.flight_conn = flight_conn
+    workers = shards.load_config(config)
+    if workers:
+        conn.commit()
+        shards.start(workers, config["db"]["base_station"], config["db"].get("standing_data"), database_file)
+
+    retention.load_config(config)
+    live.load_config(config)
+    live.start()
+    receivers.load_config(config)
+    scheduler.load_config(config)
+
+    if "logging" in config and config["logging"].get("json"):
+        logs.add_json(config["logging"]["json"])
 
     if config["alerts"]["sounds"] in ["true", "True", "1"] and not sounds:
         logger.debug("Enabling Sounds")
         sounds = True
+    alerts.sounds = sounds
+    alerts.load_config(config)
+    alerts.start()
 
     sites = ["127.0.0.1"]
     refresh = 10
@@ -2014,9 +2002,53 @@ elif args.D:
         run_daemon(refresh=refresh, sites=sites)
     except KeyboardInterrupt:
         logger.info("Closing Database")
+        rollup.flush()
         conn.commit()
-elif args.st:
+elif args.export:
+    export.open_output(args.output, export_format=args.format or "ndjson", compress=args.gzip)
+    export.export_table(args.export, since=export.parse_since(args.since))
+    export.close_output()
+    exit()
+elif args.serve is not None:
+    server.load_config(config)
+    server.serve(database_file, port=args.serve)
+elif args.rebuild_stats:
+    stats.rebuild()
     get_db_stats()
+elif args.build_fts:
+    search.build()
+elif args.bench_fts:
+    search.benchmark(
+        [
+            ("planes", "owner", "%Delta%"),
+            ("planes", "owner", "%Air Force%"),
+            ("planes", "registration", "N1%"),
+            ("planes", "ident", "DAL%"),
+            ("planes", "model", "%737%"),
+            ("plane_types", "manufacturer", "%Boeing%"),
+        ]
+    )
+elif args.bench_logging:
+    logs.benchmark()
+elif args.bench_shards:
+    shards.home = (float(config["global"]["lat"]), float(config["global"]["lon"]))
+    shards.benchmark(
+        database_file, config["db"]["base_station"], config["db"].get("standing_data"), max_workers=args.bench_shards
+    )
+elif args.rebuild_rollups:
+    rollup.rebuild_days()
+elif args.report:
+    rollup.report(
+        args.report,
+        ptype=args.lt,
+        owner=args.lo,
+        military=args.fm,
+        cat_min=args.fc,
+        hours_ago=args.fh,
+    )
+elif args.st:
+    get_db_stats(read_only=read_only)
+    retention.print_status()
     exit()
 
 elif args.lt:
@@ -2087,8 +2119,11 @@ elif args.af:
     refresh = 10
     if args.rs:
         sites = args.rs.split(",")
+    live.load_config(config)
     alert_ident(args.af, sites=sites, min_distance=args.ad)
 else:
     parser.print_help()
 
+if export.out:
+    export.close_output()
 print()
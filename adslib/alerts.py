@@ -0,0 +1,171 @@
+# Alert Dispatcher
+#  - The daemon raises alerts with a queue put, a background worker plays sounds and notifies sinks
+#  - Alerts with the same key inside the dedup window are dropped
+#  - Alerts arriving together (eg several new planes in one cycle) are coalesced by kind,
+#    one sound per kind and one batch per sink
+#  - Sinks: sound, log, webhook (POST JSON), more via add_sink()
+#
+import time
+import queue
+import logging
+import threading
+import requests
+from .helpers import check_quiet_time
+
+logger = logging.getLogger('ads-alerts')
+
+SOUND_DIR = "/Users/yantisj/dev/ads-db/sounds"
+
+# Seconds an alert key stays suppressed, seconds to wait for a burst to complete
+DEDUP = 300
+COALESCE = 1.0
+QUEUE_SIZE = 1000
+
+# Play sounds (-S or [alerts] sounds)
+sounds = False
+webhook = None
+
+pending = queue.Queue(QUEUE_SIZE)
+sinks = list()
+recent = dict()
+state = {"raised": 0, "dropped": 0, "deduped": 0, "delivered": 0}
+worker = None
+
+
+def load_config(config):
+    "Dispatcher settings from the [alerts] config section"
+    global DEDUP, COALESCE, webhook
+
+    alerts = config["alerts"] if "alerts" in config else dict()
+    DEDUP = int(alerts.get("dedup", DEDUP))
+    COALESCE = float(alerts.get("coalesce", COALESCE))
+    webhook = alerts.get("webhook")
+
+    for name in alerts.get("sinks", "sound").split(","):
+        name = name.strip()
+        if name in SINKS:
+            add_sink(SINKS[name])
+        elif name:
+            logger.warning(f"Unknown alert sink: {name}")
+
+
+def alert(kind, key, play=(), message="", **fields):
+    """
+    Raise an alert from the hot loop (only a queue put)
+     - play is a list of sound files under SOUND_DIR, numbers are pauses in seconds
+    """
+
+    if not worker:
+        # Only the daemon dispatches alerts
+        logger.debug("Alert %s not dispatched (no worker): %s", kind, message or key)
+        return
+    state["raised"] += 1
+    try:
+        pending.put_nowait({"kind": kind, "key": key, "sounds": play, "message": message, "time": time.time(), **fields})
+    except queue.Full:
+        state["dropped"] += 1
+
+
+def add_sink(sink):
+    "Register a sink function(kind, alerts)"
+
+    if sink not in sinks:
+        sinks.append(sink)
+
+
+def sound_sink(kind, alerts):
+    "Play the batch's longest sound list once (eg a large landing's extra ding)"
+
+    if not sounds or not check_quiet_time():
+        return
+
+    from playsound import playsound
+
+    for sound in max((a["sounds"] for a in alerts), key=len):
+        if isinstance(sound, (int, float)):
+            time.sleep(sound)
+        else:
+            playsound(f"{SOUND_DIR}/{sound}")
+
+
+def log_sink(kind, alerts):
+
+    if len(alerts) == 1:
+        logger.info(f"Alert {kind}: {alerts[0]['message']}")
+    else:
+        logger.info(f"Alert {kind} x{len(alerts)}: {', '.join(str(a['key'][-1]) for a in alerts)}")
+
+
+def webhook_sink(kind, alerts):
+
+    if not webhook:
+        return
+    try:
+        requests.post(
+            webhook,
+            json={"kind": kind, "count": len(alerts), "alerts": [dict(a, key=str(a["key"])) for a in alerts]},
+            timeout=5,
+        )
+    except requests.exceptions.RequestException as e:
+        logger.warning(f"Alert webhook failed: {e}")
+
+
+SINKS = {
+    "sound": sound_sink,
+    "log": log_sink,
+    "webhook": webhook_sink,
+}
+
+
+def collect():
+    "Block for the next alert, then gather the rest of its burst"
+
+    batch = [pending.get()]
+    deadline = time.time() + COALESCE
+    while True:
+        try:
+            batch.append(pending.get(timeout=max(0, deadline - time.time())))
+        except queue.Empty:
+            return batch
+
+
+def dispatch(batch):
+    "Dedup a burst and hand it to the sinks grouped by kind"
+
+    now = time.time()
+    for key in [key for (key, seen) in recent.items() if now - seen > DEDUP]:
+        del recent[key]
+
+    kinds = dict()
+    for a in batch:
+        if a["key"] in recent:
+            state["deduped"] += 1
+            continue
+        recent[a["key"]] = now
+        kinds.setdefault(a["kind"], list()).append(a)
+
+    for (kind, alerts) in kinds.items():
+        state["delivered"] += len(alerts)
+        for sink in sinks:
+            try:
+                sink(kind, alerts)
+            except Exception as e:
+                logger.warning(f"Alert sink {sink.__name__} failed: {e}")
+
+
+def run():
+
+    while True:
+        dispatch(collect())
+
+
+def start():
+    "Start the dispatcher worker thread (daemon)"
+    global worker
+
+    if not sinks:
+        add_sink(sound_sink)
+    worker = threading.Thread(target=run, name="ads-alerts", daemon=True)
+    worker.start()
+    logger.debug(f"Alert dispatcher started: {', '.join(s.__name__ for s in sinks)}")
+    return worker
@@ -0,0 +1,144 @@
+# Archive Databases
+#  - Moves aged plane_days into per-year files next to the main database
+#    (sqb/ads-db-planes.sqb -> sqb/ads-db-planes-2021.sqb)
+#  - Lookups attach the archives and UNION them in when history is requested
+#
+import glob
+import os
+import re
+import logging
+from datetime import date, timedelta
+from urllib.parse import quote
+from .constants import sql_lowest
+
+logger = logging.getLogger('ads-archive')
+
+conn = None
+
+ARCHIVE_DAYS = 365
+
+# Attached archive schema names (archive_2021...)
+schemas = list()
+
+# Merge aged plane days into an archive, rows already archived (re-run, restored backup) combine
+# like the daemon's upsert: first/last seen widen, lowest values stay lowest, the latest row wins the rest
+sql_merge_plane_days = f""" INSERT INTO archive.plane_days SELECT * FROM main.plane_days WHERE day >= :start AND day < :end
+                            ON CONFLICT(icao, day, ident) DO UPDATE SET
+                                squawk = COALESCE(NULLIF(CASE WHEN excluded.lastseen >= plane_days.lastseen THEN excluded.squawk END, ''), plane_days.squawk),
+                                speed = CASE WHEN excluded.lastseen >= plane_days.lastseen THEN excluded.speed ELSE plane_days.speed END,
+                                altitude = CASE WHEN excluded.lastseen >= plane_days.lastseen THEN excluded.altitude ELSE plane_days.altitude END,
+                                distance = CASE WHEN excluded.lastseen >= plane_days.lastseen THEN excluded.distance ELSE plane_days.distance END,
+                                heading = CASE WHEN excluded.lastseen >= plane_days.lastseen THEN excluded.heading ELSE plane_days.heading END,
+                                lowest_altitude = {sql_lowest('plane_days', 'lowest_altitude', 'excluded.lowest_altitude')},
+                                closest = {sql_lowest('plane_days', 'closest', 'excluded.closest')},
+                                lowest_speed = {sql_lowest('plane_days', 'lowest_speed', 'excluded.lowest_speed')},
+                                firstseen = MIN(plane_days.firstseen, excluded.firstseen),
+                                lastseen = MAX(plane_days.lastseen, excluded.lastseen); """
+
+# Only rows now in the archive leave main
+sql_delete_archived = """ DELETE FROM main.plane_days WHERE day >= :start AND day < :end AND EXISTS (
+                            SELECT 1 FROM archive.plane_days a
+                            WHERE a.icao = main.plane_days.icao AND a.day = main.plane_days.day AND a.ident IS main.plane_days.ident); """
+
+
+def archive_file(db_file, year):
+    "Archive database file for a year"
+
+    (base, ext) = os.path.splitext(db_file)
+    return f"{base}-{year}{ext}"
+
+
+def archive_files(db_file):
+    "All archive database files by year"
+
+    (base, ext) = os.path.splitext(db_file)
+    files = dict()
+    for afile in glob.glob(f"{glob.escape(base)}-[0-9][0-9][0-9][0-9]{ext}"):
+        year = int(afile[len(base) + 1:len(base) + 5])
+        files[year] = afile
+    return dict(sorted(files.items()))
+
+
+def archive_schema(schema="archive"):
+    "Copy plane_days table and index definitions from main into an attached archive"
+
+    cur = conn.cursor()
+    rows = cur.execute(
+        "SELECT type, sql FROM main.sqlite_master WHERE tbl_name = 'plane_days' AND sql IS NOT NULL"
+    ).fetchall()
+    for (otype, sql) in rows:
+        if otype == "table":
+            sql = re.sub(r"^CREATE TABLE \"?plane_days\"?", f"CREATE TABLE IF NOT EXISTS {schema}.plane_days", sql)
+        else:
+            sql = re.sub(r"^CREATE (UNIQUE )?INDEX (\w+)", rf"CREATE \1INDEX IF NOT EXISTS {schema}.\2", sql)
+        cur.execute(sql)
+
+    (version,) = cur.execute("PRAGMA main.user_version").fetchone()
+    cur.execute(f"PRAGMA {schema}.user_version = {version}")
+
+
+def archive_plane_days(db_file, days=ARCHIVE_DAYS):
+    "Move plane_days older than days into per-year archive databases"
+
+    cutoff = date.today() - timedelta(days=days)
+    cur = conn.cursor()
+    row = cur.execute("SELECT day FROM plane_days ORDER BY day ASC LIMIT 1").fetchone()
+    if not row or row[0] >= cutoff:
+        logger.info(f"No plane days to archive before {cutoff}")
+        return 0
+
+    # ATTACH/DETACH are not allowed inside a transaction
+    conn.commit()
+    total = 0
+    for year in range(row[0].year, cutoff.year + 1):
+        start = date(year, 1, 1)
+        end = min(date(year + 1, 1, 1), cutoff)
+        afile = archive_file(db_file, year)
+
+        cur.execute("ATTACH DATABASE ? AS archive", (afile,))
+        try:
+            archive_schema()
+            cur.execute(sql_merge_plane_days, {"start": start, "end": end})
+            cur.execute(sql_delete_archived, {"start": start, "end": end})
+            moved = cur.rowcount
+            conn.commit()
+        finally:
+            cur.execute("DETACH DATABASE archive")
+
+        if moved:
+            total += moved
+            logger.info(f"Archived {moved:,} plane days to {afile}")
+
+    logger.warning(f"Archived {total:,} plane days before {cutoff}")
+    return total
+
+
+def attach_archives(db_file, read_only=False):
+    "Attach all archive databases for history lookups"
+
+    cur = conn.cursor()
+    for (year, afile) in archive_files(db_file).items():
+        schema = f"archive_{year}"
+        if read_only:
+            afile = f"file:{quote(afile)}?mode=ro"
+        try:
+            cur.execute(f"ATTACH DATABASE ? AS {schema}", (afile,))
+            schemas.append(schema)
+        except Exception as e:
+            logger.warning(f"Unable to attach archive {afile}: {e}")
+
+    if schemas:
+        logger.debug(f"Attached {len(schemas)} archive databases")
+    return schemas
+
+
+def plane_days_table():
+    "plane_days table expression including any attached archives"
+
+    if not schemas:
+        return "plane_days"
+
+    tables = ["SELECT * FROM main.plane_days"]
+    for schema in schemas:
+        tables.append(f"SELECT * FROM {schema}.plane_days")
+    return "(" + " UNION ALL ".join(tables) + ") plane_days"
@@ -0,0 +1,303 @@
+# Compact Storage Schema (v2)
+#  - 24bit ICAO stored as INTEGER, timestamps as epoch seconds, days as epoch days
+#  - planes, plane_days and flights clustered on their keys (WITHOUT ROWID)
+#  - Compact connections (compact.Connection) bind datetime/date parameters as epoch values,
+#    converters read both layouts so display code gets the same rows from either schema
+#
+import os
+import sqlite3
+import logging
+from datetime import date, datetime
+
+logger = logging.getLogger('ads-compact')
+
+SCHEMA_VERSION = 2
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+# Set when connected to a compact database
+enabled = False
+
+sql_create_planes_table = """ CREATE TABLE IF NOT EXISTS planes (
+                                    icao icao NOT NULL,
+                                    ident text,
+                                    ptype text,
+                                    distance float,
+                                    closest float,
+                                    altitude float,
+                                    lowest_altitude float,
+                                    speed float,
+                                    lowest_speed float,
+                                    squawk text,
+                                    heading float,
+                                    firstseen timestamp,
+                                    lastseen timestamp,
+                                    registration text,
+                                    country text,
+                                    owner text,
+                                    military text,
+                                    day_count integer,
+                                    category text,
+                                    opcode varchar(20),
+                                    status varchar(1),
+                                    model varchar(40),
+                                    serial varchar(30),
+                                    PRIMARY KEY (icao)
+                                ) WITHOUT ROWID; """
+
+sql_create_plane_days_table = """ CREATE TABLE IF NOT EXISTS plane_days (
+                                    icao icao NOT NULL,
+                                    day date NOT NULL,
+                                    ident text NOT NULL,
+                                    distance float,
+                                    closest float,
+                                    altitude float,
+                                    lowest_altitude float,
+                                    speed float,
+                                    lowest_speed float,
+                                    squawk text,
+                                    heading float,
+                                    firstseen timestamp,
+                                    lastseen timestamp,
+                                    PRIMARY KEY (icao, day, ident)
+                                ) WITHOUT ROWID; """
+
+sql_create_flights_table = """ CREATE TABLE IF NOT EXISTS flights (
+                                    flight text NOT NULL,
+                                    icao icao,
+                                    ptype text,
+                                    distance float,
+                                    closest float,
+                                    altitude float,
+                                    lowest_altitude float,
+                                    speed float,
+                                    lowest_speed float,
+                                    squawk text,
+                                    heading float,
+                                    registration text,
+                                    day_count integer,
+                                    from_airport text,
+                                    to_airport text,
+                                    firstseen timestamp,
+                                    lastseen timestamp,
+                                    route_distance integer,
+                                    PRIMARY KEY (flight)
+                                ) WITHOUT ROWID; """
+
+sql_create_indexes = [
+    "CREATE INDEX IF NOT EXISTS plane_day_idx ON plane_days(day);",
+    "CREATE INDEX IF NOT EXISTS plane_ident_idx ON plane_days(ident);",
+    "CREATE INDEX IF NOT EXISTS ptype_idx ON planes(ptype);",
+    "CREATE INDEX IF NOT EXISTS ptype_serial_idx ON planes(ptype, serial);",
+    "CREATE INDEX IF NOT EXISTS flights_icao_idx ON flights(icao);",
+]
+
+# Text schema -> compact schema copy statements (src is the attached text database)
+EPOCH = "CAST(strftime('%s', {0}, 'utc') AS INTEGER)"
+EPOCH_DAY = "CAST(julianday({0}) - 2440587.5 AS INTEGER)"
+
+sql_copy_tables = {
+    "planes": f"""INSERT OR IGNORE INTO planes SELECT icao_int(icao),ident,ptype,distance,closest,altitude,lowest_altitude,speed,lowest_speed,squawk,heading,
+                    {EPOCH.format('firstseen')},{EPOCH.format('lastseen')},registration,country,owner,military,day_count,category,opcode,status,model,serial
+                    FROM src.planes""",
+    "plane_days": f"""INSERT OR IGNORE INTO plane_days SELECT icao_int(icao),{EPOCH_DAY.format('day')},COALESCE(ident, ''),distance,closest,altitude,lowest_altitude,speed,lowest_speed,squawk,heading,
+                    {EPOCH.format('firstseen')},{EPOCH.format('lastseen')}
+                    FROM src.plane_days ORDER BY icao, day""",
+    "flights": f"""INSERT OR IGNORE INTO flights SELECT flight,icao_int(icao),ptype,distance,closest,altitude,lowest_altitude,speed,lowest_speed,squawk,heading,registration,
+                    day_count,from_airport,to_airport,{EPOCH.format('firstseen')},{EPOCH.format('lastseen')},route_distance
+                    FROM src.flights""",
+    "plane_types": f"""INSERT OR IGNORE INTO plane_types SELECT ptype,last_icao,{EPOCH.format('firstseen')},{EPOCH.format('lastseen')},count,manufacturer,model,category,active
+                    FROM src.plane_types""",
+    "flight_cache": f"""INSERT OR IGNORE INTO flight_cache SELECT flight,from_airport,to_airport,distance,{EPOCH.format('firstseen')},{EPOCH.format('lastseen')}
+                    FROM src.flight_cache""",
+}
+
+
+def icao_int(icao):
+    "24bit ICAO hex string to integer (None if invalid)"
+
+    try:
+        return int(icao, 16)
+    except (TypeError, ValueError):
+        return None
+
+
+def icao_key(icao):
+    "ICAO query parameter for the connected schema"
+
+    if enabled:
+        return icao_int(icao)
+    return icao
+
+
+def icao_sql(column):
+    "SQL expression for an icao column as hex text (eg joins to BaseStation ModeS)"
+
+    if enabled:
+        return f"printf('%06X', {column})"
+    return column
+
+
+def period_sql(period, column="day"):
+    "SQL expression grouping a day column by week (Monday based), month or year"
+
+    if period == "week":
+        if enabled:
+            return f"(({column} + 3) / 7)"
+        return f"date({column}, 'weekday 0', '-6 days')"
+    elif period == "month":
+        if enabled:
+            return f"strftime('%Y-%m', {column} * 86400, 'unixepoch')"
+        return f"strftime('%Y-%m', {column})"
+    elif period == "year":
+        if enabled:
+            return f"strftime('%Y', {column} * 86400, 'unixepoch')"
+        return f"strftime('%Y', {column})"
+    return column
+
+
+def convert_icao(val):
+    "Integer ICAO (compact icao columns) as hex text, text values (hex ICAOs) unchanged"
+
+    if val.isdigit():
+        return f"{int(val):06X}"
+    return val.decode()
+
+
+def convert_timestamp(val):
+    "Epoch seconds or text timestamps (plane_types/flight_cache on older files)"
+
+    if val.isdigit():
+        return datetime.fromtimestamp(int(val))
+    return datetime.fromisoformat(val.decode())
+
+
+def convert_date(val):
+    if val.lstrip(b"-").isdigit():
+        return date.fromordinal(int(val) + EPOCH_ORDINAL)
+    return date.fromisoformat(val.decode())
+
+
+# Only compact columns are declared icao, text schema icao columns are declared text and never
+# convert (all-digit text ICAOs would read as hex). Text timestamps and dates convert exactly as
+# with the default converters, so other databases read the same as before
+sqlite3.register_converter("icao", convert_icao)
+sqlite3.register_converter("timestamp", convert_timestamp)
+sqlite3.register_converter("date", convert_date)
+
+
+def adapt(val):
+    "datetime/date parameter as epoch seconds/days"
+
+    if isinstance(val, datetime):
+        return int(val.timestamp())
+    if isinstance(val, date):
+        return val.toordinal() - EPOCH_ORDINAL
+    return val
+
+
+def adapt_params(params):
+
+    if hasattr(params, "keys"):
+        return {k: adapt(params[k]) for k in params.keys()}
+    return [adapt(v) for v in params]
+
+
+class Cursor(sqlite3.Cursor):
+    "Adapts parameters on compact connections only"
+
+    def execute(self, sql, parameters=()):
+        if self.connection.compact:
+            parameters = adapt_params(parameters)
+        return super().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        if self.connection.compact:
+            seq_of_parameters = (adapt_params(p) for p in seq_of_parameters)
+        return super().executemany(sql, seq_of_parameters)
+
+
+class Connection(sqlite3.Connection):
+    "sqlite3.connect(factory=Connection): compact when the file uses the v2 schema"
+
+    def __init__(self, *args, **kwargs):
+        self.compact = False
+        super().__init__(*args, **kwargs)
+        self.compact = is_compact(self)
+
+    def cursor(self, factory=Cursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def is_compact(conn):
+    "Check schema version of an open database"
+
+    (version,) = sqlite3.Connection.execute(conn, "PRAGMA user_version").fetchone()
+    return version == SCHEMA_VERSION
+
+
+def setup(conn):
+    "Enable compact access layer if the database uses the v2 schema (opened with factory=Connection)"
+    global enabled
+
+    enabled = is_compact(conn)
+    if enabled:
+        if not getattr(conn, "compact", False):
+            raise ValueError("Compact databases need sqlite3.connect(factory=compact.Connection)")
+        logger.debug("Compact database schema (v2)")
+
+    return enabled
+
+
+def convert_db(src_file, dst_file):
+    "One-shot conversion of a text schema database to a new compact database"
+
+    from .constants import sql_create_flight_cache_table, sql_create_types_table, sql_create_lookup_indexes
+
+    if os.path.exists(dst_file):
+        logger.critical(f"Compact database already exists: {dst_file}")
+        return False
+
+    conn = sqlite3.connect(dst_file)
+    conn.create_function("icao_int", 1, icao_int, deterministic=True)
+    cur = conn.cursor()
+    cur.execute("pragma journal_mode = WAL;")
+    cur.execute("ATTACH DATABASE ? AS src", (src_file,))
+
+    for sql in [
+        sql_create_planes_table,
+        sql_create_plane_days_table,
+        sql_create_flights_table,
+        sql_create_types_table,
+        sql_create_flight_cache_table,
+    ]:
+        cur.execute(sql)
+
+    for table, sql in sql_copy_tables.items():
+        logger.info(f"Converting {table}")
+        cur.execute(sql)
+        (src_count,) = cur.execute(f"SELECT COUNT(*) FROM src.{table}").fetchone()
+        (dst_count,) = cur.execute(f"SELECT COUNT(*) FROM main.{table}").fetchone()
+        if src_count != dst_count:
+            logger.warning(f"Skipped {src_count - dst_count} invalid or duplicate {table} rows")
+
+    for sql in sql_create_indexes + sql_create_lookup_indexes:
+        cur.execute(sql)
+    cur.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    conn.commit()
+    cur.execute("DETACH DATABASE src")
+    cur.execute("ANALYZE")
+    cur.execute("pragma wal_checkpoint(TRUNCATE)")
+    conn.close()
+
+    src_size = os.path.getsize(src_file)
+    dst_size = os.path.getsize(dst_file)
+    logger.warning(
+        f"Compact Database: {dst_file} {dst_size / 1e6:,.1f}MB (was {src_size / 1e6:,.1f}MB)"
+    )
+    return True
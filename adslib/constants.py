@@ -190,6 +190,54 @@ sql_create_flight_cache_table = """ CREATE TABLE IF NOT EXISTS flight_cache (
                                     lastseen timestamp
                                 ); """
 
+sql_create_snapshot_table = """ CREATE TABLE IF NOT EXISTS bs_snapshot (
+                                    modes text PRIMARY KEY,
+                                    registration text,
+                                    status text,
+                                    fingerprint integer,
+                                    lastseen timestamp
+                                ); """
+
+sql_create_stats_table = """ CREATE TABLE IF NOT EXISTS db_stats (
+                                    name text PRIMARY KEY,
+                                    value integer,
+                                    lastseen timestamp
+                                ); """
+
+sql_create_rollup_hours_table = """ CREATE TABLE IF NOT EXISTS rollup_hours (
+                                    hour timestamp NOT NULL,
+                                    ptype text NOT NULL,
+                                    category text NOT NULL,
+                                    military text NOT NULL,
+                                    owner text NOT NULL,
+                                    planes integer,
+                                    flights integer,
+                                    PRIMARY KEY (hour, ptype, category, military, owner)
+                                ); """
+
+sql_create_rollup_days_table = """ CREATE TABLE IF NOT EXISTS rollup_days (
+                                    day date NOT NULL,
+                                    ptype text NOT NULL,
+                                    category text NOT NULL,
+                                    military text NOT NULL,
+                                    owner text NOT NULL,
+                                    planes integer,
+                                    flights integer,
+                                    PRIMARY KEY (day, ptype, category, military, owner)
+                                ); """
+
+sql_create_lookup_indexes = [
+    "CREATE INDEX IF NOT EXISTS planes_lastseen_idx ON planes(lastseen);",
+    "CREATE INDEX IF NOT EXISTS planes_military_idx ON planes(lastseen) WHERE military = 'M';",
+    "CREATE INDEX IF NOT EXISTS flights_lastseen_idx ON flights(lastseen);",
+]
+
+sql_create_maintenance_table = """ CREATE TABLE IF NOT EXISTS maintenance (
+                                    name text PRIMARY KEY,
+                                    value,
+                                    lastseen timestamp
+                                ); """
+
 sql_create_types_table = """ CREATE TABLE IF NOT EXISTS plane_types (
                                     ptype text PRIMARY KEY,
                                     last_icao text,
@@ -202,3 +250,108 @@ sql_create_types_table = """ CREATE TABLE IF NOT EXISTS plane_types (
                                     active integer
                                 ); """
 
+
+
+def sql_lowest(table, column, new, reset=False):
+    "Keep the lowest non-zero value on upsert, optionally resetting when last seen before :today"
+
+    lowest = f"MIN(COALESCE(NULLIF({new}, 0), {table}.{column}), COALESCE(NULLIF({table}.{column}, 0), {new}))"
+    if reset:
+        return f"CASE WHEN {table}.lastseen < :today THEN {new} ELSE {lowest} END"
+    return lowest
+
+
+# Single statement upserts, helpers.upsert() reports new rows (firstseen = lastseen) with RETURNING
+# or on SQLite before 3.35 by reading the row back with the sql_new_* query
+sql_new_planes = "SELECT firstseen = lastseen FROM planes WHERE icao = :icao"
+sql_new_plane_days = "SELECT firstseen = lastseen FROM plane_days WHERE icao = :icao AND day = :day AND ident IS :ident"
+sql_new_flights = "SELECT firstseen = lastseen FROM flights WHERE flight = :flight"
+
+sql_upsert_planes = f""" INSERT INTO planes(icao,ident,ptype,squawk,speed,altitude,lowest_altitude,distance,closest,heading,firstseen,lastseen,registration,country,owner,military,day_count,category,status,opcode,model,serial)
+                            VALUES(:icao,:ident,:ptype,:squawk,:speed,:altitude,:altitude,:distance,:distance,:heading,:now,:now,:reg,:country,:owner,:military,1,:category,:status,:opcode,:model,:serial)
+                            ON CONFLICT(icao) DO UPDATE SET
+                                ident = COALESCE(NULLIF(excluded.ident, ''), planes.ident),
+                                ptype = excluded.ptype,
+                                squawk = COALESCE(NULLIF(excluded.squawk, ''), planes.squawk),
+                                speed = excluded.speed,
+                                altitude = excluded.altitude,
+                                lowest_altitude = {sql_lowest('planes', 'lowest_altitude', 'excluded.lowest_altitude', reset=True)},
+                                distance = excluded.distance,
+                                closest = {sql_lowest('planes', 'closest', 'excluded.closest', reset=True)},
+                                heading = excluded.heading,
+                                lastseen = MAX(planes.lastseen, excluded.lastseen),
+                                registration = excluded.registration,
+                                country = excluded.country,
+                                owner = excluded.owner,
+                                military = excluded.military,
+                                day_count = COALESCE(planes.day_count, 0) + (planes.lastseen < :today),
+                                category = excluded.category,
+                                status = excluded.status,
+                                opcode = excluded.opcode,
+                                model = excluded.model,
+                                serial = excluded.serial """
+
+sql_upsert_plane_days = f""" INSERT INTO plane_days(icao,day,ident,squawk,speed,altitude,lowest_altitude,distance,closest,heading,firstseen,lastseen)
+                            VALUES(:icao,:day,:ident,:squawk,:speed,:altitude,:altitude,:distance,:distance,:heading,:now,:now)
+                            ON CONFLICT(icao, day, ident) DO UPDATE SET
+                                squawk = COALESCE(NULLIF(excluded.squawk, ''), plane_days.squawk),
+                                speed = excluded.speed,
+                                altitude = excluded.altitude,
+                                lowest_altitude = {sql_lowest('plane_days', 'lowest_altitude', 'excluded.lowest_altitude')},
+                                distance = excluded.distance,
+                                closest = {sql_lowest('plane_days', 'closest', 'excluded.closest')},
+                                heading = excluded.heading,
+                                lastseen = MAX(plane_days.lastseen, excluded.lastseen) """
+
+# Plane days without a tracked call sign keep one row per day and take the latest ident
+sql_update_plane_day = f""" UPDATE OR IGNORE plane_days SET
+                                ident = :ident,
+                                squawk = COALESCE(NULLIF(:squawk, ''), plane_days.squawk),
+                                speed = :speed,
+                                altitude = :altitude,
+                                lowest_altitude = {sql_lowest('plane_days', 'lowest_altitude', ':altitude')},
+                                distance = :distance,
+                                closest = {sql_lowest('plane_days', 'closest', ':distance')},
+                                heading = :heading,
+                                lastseen = MAX(plane_days.lastseen, :now)
+                            WHERE icao = :icao AND day = :day; """
+
+sql_upsert_flights = f""" INSERT INTO flights(flight,icao,ptype,distance,closest,altitude,lowest_altitude,speed,lowest_speed,squawk,heading,registration,from_airport,to_airport,firstseen,lastseen,route_distance)
+                            VALUES(:flight,:icao,:ptype,:distance,:distance,:altitude,:altitude,:speed,:speed,:squawk,:heading,:reg,:from_airport,:to_airport,:now,:now,:route_distance)
+                            ON CONFLICT(flight) DO UPDATE SET
+                                icao = excluded.icao,
+                                ptype = excluded.ptype,
+                                distance = excluded.distance,
+                                closest = {sql_lowest('flights', 'closest', 'excluded.closest', reset=True)},
+                                altitude = excluded.altitude,
+                                lowest_altitude = {sql_lowest('flights', 'lowest_altitude', 'excluded.lowest_altitude', reset=True)},
+                                speed = excluded.speed,
+                                lowest_speed = {sql_lowest('flights', 'lowest_speed', 'excluded.lowest_speed')},
+                                squawk = COALESCE(NULLIF(excluded.squawk, ''), flights.squawk),
+                                heading = excluded.heading,
+                                registration = excluded.registration,
+                                from_airport = COALESCE(NULLIF(excluded.from_airport, ''), flights.from_airport),
+                                to_airport = COALESCE(NULLIF(excluded.to_airport, ''), flights.to_airport),
+                                lastseen = MAX(flights.lastseen, excluded.lastseen),
+                                route_distance = COALESCE(NULLIF(excluded.route_distance, 0), flights.route_distance) """
+
+
+# BaseStation Aircraft columns used by aircraft_fields()
+AIRCRAFT_COLUMNS = [
+    "ModeS",
+    "OperatorFlagCode",
+    "CurrentRegDate",
+    "ModeSCountry",
+    "Country",
+    "AircraftClass",
+    "Engines",
+    "PopularName",
+    "Manufacturer",
+    "Type",
+    "RegisteredOwners",
+    "Registration",
+    "ICAOTypeCode",
+    "Status",
+    "OperatorFlagCode",
+    "SerialNo",
+]
@@ -2,15 +2,22 @@
 from collections import defaultdict
 from datetime import date, datetime, timedelta
 from .helpers import dict_gen
+from . import export, search, stats
 import logging
 
 logger = logging.getLogger('ads-display')
 
 conn = None
 
+# LIMIT/OFFSET clause for lookups (--limit/--offset)
+page = ""
+
 
 def print_planes(rows):
 
+    if export.fmt:
+        return export.write_rows(rows, export.table_columns("planes"))
+
     total = 0
     print("")
     print(
@@ -72,7 +79,11 @@ def print_planes(rows):
     return total
 
 
-def print_plane_days(rows, hours=0):
+def print_plane_days(rows):
+    "Print plane days rows joined with planes (ptype, registration appended)"
+
+    if export.fmt:
+        return export.write_rows(rows, export.table_columns("plane_days") + ["ptype", "registration"])
 
     total = 0
     print("")
@@ -83,26 +94,9 @@ def print_plane_days(rows, hours=0):
         "----   ----  -------  -------      --- ---  -----   -----   -------------------   -------------------"
     )
 
-    hours_ago = None
-    if hours:
-        hours_ago = datetime.now() - timedelta(hours=hours)
-
-    cur = conn.cursor()
-
-    ptypes = dict()
-
     for row in rows:
         total += 1
-        if hours_ago and row[12] < hours_ago:
-            continue
-        if row[0] not in ptypes:
-            cur.execute(
-                "SELECT ptype, registration from planes where icao = ?", (row[0],)
-            )
-            (ptype, reg) = cur.fetchone()
-            ptypes[row[0]] = (ptype, reg)
-        else:
-            (ptype, reg) = ptypes[row[0]]
+        (ptype, reg) = (row[13], row[14])
 
         altitude = 0
         alt_low = 0
@@ -131,7 +125,10 @@ def print_plane_days(rows, hours=0):
     return total
 
 
-def print_flights(rows, hours=0, low_alt=0, route_distance=0, airport=None):
+def print_flights(rows):
+
+    if export.fmt:
+        return export.write_rows((tuple(r.values()) for r in rows), export.table_columns("flights"))
 
     print(
         "\nFLIGHT#   FROM-->TO   DIST   TYPE  REGISTR    ICAO     CT DST  MIN   ALT     LOW     FIRST                 LAST"
@@ -140,27 +137,15 @@ def print_flights(rows, hours=0, low_alt=0, route_distance=0, airport=None):
         "-------   ---- ----  ------  ----  --------   ------   --- --- --- -----   -----   --------------------  -------------------"
     )
 
-    hours_ago = None
-    if hours:
-        hours_ago = datetime.now() - timedelta(hours=hours)
-
     day_count = 0
     count = 0
     for r in rows:
-        if hours_ago and r["lastseen"] < hours_ago:
-            continue
-        if low_alt and r["lowest_altitude"] > low_alt:
-            continue
-
         r_distance = 0
         try:
             r_distance = int(r["route_distance"])
         except TypeError:
             pass
-        if route_distance and r_distance < route_distance:
-            continue
 
-        
         distance = int(r["distance"])
         closest = int(r["closest"])
         altitude = int(r["altitude"])
@@ -170,9 +155,6 @@ def print_flights(rows, hours=0, low_alt=0, route_distance=0, airport=None):
         from_airport = str(r["from_airport"])
         to_airport = str(r["to_airport"])
 
-        if airport and from_airport != airport and to_airport != airport:
-            continue
-    
         count += 1
 
         print(
@@ -185,19 +167,19 @@ def print_flights(rows, hours=0, low_alt=0, route_distance=0, airport=None):
 def lookup_ptypes(ptype, hours=0, mfr=None):
 
     cur = conn.cursor()
+    where = "ptype LIKE :ptype"
+    params = {"ptype": ptype}
     if mfr:
-        rows = dict_gen(
-            cur.execute(
-                "SELECT * FROM plane_types WHERE manufacturer LIKE ? ORDER BY count DESC",
-                (mfr,),
-            )
-        )
-    else:
-        rows = dict_gen(
-            cur.execute(
-                "SELECT * FROM plane_types WHERE ptype LIKE ? ORDER BY count DESC", (ptype,)
-            )
+        (where, params) = search.match_sql("manufacturer", mfr, table="plane_types")
+    if hours:
+        where += " AND lastseen >= :hours_ago"
+        params["hours_ago"] = datetime.now() - timedelta(hours=hours)
+
+    rows = dict_gen(
+        cur.execute(
+            f"SELECT * FROM plane_types WHERE {where} ORDER BY count DESC{page}", params
         )
+    )
     total = 0
     planes = 0
     print(
@@ -206,13 +188,7 @@ def lookup_ptypes(ptype, hours=0, mfr=None):
     print(
         "--------     ---- --  ---  ------  --------------  ---- --------------------  -------------------"
     )
-    hours_ago = None
-    if hours:
-        hours_ago = datetime.now() - timedelta(hours=hours)
-
     for row in rows:
-        if hours_ago and row[3] < hours_ago:
-            continue
         cnt = 1
         if row['count']:
             cnt = row['count']
@@ -244,128 +220,22 @@ def lookup_ptypes(ptype, hours=0, mfr=None):
         print(f"\nAircraft Types: {total} / Total Aircraft: {planes}")
 
 
-def get_db_stats():
-
-    cur = conn.cursor()
-    cur.execute(
-        'SELECT icao,ptype,lastseen "[timestamp]", firstseen "[timestamp]" FROM planes ORDER BY lastseen ASC'
-    )
-
-    day_ago = datetime.now() - timedelta(days=1)
-    month_ago = datetime.now() - timedelta(days=30)
+def get_db_stats(read_only=False):
 
-    rows = cur.fetchall()
-
-    cur.execute(
-        'SELECT flight,ptype,lastseen "[timestamp]", firstseen "[timestamp]" FROM flights ORDER BY lastseen ASC'
-    )
-
-    all_flights = cur.fetchall()
-
-    types = defaultdict(int)
-    ttypes = dict()
-    ttypes_day = dict()
-    ttypes_mon = dict()
-    ttypes_new = dict()
-    ttypes_old = dict()
-    total = 0
-    total_day = 0
-    total_mon = 0
-    total_new = 0
-    type_count = 0
-    type_count_day = 0
-    type_count_mon = 0
-    type_count_new = 0
-    last_seen = ""
-
-    for row in rows:
-        total += 1
-        last_seen = str(row[2]).split(".")[0]
-
-        icao = row[0]
-        ptype = row[1]
-        types["TOTL"] += 1
-        types[ptype] += 1
-        if ptype not in ttypes:
-            ttypes[ptype] = 1
-            type_count += 1
-            types["TYPE"] = type_count
-        if row[3] < day_ago:
-            if ptype not in ttypes_old:
-                ttypes_old[ptype] = 1
-        if row[2] > day_ago:
-            total_day += 1
-            if ptype not in ttypes_day:
-                ttypes_day[ptype] = 1
-                type_count_day += 1
-        if row[2] > month_ago:
-            total_mon += 1
-            if ptype not in ttypes_mon:
-                ttypes_mon[ptype] = 1
-                type_count_mon += 1
-        if row[3] > day_ago:
-            total_new += 1
-            if ptype not in ttypes_new and ptype not in ttypes_old and ptype:
-                ttypes_new[ptype] = 1
-                type_count_new += 1
-
-    flights = defaultdict(int)
-    fflights = dict()
-    fflights_day = dict()
-    fflights_mon = dict()
-    fflights_new = dict()
-    fflights_old = dict()
-    ftotal = 0
-    ftotal_day = 0
-    ftotal_mon = 0
-    ftotal_new = 0
-    flight_count = 0
-    flight_count_day = 0
-    flight_count_mon = 0
-    flight_count_new = 0
-
-    for row in all_flights:
-        ftotal += 1
-        last_seen = str(row[2]).split(".")[0]
-
-        flight = row[0]
-        flights["TOTL"] += 1
-        flights[flight] += 1
-        if flight not in fflights:
-            fflights[flight] = 1
-            flight_count += 1
-            flights[icao] = type_count
-        if row[3] < day_ago:
-            if flight not in fflights_old:
-                fflights_old[flight] = 1
-        if row[2] > day_ago:
-            ftotal_day += 1
-            if flight not in fflights_day:
-                fflights_day[flight] = 1
-                flight_count_day += 1
-        if row[2] > month_ago:
-            ftotal_mon += 1
-            if flight not in fflights_mon:
-                fflights_mon[flight] = 1
-                flight_count_mon += 1
-        if row[3] > day_ago:
-            ftotal_new += 1
-            if flight not in fflights_new and flight not in fflights_old and flight:
-                fflights_new[flight] = 1
-                flight_count_new += 1
+    (values, updated) = stats.get_stats(read_only=read_only)
+    last_seen = str(updated).split(".")[0]
 
     print(f"\n   ADS-DB Stats:                          [{last_seen}]")
     print("=================================================================")
     print(
-        f" Flight Numbers: {flight_count:<6,}  30days: {flight_count_mon:<6,}  24hrs: {flight_count_day:<6,} New: {flight_count_new:<3,}"
+        f" Flight Numbers: {values['flights']:<6,}  30days: {values['flights_30d']:<6,}  24hrs: {values['flights_24h']:<6,} New: {values['flights_new']:<3,}"
     )
 
     print(
-        f"   Total Planes: {total:<6,}  30days: {total_mon:<6,}  24hrs: {total_day:<6,} New: {total_new:<4,}"
+        f"   Total Planes: {values['planes']:<6,}  30days: {values['planes_30d']:<6,}  24hrs: {values['planes_24h']:<6,} New: {values['planes_new']:<4,}"
     )
     print(
-        f"     Hull Types: {type_count:<6,}  30days: {type_count_mon:<6,}  24hrs: {type_count_day:<6} New: {type_count_new:<3}"
+        f"     Hull Types: {values['types']:<6,}  30days: {values['types_30d']:<6,}  24hrs: {values['types_24h']:<6} New: {values['types_new']:<3}"
     )
     print()
-    return types
-
+    return values
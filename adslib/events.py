@@ -0,0 +1,117 @@
+# Daemon Events
+#  - Typed JSON events (new_plane, new_flight, new_type, landing, emergency, ...) published by the daemon
+#  - Served as server-sent events on the live feed port: GET /events[?types=new_plane,landing]
+#  - The last REPLAY events are kept, reconnecting clients catch up with Last-Event-ID (or ?since=)
+#  - Ids count up from the daemon's start time in ms, ids from before a restart (or unknown ones)
+#    replay the whole buffer rather than skipping events
+#  - Each subscriber has a bounded queue, one that falls behind is dropped so the daemon never waits
+#
+import json
+import time
+import queue
+import logging
+import threading
+from collections import deque
+from urllib.parse import parse_qs, urlsplit
+
+logger = logging.getLogger('ads-events')
+
+REPLAY = 500
+QUEUE_SIZE = 200
+
+# Seconds between keepalive comments on an idle stream
+KEEPALIVE = 15
+
+# (id, type, json) of recent events
+buffer = deque(maxlen=REPLAY)
+subscribers = set()
+lock = threading.Lock()
+state = {"id": int(time.time() * 1000), "dropped": 0}
+
+
+def publish(event, **fields):
+    "Publish an event to the replay buffer and all subscribers (never blocks)"
+
+    with lock:
+        state["id"] += 1
+        item = (state["id"], event, json.dumps(dict(id=state["id"], type=event, time=time.time(), **fields), default=str))
+        buffer.append(item)
+        for q in list(subscribers):
+            try:
+                q.put_nowait(item)
+            except queue.Full:
+                # Slow consumer, end its stream (it can reconnect and replay)
+                subscribers.discard(q)
+                q.get_nowait()
+                q.put_nowait(None)
+                state["dropped"] += 1
+                logger.info(f"Dropped slow event subscriber ({state['dropped']} total)")
+
+
+def subscribe(last_id=None):
+    "Queue for new events and any buffered events after last_id"
+
+    q = queue.Queue(QUEUE_SIZE)
+    with lock:
+        backlog = list()
+        if last_id is not None:
+            if last_id > state["id"]:
+                # Not one of ours (another daemon, clock went back), start over
+                last_id = 0
+            backlog = [item for item in buffer if item[0] > last_id]
+        subscribers.add(q)
+    return (q, backlog)
+
+
+def unsubscribe(q):
+
+    with lock:
+        subscribers.discard(q)
+
+
+def serve_sse(handler):
+    "Stream events to an HTTP request handler until the client goes away or falls behind"
+
+    query = parse_qs(urlsplit(handler.path).query)
+    types = set()
+    if "types" in query:
+        types = set(query["types"][-1].split(","))
+    last_id = handler.headers.get("Last-Event-ID") or query.get("since", [None])[-1]
+    try:
+        last_id = int(last_id) if last_id else None
+    except ValueError:
+        handler.send_error(400, "Bad Last-Event-ID")
+        return
+
+    handler.send_response(200)
+    handler.send_header("Content-Type", "text/event-stream")
+    handler.send_header("Cache-Control", "no-cache")
+    handler.end_headers()
+
+    (q, backlog) = subscribe(last_id)
+    try:
+        for item in backlog:
+            write_event(handler, item, types)
+        while True:
+            try:
+                item = q.get(timeout=KEEPALIVE)
+            except queue.Empty:
+                handler.wfile.write(b": keepalive\n\n")
+                handler.wfile.flush()
+                continue
+            if item is None:
+                return
+            write_event(handler, item, types)
+    except (BrokenPipeError, ConnectionResetError):
+        pass
+    finally:
+        unsubscribe(q)
+
+
+def write_event(handler, item, types):
+
+    (event_id, event, data) = item
+    if types and event not in types:
+        return
+    handler.wfile.write(f"id: {event_id}\nevent: {event}\ndata: {data}\n\n".encode())
+    handler.wfile.flush()
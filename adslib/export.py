@@ -0,0 +1,157 @@
+# NDJSON/CSV Export
+#  - Streams whole tables (--export) or lookup results (--format) in fetchmany chunks
+#  - Optional gzip output, incremental exports of rows seen since a lastseen watermark
+#  - Rows go out as read, memory use does not grow with the table size
+#
+import io
+import csv
+import sys
+import gzip
+import json
+import time
+import logging
+from datetime import datetime
+from .archive import plane_days_table
+
+logger = logging.getLogger('ads-export')
+
+conn = None
+
+# Rows per fetchmany/write
+CHUNK = 5000
+
+TABLES = ["planes", "plane_days", "flights", "plane_types", "flight_cache"]
+
+# Export format and output stream when lookups export instead of printing
+fmt = None
+out = None
+
+# Set when out was opened here (a file or gzip stream) and is closed with it, stdout is only flushed
+owned = False
+
+columns_cache = dict()
+
+# Timestamps/dates as their text form
+json_encode = json.JSONEncoder(default=str).encode
+
+
+def table_columns(table):
+    "Column names of a table"
+
+    if table not in columns_cache:
+        cur = conn.cursor()
+        cur.execute(f"SELECT * FROM {table} LIMIT 0")
+        columns_cache[table] = [d[0] for d in cur.description]
+    return columns_cache[table]
+
+
+def open_output(path=None, export_format="ndjson", compress=False):
+    "Open the export output (stdout if no path), gzip compressed if requested"
+    global fmt, out, owned
+
+    owned = True
+    if path and path != "-":
+        if compress:
+            out = gzip.open(path, "wt", newline="", encoding="utf-8")
+        else:
+            out = open(path, "w", newline="", encoding="utf-8")
+    elif compress:
+        out = io.TextIOWrapper(gzip.GzipFile(fileobj=sys.stdout.buffer, mode="wb"), newline="", encoding="utf-8")
+    else:
+        out = sys.stdout
+        owned = False
+    fmt = export_format
+    return out
+
+
+def close_output():
+    "Close a file or gzip output, flush stdout (which may have been swapped for stderr since)"
+    global out, owned
+
+    if out and owned:
+        out.close()
+    elif out:
+        out.flush()
+    out = None
+    owned = False
+
+
+def chunks(rows):
+    "Lists of up to CHUNK rows from a cursor or any iterable of rows"
+
+    if hasattr(rows, "fetchmany"):
+        while True:
+            chunk = rows.fetchmany(CHUNK)
+            if not chunk:
+                return
+            yield chunk
+    else:
+        chunk = list()
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= CHUNK:
+                yield chunk
+                chunk = list()
+        if chunk:
+            yield chunk
+
+
+def write_rows(rows, columns, lastseen=None):
+    """
+    Write rows to the export output, returns row count
+     - lastseen is a dict updated with the highest lastseen written (watermark)
+    """
+
+    total = 0
+    seen = columns.index("lastseen") if lastseen is not None and "lastseen" in columns else None
+
+    if fmt == "csv":
+        writer = csv.writer(out)
+        writer.writerow(columns)
+    for chunk in chunks(rows):
+        total += len(chunk)
+        if fmt == "csv":
+            writer.writerows(chunk)
+        else:
+            out.write("".join(json_encode(dict(zip(columns, row))) + "\n" for row in chunk))
+        if seen is not None:
+            newest = max((row[seen] for row in chunk if row[seen]), default=None)
+            if newest and (not lastseen.get("max") or newest > lastseen["max"]):
+                lastseen["max"] = newest
+
+    return total
+
+
+def export_table(table, since=None):
+    "Stream a table (plane_days includes attached archives) to the export output"
+
+    if table not in TABLES:
+        logger.critical(f"Unknown export table: {table} ({', '.join(TABLES)})")
+        return 0
+
+    start = time.time()
+    cur = conn.cursor()
+    source = plane_days_table() if table == "plane_days" else table
+    where = ""
+    params = list()
+    if since:
+        where = "WHERE lastseen >= ?"
+        params.append(since)
+
+    cur.execute(f"SELECT * FROM {source} {where}", params)
+    lastseen = dict()
+    total = write_rows(cur, [d[0] for d in cur.description], lastseen=lastseen)
+
+    watermark = ""
+    if lastseen.get("max"):
+        watermark = f", next --since '{lastseen['max']}'"
+    logger.warning(f"Exported {total:,} {table} rows in {time.time() - start:.1f}s{watermark}")
+    return total
+
+
+def parse_since(value):
+    "Watermark from the command line (YYYY-MM-DD[ HH:MM:SS])"
+
+    if not value:
+        return None
+    return datetime.fromisoformat(value)
@@ -1,13 +1,20 @@
 # Helper Routines
 
+import re
+import sqlite3
 from datetime import date, datetime, timedelta
+from urllib.parse import quote
 from .constants import STATIC_CALL_SIGNS
+from . import compact, search
 import logging
 
 logger = logging.getLogger('ads-helper')
 
 config = None
 
+# RETURNING needs SQLite 3.35 (Raspberry Pi OS bullseye ships 3.34)
+RETURNING = sqlite3.sqlite_version_info >= (3, 35)
+
 
 def check_quiet_time():
     now = datetime.now()
@@ -18,6 +25,52 @@ def check_quiet_time():
     return True
 
 
+def connect_read_only(db_file, timeout=5, check_same_thread=True):
+    """
+    Read-only connection for lookups
+     - mode=ro and query_only, no DDL or writes
+     - WAL readers see the last commit and never block the daemon, timeout covers checkpoints
+    """
+
+    conn = sqlite3.connect(
+        f"file:{quote(db_file)}?mode=ro",
+        uri=True,
+        timeout=timeout,
+        check_same_thread=check_same_thread,
+        detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES,
+        factory=compact.Connection,
+    )
+    conn.execute("pragma query_only = 1;")
+    return conn
+
+
+def upsert(cur, sql, params, new_sql):
+    "Run a single statement upsert, True if it inserted a new row"
+
+    if RETURNING:
+        ((new,),) = cur.execute(f"{sql} RETURNING firstseen = lastseen;", params).fetchall()
+    else:
+        cur.execute(sql, params)
+        (new,) = cur.execute(new_sql, params).fetchone()
+    return bool(new)
+
+
+def dup_serials_sql(planes="planes p"):
+    "Every older plane compared to the latest plane with the same type and serial (mark_dups, :year_ago)"
+
+    # No [icao] alias, text schema ICAOs are plain text and compact ones come back as hex from icao_sql
+    return f"""SELECT * FROM (
+                SELECT p.icao, p.ptype, p.serial, p.registration, p.status, p.lastseen,
+                    ROW_NUMBER() OVER w AS n,
+                    p.lastseen < FIRST_VALUE(p.firstseen) OVER w OR p.lastseen < :year_ago AS aged,
+                    FIRST_VALUE({compact.icao_sql('p.icao')}) OVER w AS n_icao,
+                    FIRST_VALUE(p.registration) OVER w AS n_registration,
+                    FIRST_VALUE(p.lastseen) OVER w AS "n_lastseen [timestamp]"
+                FROM {planes} WHERE p.serial != ''
+                WINDOW w AS (PARTITION BY p.ptype, p.serial ORDER BY p.lastseen DESC)
+            ) WHERE n > 1"""
+
+
 def dict_gen(curs):
     """From Python Essential Reference by David Beazley"""
     import itertools
@@ -31,6 +84,66 @@ def dict_gen(curs):
             yield dict(zip(field_names, row))
 
 
+def page_sql(limit=None, offset=None):
+    "LIMIT/OFFSET clause for lookup queries"
+
+    if not limit and not offset:
+        return ""
+    return f" LIMIT {int(limit or -1)} OFFSET {int(offset or 0)}"
+
+
+def planes_where(ptype="%", count=0, cat_min=0, low_alt=0, no_a0=False, military=False, hours=0, owner=None):
+    "WHERE clause and named parameters for plane lookups (-lt and filters)"
+
+    where = ["ptype LIKE :ptype", "NOT status = 'D'"]
+    params = {"ptype": ptype}
+    if owner:
+        (owner_sql, owner_params) = search.match_sql("owner", owner)
+        where.append(owner_sql)
+        params.update(owner_params)
+    if count:
+        where.append("day_count >= :count")
+        params["count"] = count
+    if hours:
+        where.append("lastseen >= :hours_ago")
+        params["hours_ago"] = datetime.now() - timedelta(hours=hours)
+    if cat_min:
+        # A[cat_min]-A5 (A0 unless no_a0), other categories pass
+        cat_sql = "category GLOB 'A[0-9]*' = 0 OR substr(category, 1, 2) BETWEEN :cat_min AND 'A5'"
+        if not no_a0:
+            cat_sql += " OR substr(category, 1, 2) = 'A0'"
+        where.append(f"category != '' AND ({cat_sql})")
+        params["cat_min"] = f"A{cat_min}"
+    if low_alt:
+        where.append("lowest_altitude > 0 AND lowest_altitude <= :low_alt")
+        params["low_alt"] = low_alt
+    if military:
+        where.append("military = 'M'")
+
+    return (" AND ".join(where), params)
+
+
+def flights_where(flight="%", hours=0, low_alt=0, route_distance=0, airport=None):
+    "WHERE clause and named parameters for flight lookups (-lf and filters)"
+
+    where = ["flight LIKE :flight"]
+    params = {"flight": flight}
+    if hours:
+        where.append("lastseen >= :hours_ago")
+        params["hours_ago"] = datetime.now() - timedelta(hours=hours)
+    if low_alt:
+        where.append("lowest_altitude <= :low_alt")
+        params["low_alt"] = low_alt
+    if route_distance:
+        where.append("COALESCE(route_distance, 0) >= :route_distance")
+        params["route_distance"] = route_distance
+    if airport:
+        where.append("(from_airport = :airport OR to_airport = :airport)")
+        params["airport"] = airport
+
+    return (" AND ".join(where), params)
+
+
 def get_call_signs():
     "merge all call signs"
 
@@ -61,3 +174,39 @@ def get_route_type(route_distance):
     #     route_type = "SH"
 
     return route_type
+
+
+def aircraft_fields(r):
+    "Plane fields from a BaseStation Aircraft row (AIRCRAFT_COLUMNS order)"
+
+    owner = ""
+    military = "."
+
+    mfr = r[8]
+    if mfr:
+        mfr = mfr.title()
+    model = r[9]
+    reg = r[11]
+    country = r[3]
+    if r[10]:
+        owner = r[10].rstrip()
+        if re.search(r"United States Air Force", owner):
+            military = "M"
+        elif re.search(r"United States Marine", owner):
+            military = "M"
+        elif re.search(r"United States Navy", owner):
+            military = "M"
+        elif re.search(r"United States Army", owner):
+            military = "M"
+
+    ptype = r[12]
+    status = r[13]
+    opcode = r[14]
+    serial = r[15]
+
+    model = model[:50]
+
+    if re.search(r"United\sStates", country):
+        country = "USA"
+
+    return (ptype, mfr, model, country, owner, military, reg, status, opcode, serial)
@@ -0,0 +1,162 @@
+# Live Aircraft
+#  - The daemon publishes its merged, enriched view of the aircraft in range after each cycle
+#  - Served on a local HTTP port, GET /aircraft for the current table or
+#    GET /aircraft?subscribe=1 for a stream of one JSON line per daemon cycle
+#  - Clients (-af) read the daemon's table instead of polling every receiver themselves
+#  - GET /events streams daemon events (see events.py), GET /receivers receiver health (see receivers.py),
+#    GET /scheduler cycle timing and shed stages (see scheduler.py)
+#
+import json
+import time
+import logging
+import threading
+import requests
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+from . import events, receivers, scheduler
+
+logger = logging.getLogger('ads-live')
+
+PORT = 8091
+BIND = "127.0.0.1"
+
+# Seconds an aircraft stays in the table after it was last received
+STALE = 60
+
+# Aircraft seen this cycle (icao -> record) and the published table
+current = dict()
+aircraft = dict()
+
+# Latest published table as a JSON line, subscribers wait on the condition
+published = {"body": b'{"updated": null, "aircraft": []}\n', "cycle": 0}
+cycle_ready = threading.Condition()
+
+httpd = None
+
+
+def load_config(config):
+    "Live feed settings from the [live] config section"
+    global PORT, BIND
+
+    if "live" not in config:
+        return
+    PORT = int(config["live"].get("port", PORT))
+    BIND = config["live"].get("bind", BIND)
+
+
+def url():
+    return f"http://{BIND}:{PORT}/aircraft"
+
+
+def update(icao, site, **fields):
+    "Record an aircraft received this cycle (merging reports from several receivers)"
+
+    if icao in current:
+        if site not in current[icao]["sites"]:
+            current[icao]["sites"].append(site)
+        # Keep the closest receiver's position report
+        if fields.get("distance", 0) >= current[icao]["distance"]:
+            return
+        fields["sites"] = current[icao]["sites"]
+    else:
+        fields["sites"] = [site]
+    current[icao] = dict(icao=icao, site=site, seen=time.time(), **fields)
+
+
+def publish():
+    "End of a daemon cycle: merge into the live table, drop stale aircraft and notify subscribers (returns this cycle's aircraft)"
+
+    now = time.time()
+    cycle = list(current.values())
+    aircraft.update(current)
+    current.clear()
+    for icao in [icao for (icao, a) in aircraft.items() if now - a["seen"] > STALE]:
+        del aircraft[icao]
+
+    body = json.dumps({"updated": now, "aircraft": list(aircraft.values())}).encode() + b"\n"
+    with cycle_ready:
+        published["body"] = body
+        published["cycle"] += 1
+        cycle_ready.notify_all()
+    return cycle
+
+
+class LiveHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path.rstrip("/") == "/events":
+            events.serve_sse(self)
+            return
+        if url.path.rstrip("/") in ["/receivers", "/scheduler"]:
+            if url.path.rstrip("/") == "/receivers":
+                body = json.dumps({"receivers": receivers.health()}).encode() + b"\n"
+            else:
+                body = json.dumps({"scheduler": scheduler.health()}).encode() + b"\n"
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        if url.path.rstrip("/") != "/aircraft":
+            self.send_error(404)
+            return
+
+        subscribe = parse_qs(url.query).get("subscribe", ["0"])[-1] == "1"
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson" if subscribe else "application/json")
+        if not subscribe:
+            self.send_header("Content-Length", str(len(published["body"])))
+        self.end_headers()
+        self.wfile.write(published["body"])
+        if not subscribe:
+            return
+
+        # One line per cycle until the client goes away
+        cycle = published["cycle"]
+        try:
+            while True:
+                with cycle_ready:
+                    cycle_ready.wait_for(lambda: published["cycle"] != cycle, timeout=STALE)
+                    if published["cycle"] == cycle:
+                        continue
+                    (cycle, body) = (published["cycle"], published["body"])
+                self.wfile.write(body)
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start():
+    "Serve the live table from a background thread (daemon)"
+    global httpd
+
+    try:
+        httpd = ThreadingHTTPServer((BIND, PORT), LiveHandler)
+    except OSError as e:
+        logger.warning(f"Live aircraft feed not started on {BIND}:{PORT}: {e}")
+        return None
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, name="ads-live", daemon=True).start()
+    logger.info(f"Live aircraft feed on {url()}")
+    return httpd
+
+
+def fetch():
+    "Current live table from the daemon"
+
+    r = requests.get(url(), timeout=5)
+    return r.json()["aircraft"]
+
+
+def subscribe():
+    "Yield the daemon's live table after every cycle"
+
+    with requests.get(url(), params={"subscribe": 1}, stream=True, timeout=(5, STALE * 2)) as r:
+        for line in r.iter_lines():
+            if line:
+                yield json.loads(line)["aircraft"]
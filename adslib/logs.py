@@ -0,0 +1,162 @@
+# Logging Pipeline
+#  - Handlers (file, console, JSON lines) run on a QueueListener thread, the daemon only enqueues records
+#  - Hot path messages use %-style arguments, records for disabled levels are never formatted
+#  - Optional JSON lines log carrying icao/flight/ptype/site as fields ([logging] json = ads-db.jsonl)
+#
+import json
+import time
+import queue
+import atexit
+import logging
+import tempfile
+from logging.handlers import QueueHandler, QueueListener
+
+FIELDS = ["icao", "flight", "ptype", "site"]
+
+listener = None
+
+
+class LazyQueueHandler(QueueHandler):
+    "Queue records as they are, formatting happens on the listener thread"
+
+    def prepare(self, record):
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    "One JSON object per record with the aircraft fields passed in extra"
+
+    def format(self, record):
+        entry = {
+            "time": record.created,
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for field in FIELDS:
+            value = getattr(record, field, None)
+            if value:
+                entry[field] = value
+        return json.dumps(entry)
+
+
+def fields(icao=None, flight=None, ptype=None, site=None):
+    "extra= fields for the JSON log"
+
+    return {"icao": icao, "flight": flight, "ptype": ptype, "site": site}
+
+
+def setup(logfile="ads-db.log", level=logging.INFO, console=True):
+    "Root logger writing through a queue to the log file (and console)"
+    global listener
+
+    logFormatter = logging.Formatter("%(asctime)s %(levelname)-8s %(message)s")
+    handlers = list()
+
+    fileHandler = logging.FileHandler(logfile)
+    fileHandler.setFormatter(logFormatter)
+    handlers.append(fileHandler)
+
+    if console:
+        consoleHandler = logging.StreamHandler()
+        consoleHandler.setFormatter(logFormatter)
+        handlers.append(consoleHandler)
+
+    records = queue.SimpleQueue()
+    listener = QueueListener(records, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(stop)
+
+    logger = logging.getLogger()
+    logger.addHandler(LazyQueueHandler(records))
+    logger.setLevel(level)
+    return logger
+
+
+def add_json(json_file):
+    "Also write JSON lines (daemon, [logging] json)"
+
+    handler = logging.FileHandler(json_file)
+    handler.setFormatter(JsonFormatter())
+    listener.handlers = listener.handlers + (handler,)
+    return handler
+
+
+def stop():
+    "Flush queued records (exit)"
+    global listener
+
+    if listener:
+        listener.stop()
+        listener = None
+
+
+def benchmark(cycles=50, planes=200):
+    "Logging cost per daemon cycle on the ingest thread: eager f-strings/sync file vs lazy/queued"
+
+    bench = logging.getLogger("ads-bench")
+    bench.propagate = False
+    formatter = logging.Formatter("%(asctime)s %(levelname)-8s %(message)s")
+    sample = [
+        (f"{i:06X}", f"DAL{i}", "B738", f"N{i}", "Delta Air Lines", 12.3 + i % 50, 35000, "127.0.0.1")
+        for i in range(planes)
+    ]
+
+    def eager():
+        for (n, (icao, ident, ptype, reg, owner, distance, altitude, site)) in enumerate(sample):
+            bench.debug(
+                f"Todays Plane  {ident:>7} ({ptype}) {'A3':<2} [{int(distance):>3}nm {'FL350':<5}] {ident:>7} {reg} {owner} {icao} site:{site}"
+            )
+            bench.debug(f"Local Flight OK {ident} (5%): KATL <-> KCHS")
+            if n % 20 == 0:
+                bench.info(
+                    f"New Plane {'737-800':>11} ({ptype:>4}) {'A3':<2} [{int(distance):>3}nm {'FL350':<5}] {ident:>7} {reg} US {owner} Boeing {icao} site:{site}"
+                )
+
+    def lazy():
+        for (n, (icao, ident, ptype, reg, owner, distance, altitude, site)) in enumerate(sample):
+            if bench.isEnabledFor(logging.DEBUG):
+                bench.debug(
+                    "Todays Plane  %7s (%s) %-2s [%3dnm %-5s] %7s %s %s %s site:%s",
+                    ident, ptype, "A3", distance, "FL350", ident, reg, owner, icao, site,
+                    extra=fields(icao, ident, ptype, site),
+                )
+            bench.debug("Local Flight OK %s (%s%%): %s <-> %s", ident, 5, "KATL", "KCHS")
+            if n % 20 == 0:
+                bench.info(
+                    "New Plane %11s (%4s) %-2s [%3dnm %-5s] %7s %s %s %s %s %s site:%s",
+                    "737-800", ptype, "A3", distance, "FL350", ident, reg, "US", owner, "Boeing", icao, site,
+                    extra=fields(icao, ident, ptype, site),
+                )
+
+    print(f"\nLogging overhead per cycle ({planes} planes, ingest thread)")
+    print(f"{'LEVEL':<8} {'F-STRING/SYNC':>14} {'LAZY/QUEUE':>12} {'JSON QUEUE':>12}")
+    print(f"{'-' * 8} {'-' * 14} {'-' * 12} {'-' * 12}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for level in [logging.INFO, logging.DEBUG]:
+            bench.setLevel(level)
+            results = list()
+            for (mode, json_lines) in [("sync", False), ("queue", False), ("queue", True)]:
+                handler = logging.FileHandler(f"{tmp}/bench-{mode}.log")
+                handler.setFormatter(JsonFormatter() if json_lines else formatter)
+                bench_listener = None
+                if mode == "sync":
+                    bench.addHandler(handler)
+                else:
+                    records = queue.SimpleQueue()
+                    bench_listener = QueueListener(records, handler)
+                    bench_listener.start()
+                    bench.addHandler(LazyQueueHandler(records))
+
+                start = time.perf_counter()
+                for i in range(cycles):
+                    eager() if mode == "sync" else lazy()
+                results.append((time.perf_counter() - start) / cycles * 1000)
+
+                if bench_listener:
+                    bench_listener.stop()
+                for h in list(bench.handlers):
+                    bench.removeHandler(h)
+                handler.close()
+
+            print(f"{logging.getLevelName(level):<8} {results[0]:>11.2f}ms {results[1]:>9.2f}ms {results[2]:>9.2f}ms")
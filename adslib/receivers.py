@@ -0,0 +1,183 @@
+# Receiver Health
+#  - Per-site state: consecutive failures, fetch latency percentiles, aircraft last received
+#  - A failing site backs off exponentially (refresh * 2^failures, up to MAX_BACKOFF) instead of
+#    costing a timeout every cycle, after OPEN_AFTER failures in a row the circuit opens and the
+#    site is only probed every PROBE seconds (never sooner than its last backoff) until it answers again
+#  - Adaptive refresh: poll faster while aircraft are close and low or descending, slower when empty
+#  - Health is served on the live feed port: GET /receivers
+#
+import time
+import logging
+import requests
+from collections import deque
+
+logger = logging.getLogger('ads-receivers')
+
+# Seconds to wait on a receiver
+TIMEOUT = 5
+
+# Backoff limit, failures before the circuit opens and seconds between probes of an open site
+MAX_BACKOFF = 120
+OPEN_AFTER = 5
+PROBE = 60
+
+# Adaptive refresh bounds (default refresh / 2 and refresh * 3)
+MIN_REFRESH = None
+MAX_REFRESH = None
+
+# Aircraft inside CLOSE_DISTANCE nm and below CLOSE_ALTITUDE ft (or descending) count as busy
+CLOSE_DISTANCE = 15
+CLOSE_ALTITUDE = 10000
+DESCENDING = -500
+BUSY = 2
+
+LATENCY_SAMPLES = 100
+
+sites = dict()
+
+
+def load_config(config):
+    "Receiver settings from the [receivers] config section"
+    global TIMEOUT, MAX_BACKOFF, OPEN_AFTER, PROBE, MIN_REFRESH, MAX_REFRESH, BUSY
+
+    if "receivers" not in config:
+        return
+    receivers = config["receivers"]
+    TIMEOUT = float(receivers.get("timeout", TIMEOUT))
+    MAX_BACKOFF = int(receivers.get("max_backoff", MAX_BACKOFF))
+    OPEN_AFTER = int(receivers.get("open_after", OPEN_AFTER))
+    PROBE = int(receivers.get("probe", PROBE))
+    BUSY = int(receivers.get("busy", BUSY))
+    if "min_refresh" in receivers:
+        MIN_REFRESH = float(receivers["min_refresh"])
+    if "max_refresh" in receivers:
+        MAX_REFRESH = float(receivers["max_refresh"])
+
+
+def url(site):
+    return f"http://{site}/skyaware/data/aircraft.json"
+
+
+def site_state(site):
+
+    if site not in sites:
+        sites[site] = {
+            "status": "up",
+            "failures": 0,
+            "fetches": 0,
+            "errors": 0,
+            "aircraft": 0,
+            "next_poll": 0,
+            "delay": 0,
+            "last_ok": None,
+            "last_error": None,
+            "latency": deque(maxlen=LATENCY_SAMPLES),
+        }
+    return sites[site]
+
+
+def due(site):
+    "Site is not backing off (or its probe is due)"
+
+    return time.time() >= site_state(site)["next_poll"]
+
+
+def fetch(site, refresh):
+    "Aircraft JSON from a receiver, None if it failed (and is now backing off)"
+
+    state = site_state(site)
+    start = time.perf_counter()
+    try:
+        r = requests.get(url(site), timeout=TIMEOUT)
+        r.raise_for_status()
+        planes = r.json()
+    except (requests.exceptions.RequestException, ValueError) as e:
+        failure(site, e, refresh)
+        return None
+
+    state["latency"].append(time.perf_counter() - start)
+    state["fetches"] += 1
+    state["aircraft"] = len(planes.get("aircraft", []))
+    state["last_ok"] = time.time()
+    if state["status"] != "up":
+        logger.warning(f"Receiver {site} recovered after {state['failures']} failures")
+    state["status"] = "up"
+    state["failures"] = 0
+    state["next_poll"] = 0
+    state["delay"] = 0
+    return planes
+
+
+def failure(site, error, refresh):
+    "Back off a failing site, open the circuit after OPEN_AFTER failures in a row"
+
+    state = site_state(site)
+    state["failures"] += 1
+    state["errors"] += 1
+    state["last_error"] = str(error)
+
+    if state["failures"] >= OPEN_AFTER:
+        # Probing must not poll a dead site more often than the backoff before it
+        delay = max(PROBE, state["delay"])
+        if state["status"] != "open":
+            logger.warning(f"Receiver {site} down, probing every {delay}s: {error}")
+        state["status"] = "open"
+    else:
+        delay = min(refresh * 2 ** state["failures"], MAX_BACKOFF)
+        if state["failures"] == 1:
+            logger.warning(f"Receiver {site} failed, backing off: {error}")
+        state["status"] = "backoff"
+    state["delay"] = delay
+    state["next_poll"] = time.time() + delay
+
+
+def percentile(values, p):
+
+    if not values:
+        return None
+    values = sorted(values)
+    return values[int(p * (len(values) - 1))]
+
+
+def next_refresh(refresh, aircraft):
+    "Seconds until the next cycle given the aircraft in range"
+
+    low = MIN_REFRESH or max(1, refresh / 2)
+    high = MAX_REFRESH or refresh * 3
+    if not aircraft:
+        return high
+
+    busy = 0
+    for a in aircraft:
+        altitude = a.get("altitude") or 0
+        if a.get("distance", 999) < CLOSE_DISTANCE and (
+            altitude < CLOSE_ALTITUDE or (a.get("baro_rate") or 0) < DESCENDING
+        ):
+            busy += 1
+    if busy >= BUSY:
+        return low
+    return refresh
+
+
+def health():
+    "Per-site health for /receivers"
+
+    now = time.time()
+    result = dict()
+    for (site, state) in sites.items():
+        latency = list(state["latency"])
+        result[site] = {
+            "status": state["status"],
+            "failures": state["failures"],
+            "fetches": state["fetches"],
+            "errors": state["errors"],
+            "aircraft": state["aircraft"],
+            "last_ok": state["last_ok"],
+            "last_error": state["last_error"],
+            "retry_in": round(max(0, state["next_poll"] - now), 1),
+            "latency_ms": {
+                p: round(percentile(latency, q) * 1000, 1) if latency else None
+                for (p, q) in [("p50", 0.5), ("p95", 0.95), ("p99", 0.99)]
+            },
+        }
+    return result
@@ -0,0 +1,210 @@
+# Plane Days Retention
+#  - Set-based squashing of aged plane_days into one entry per plane per period
+#  - Runs in bounded batches of planes with a checkpoint to resume after interruption
+#  - Tiered policy (daily -> weekly -> monthly) run by the daemon in small time slices
+#
+import time
+import logging
+from datetime import date, datetime, timedelta
+from .compact import period_sql
+from .constants import sql_create_maintenance_table
+
+logger = logging.getLogger('ads-retention')
+
+conn = None
+
+# Planes per transaction
+BATCH_SIZE = 500
+
+# Only squash planes with more plane days than this
+MIN_DAYS = 100
+
+# Daemon time slices: planes per batch, seconds per quiet cycle, max planes in view when quiet
+SLICE_BATCH = 50
+time_slice = 0.5
+quiet_planes = 30
+
+# Tiers [(days, period)] in order, eg weekly after 90 days then monthly after 730
+tiers = list()
+PERIODS = {"weekly": "week", "monthly": "month"}
+
+# Daemon progress
+state = {"tier": 0, "reclaimed": 0, "idle_until": None}
+
+sql_create_squash_tables = [
+    "CREATE TEMP TABLE IF NOT EXISTS squash_planes (icao)",
+    "CREATE TEMP TABLE IF NOT EXISTS squash_days (icao, day, ident, n, lastseen, lowest_altitude, count)",
+    "CREATE INDEX IF NOT EXISTS temp.squash_days_idx ON squash_days(icao, day, ident)",
+]
+
+
+def get_checkpoint(name):
+    "Last saved value for a maintenance task (None if not started)"
+
+    cur = conn.cursor()
+    cur.execute(sql_create_maintenance_table)
+    row = cur.execute("SELECT value FROM maintenance WHERE name = ?", (name,)).fetchone()
+    if row:
+        return row[0]
+    return None
+
+
+def set_checkpoint(name, value):
+    "Save maintenance task progress (inside the current transaction)"
+
+    cur = conn.cursor()
+    if value is None:
+        cur.execute("DELETE FROM maintenance WHERE name = ?", (name,))
+    else:
+        cur.execute(
+            "INSERT INTO maintenance(name, value, lastseen) VALUES(?, ?, ?) ON CONFLICT(name) DO UPDATE SET value = excluded.value, lastseen = excluded.lastseen",
+            (name, value, datetime.now()),
+        )
+
+
+def squash_batch(cutoff, period="week", after=None, batch=BATCH_SIZE, min_days=MIN_DAYS):
+    "Squash plane days before cutoff for the next batch of planes: (last icao, rows deleted)"
+
+    cur = conn.cursor()
+    for sql in sql_create_squash_tables:
+        cur.execute(sql)
+    cur.execute("DELETE FROM temp.squash_planes")
+    cur.execute("DELETE FROM temp.squash_days")
+
+    # Next batch of planes with enough days to squash (raw icao values)
+    if after is None:
+        cur.execute(
+            "INSERT INTO temp.squash_planes SELECT icao FROM plane_days GROUP BY icao HAVING COUNT(*) > ? ORDER BY icao LIMIT ?",
+            (min_days, batch),
+        )
+    else:
+        cur.execute(
+            "INSERT INTO temp.squash_planes SELECT icao FROM plane_days WHERE icao > ? GROUP BY icao HAVING COUNT(*) > ? ORDER BY icao LIMIT ?",
+            (after, min_days, batch),
+        )
+    (last,) = cur.execute("SELECT MAX(icao) FROM temp.squash_planes").fetchone()
+    if last is None:
+        return (None, 0)
+
+    # First entry of each period keeps the period's lastseen and lowest altitude
+    cur.execute(
+        f"""INSERT INTO temp.squash_days
+            SELECT icao, day, ident, ROW_NUMBER() OVER w, MAX(lastseen) OVER p, MIN(NULLIF(lowest_altitude, 0)) OVER p, COUNT(*) OVER p
+            FROM plane_days WHERE icao IN (SELECT icao FROM temp.squash_planes) AND day < ?
+            WINDOW p AS (PARTITION BY icao, {period_sql(period)}), w AS (p ORDER BY day, ident)""",
+        (cutoff,),
+    )
+    cur.execute(
+        """UPDATE plane_days SET
+            lastseen = (SELECT s.lastseen FROM temp.squash_days s WHERE s.icao = plane_days.icao AND s.day = plane_days.day AND s.ident = plane_days.ident),
+            lowest_altitude = COALESCE((SELECT s.lowest_altitude FROM temp.squash_days s WHERE s.icao = plane_days.icao AND s.day = plane_days.day AND s.ident = plane_days.ident), lowest_altitude)
+            WHERE (icao, day, ident) IN (SELECT icao, day, ident FROM temp.squash_days WHERE n = 1 AND count > 1)"""
+    )
+    cur.execute(
+        "DELETE FROM plane_days WHERE (icao, day, ident) IN (SELECT icao, day, ident FROM temp.squash_days WHERE n > 1)"
+    )
+
+    return (last, cur.rowcount)
+
+
+def squash_plane_days(cutoff, period="week", name="cleanup", batch=BATCH_SIZE, min_days=MIN_DAYS):
+    "Squash all plane days before cutoff into one entry per period, resuming from the last checkpoint"
+
+    after = get_checkpoint(name)
+    if after is not None:
+        print("Resuming", name, "after", after)
+
+    start = time.time()
+    total = 0
+    while True:
+        (after, deleted) = squash_batch(cutoff, period=period, after=after, batch=batch, min_days=min_days)
+        set_checkpoint(name, after)
+        conn.commit()
+        if after is None:
+            break
+
+        total += deleted
+        elapsed = time.time() - start
+        print(f"Squashed {total:,} plane days to {after} ({round(total / max(elapsed, 0.001)):,} rows/sec)")
+
+    elapsed = time.time() - start
+    print(f"TOTAL DELETE {total:,} in {elapsed:.1f}s ({round(total / max(elapsed, 0.001)):,} rows/sec)")
+    return total
+
+
+def load_config(config):
+    "Retention tiers and time slices from the [retention] config section"
+    global time_slice, quiet_planes
+
+    tiers.clear()
+    if "retention" not in config:
+        return tiers
+
+    for (key, period) in PERIODS.items():
+        if key in config["retention"]:
+            tiers.append((int(config["retention"][key]), period))
+    tiers.sort()
+    if "time_slice" in config["retention"]:
+        time_slice = float(config["retention"]["time_slice"])
+    if "quiet_planes" in config["retention"]:
+        quiet_planes = int(config["retention"]["quiet_planes"])
+
+    for (days, period) in tiers:
+        logger.debug(f"Retention: {period}ly plane days after {days} days")
+    return tiers
+
+
+def run_slice(plane_count=0):
+    "Run retention batches for one time slice during quiet daemon cycles (rows deleted)"
+
+    now = datetime.now()
+    if not tiers or plane_count > quiet_planes:
+        return 0
+    if state["idle_until"] and now < state["idle_until"]:
+        return 0
+
+    deadline = time.time() + time_slice
+    deleted = 0
+    while time.time() < deadline:
+        (days, period) = tiers[state["tier"]]
+        name = f"retention_{period}"
+        cutoff = date.today() - timedelta(days=days)
+        (after, count) = squash_batch(
+            cutoff, period=period, after=get_checkpoint(name), batch=SLICE_BATCH, min_days=1
+        )
+        set_checkpoint(name, after)
+        deleted += count
+
+        # Tier pass complete, move on or idle until tomorrow
+        if after is None:
+            logger.info(f"Retention {period}ly pass complete: {state['reclaimed'] + deleted:,} plane days reclaimed")
+            state["tier"] += 1
+            if state["tier"] >= len(tiers):
+                state["tier"] = 0
+                state["idle_until"] = datetime.combine(date.today() + timedelta(days=1), datetime.min.time())
+                break
+
+    if deleted:
+        state["reclaimed"] += deleted
+        reclaimed = get_checkpoint("retention_reclaimed") or 0
+        set_checkpoint("retention_reclaimed", reclaimed + deleted)
+        logger.debug(f"Retention slice: {deleted:,} plane days reclaimed ({state['reclaimed']:,} since start)")
+    return deleted
+
+
+def print_status():
+    "Print maintenance task progress"
+
+    cur = conn.cursor()
+    try:
+        rows = cur.execute("SELECT name, value, lastseen FROM maintenance ORDER BY name").fetchall()
+    except Exception:
+        return
+
+    if rows:
+        print(" Maintenance:")
+    for (name, value, lastseen) in rows:
+        last = str(lastseen).split(".")[0]
+        if isinstance(value, int) and name.endswith("_reclaimed"):
+            value = f"{value:,}"
+        print(f"   {name:<22} {value:<12} [{last}]")
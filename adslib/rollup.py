@@ -0,0 +1,205 @@
+# Traffic Rollups
+#  - Hourly and daily counts of distinct airframes and flights by type/category/military/owner
+#  - The daemon tracks the current hour and day in memory and upserts them each save cycle,
+#    on start it reloads them from plane_days so a restart doesn't undercount the current hour/day
+#  - Reports group the daily rollups by week/month/year without reading plane_days
+#
+import time
+import sqlite3
+import logging
+from datetime import datetime, timedelta
+from .archive import plane_days_table
+from .compact import period_sql
+from .constants import sql_create_rollup_hours_table, sql_create_rollup_days_table
+
+logger = logging.getLogger('ads-rollup')
+
+conn = None
+
+# (bucket, ptype, category, military, owner) -> (icaos, flights) for the current hour/day
+hours = dict()
+days = dict()
+
+# Default report range by period
+REPORT_HOURS = {"hour": 48, "day": 24 * 30, "week": 24 * 365}
+
+sql_upsert_rollup = """INSERT INTO {table}({bucket}, ptype, category, military, owner, planes, flights)
+                        VALUES(?, ?, ?, ?, ?, ?, ?)
+                        ON CONFLICT({bucket}, ptype, category, military, owner) DO UPDATE SET
+                            planes = MAX(planes, excluded.planes),
+                            flights = MAX(flights, excluded.flights)"""
+
+
+def create_tables():
+
+    cur = conn.cursor()
+    cur.execute(sql_create_rollup_hours_table)
+    cur.execute(sql_create_rollup_days_table)
+
+
+def record(icao, ident, ptype, category, military, owner, now=None):
+    "Count an airframe (and flight) seen in the current hour and day"
+
+    if not now:
+        now = datetime.now()
+    key = (ptype or "", category or "", military or "", owner or "")
+    for (buckets, bucket) in [
+        (hours, now.replace(minute=0, second=0, microsecond=0)),
+        (days, now.date()),
+    ]:
+        if (bucket, *key) not in buckets:
+            buckets[(bucket, *key)] = (set(), set())
+        (icaos, flights) = buckets[(bucket, *key)]
+        icaos.add(icao)
+        if ident:
+            flights.add(ident)
+
+
+def load_current(now=None):
+    "Reload the current hour and day from plane_days (daemon start, flush keeps the larger count)"
+
+    if not now:
+        now = datetime.now()
+    hour = now.replace(minute=0, second=0, microsecond=0)
+    cur = conn.cursor()
+    rows = cur.execute(
+        """SELECT pd.icao, pd.ident, pd.lastseen, p.ptype, p.category, p.military, p.owner
+            FROM plane_days pd JOIN planes p ON p.icao = pd.icao WHERE pd.day = ?""",
+        (now.date(),),
+    )
+    count = 0
+    for (icao, ident, lastseen, ptype, category, military, owner) in rows:
+        count += 1
+        key = (ptype or "", category or "", military or "", owner or "")
+        targets = [(days, now.date())]
+        if lastseen and lastseen >= hour:
+            targets.append((hours, hour))
+        for (buckets, bucket) in targets:
+            (icaos, flights) = buckets.setdefault((bucket, *key), (set(), set()))
+            icaos.add(icao)
+            if ident:
+                flights.add(ident)
+    logger.debug(f"Reloaded current rollups from {count:,} plane days")
+
+
+def flush():
+    "Upsert current rollups and drop finished hours/days (daemon save cycle)"
+
+    if not hours and not days:
+        return
+
+    now = datetime.now()
+    cur = conn.cursor()
+    create_tables()
+    for (table, bucket, buckets, current) in [
+        ("rollup_hours", "hour", hours, now.replace(minute=0, second=0, microsecond=0)),
+        ("rollup_days", "day", days, now.date()),
+    ]:
+        cur.executemany(
+            sql_upsert_rollup.format(table=table, bucket=bucket),
+            [(*key, len(icaos), len(flights)) for (key, (icaos, flights)) in buckets.items()],
+        )
+        for key in [key for key in buckets if key[0] != current]:
+            del buckets[key]
+
+
+def rebuild_days(since=None):
+    "Backfill daily rollups from plane_days (planes seen with a flight ident)"
+
+    start = time.time()
+    cur = conn.cursor()
+    create_tables()
+    where = ""
+    params = list()
+    if since:
+        where = "WHERE pd.day >= ?"
+        params.append(since)
+
+    cur.execute(
+        f"""INSERT INTO rollup_days(day, ptype, category, military, owner, planes, flights)
+            SELECT pd.day, COALESCE(p.ptype, ''), COALESCE(p.category, ''), COALESCE(p.military, ''), COALESCE(p.owner, ''),
+                COUNT(DISTINCT pd.icao), COUNT(DISTINCT NULLIF(pd.ident, ''))
+            FROM {plane_days_table()} pd JOIN planes p ON p.icao = pd.icao {where}
+            GROUP BY 1, 2, 3, 4, 5 ORDER BY 1
+            ON CONFLICT(day, ptype, category, military, owner) DO UPDATE SET
+                planes = MAX(planes, excluded.planes),
+                flights = MAX(flights, excluded.flights)""",
+        params,
+    )
+    conn.commit()
+    logger.warning(f"Rebuilt {cur.rowcount:,} daily rollups in {time.time() - start:.1f}s")
+
+
+def report(period="day", ptype=None, owner=None, military=False, cat_min=0, hours_ago=0):
+    "Print airframe and flight counts per period from the rollup tables"
+
+    cur = conn.cursor()
+    if not hours_ago:
+        hours_ago = REPORT_HOURS.get(period, 0)
+
+    where = list()
+    params = list()
+    if ptype:
+        where.append("ptype LIKE ?")
+        params.append(ptype)
+    if owner:
+        where.append("owner LIKE ?")
+        params.append(owner)
+    if military:
+        where.append("military = 'M'")
+    if cat_min:
+        where.append("category BETWEEN ? AND 'A5'")
+        params.append(f"A{cat_min}")
+
+    if period == "hour":
+        bucket = "hour"
+        table = "rollup_hours"
+        group = "hour"
+        if hours_ago:
+            where.append("hour >= ?")
+            params.append((datetime.now() - timedelta(hours=hours_ago)).replace(minute=0, second=0, microsecond=0))
+    else:
+        bucket = "day"
+        table = "rollup_days"
+        group = period_sql(period)
+        if hours_ago:
+            where.append("day >= ?")
+            # Days overlapping the window, -fh 36 includes the day 36 hours ago
+            params.append((datetime.now() - timedelta(hours=hours_ago)).date())
+
+    sql_where = ""
+    if where:
+        sql_where = "WHERE " + " AND ".join(where)
+    btype = "timestamp" if bucket == "hour" else "date"
+    try:
+        rows = cur.execute(
+            f"""SELECT MIN({bucket}) AS "start [{btype}]", SUM(planes), SUM(flights)
+                FROM {table} {sql_where} GROUP BY {group} ORDER BY 1""",
+            params,
+        ).fetchall()
+    except sqlite3.OperationalError as e:
+        logger.critical(f"No traffic rollups ({e}), run the daemon or --rebuild_rollups")
+        return list()
+
+    # Weeks and longer sum the daily counts (airframe days)
+    label = "PLANES" if period in ["hour", "day"] else "PLANE DAYS"
+    print("")
+    print(f"{period.upper():<16} {label:>10} {'FLIGHTS':>10}")
+    print(f"{'-' * 16} {'-' * 10} {'-' * 10}")
+    total = 0
+    for (start, planes, flights) in rows:
+        total += planes
+        if period == "hour":
+            name = start.strftime("%Y-%m-%d %H:00")
+        elif period == "week":
+            name = str(start - timedelta(days=start.weekday()))
+        elif period == "month":
+            name = start.strftime("%Y-%m")
+        elif period == "year":
+            name = str(start.year)
+        else:
+            name = str(start)
+        print(f"{name:<16} {planes:>10,} {flights:>10,}")
+
+    print(f"\nTotal: {total:,}")
+    return rows
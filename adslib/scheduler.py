@@ -0,0 +1,130 @@
+# Cycle Scheduler
+#  - Fixed-rate daemon cycles: each cycle starts one period after the previous cycle's start,
+#    so processing time no longer stretches the real period as traffic grows
+#  - A cycle running over its budget (BUDGET of the period) is an overrun, after OVERRUNS in a row
+#    the following cycles shed one more non-critical stage in SHED_ORDER until cycles fit again
+#    (one slow cycle, eg the save_cycle commit, sheds nothing)
+#  - Shed stages come back one at a time after RECOVER cycles in a row well under budget
+#  - Persistence (planes, plane days, flights) and safety alerts (emergency squawks) always run
+#  - Cycle timing and shed stages are served on the live feed port: GET /scheduler
+#
+import time
+import logging
+from collections import deque
+
+logger = logging.getLogger('ads-scheduler')
+
+# First shed first: plane type aggregate refresh, route lookups (StandingData, FlightAware), debug logging
+SHED_ORDER = ["ptypes", "routes", "debug"]
+
+# Fraction of the period a cycle may use, consecutive overruns before shedding,
+# consecutive cycles under half the budget before restoring a stage
+BUDGET = 0.8
+OVERRUNS = 3
+RECOVER = 5
+
+CYCLE_SAMPLES = 100
+
+state = {
+    "target": None,
+    "start": None,
+    "period": None,
+    "cycles": 0,
+    "overruns": 0,
+    "shed": 0,
+    "late": 0,
+    "under": 0,
+    "log_level": None,
+    "elapsed": deque(maxlen=CYCLE_SAMPLES),
+}
+
+
+def load_config(config):
+    "Scheduler settings from the [scheduler] config section"
+    global BUDGET, OVERRUNS, RECOVER
+
+    if "scheduler" not in config:
+        return
+    BUDGET = float(config["scheduler"].get("budget", BUDGET))
+    OVERRUNS = int(config["scheduler"].get("overruns", OVERRUNS))
+    RECOVER = int(config["scheduler"].get("recover", RECOVER))
+
+
+def enabled(stage):
+    "Stage is not being shed"
+
+    return stage not in SHED_ORDER[: state["shed"]]
+
+
+def start_cycle():
+
+    state["start"] = time.monotonic()
+    if state["target"] is None:
+        state["target"] = state["start"]
+
+
+def end_cycle(period):
+    "Record the cycle, adjust shedding and return seconds to sleep until the next cycle"
+
+    now = time.monotonic()
+    elapsed = now - state["start"]
+    state["cycles"] += 1
+    state["period"] = period
+    state["elapsed"].append(elapsed)
+
+    if elapsed > period * BUDGET:
+        state["overruns"] += 1
+        state["late"] += 1
+        state["under"] = 0
+        if state["late"] >= OVERRUNS and state["shed"] < len(SHED_ORDER):
+            state["late"] = 0
+            shed(state["shed"] + 1)
+            logger.warning(
+                f"Cycle overrun {elapsed:.2f}s of {period:.1f}s, shedding {SHED_ORDER[state['shed'] - 1]}"
+            )
+    elif elapsed < period * BUDGET / 2 and state["shed"]:
+        state["late"] = 0
+        state["under"] += 1
+        if state["under"] >= RECOVER:
+            state["under"] = 0
+            logger.info(f"Cycles back under budget, restoring {SHED_ORDER[state['shed'] - 1]}")
+            shed(state["shed"] - 1)
+    else:
+        # Within budget but not well under: neither run continues
+        state["late"] = 0
+        state["under"] = 0
+
+    # Fixed rate, a late cycle starts the next one immediately rather than trying to catch up
+    state["target"] += period
+    if state["target"] < now:
+        state["target"] = now
+    return state["target"] - now
+
+
+def shed(level):
+    "Shed the first level stages (debug logging is shed by raising the root log level)"
+
+    state["shed"] = level
+    root = logging.getLogger()
+    if not enabled("debug"):
+        if state["log_level"] is None:
+            state["log_level"] = root.level
+        root.setLevel(max(root.level, logging.INFO))
+    elif state["log_level"] is not None:
+        root.setLevel(state["log_level"])
+        state["log_level"] = None
+
+
+def health():
+    "Cycle timing for /scheduler"
+
+    elapsed = sorted(state["elapsed"])
+    return {
+        "period": state["period"],
+        "cycles": state["cycles"],
+        "overruns": state["overruns"],
+        "shed": SHED_ORDER[: state["shed"]],
+        "last_ms": round(state["elapsed"][-1] * 1000, 1) if elapsed else None,
+        "p50_ms": round(elapsed[len(elapsed) // 2] * 1000, 1) if elapsed else None,
+        "max_ms": round(elapsed[-1] * 1000, 1) if elapsed else None,
+    }
@@ -0,0 +1,168 @@
+# Full Text Search
+#  - FTS5 shadow indexes over planes (owner, model, registration, ident, country)
+#    and plane_types (manufacturer, model), kept in sync by triggers
+#  - Lookup LIKE patterns become anchored phrase/prefix queries (air force% -> ^"air force"*) that
+#    narrow the rows, the LIKE still decides the match so results are the same as without FTS
+#  - Other patterns with 3 or more characters between wildcards (%Delta%, %737) use trigram
+#    indexes (SQLite 3.34+), which answer LIKE directly, shorter ones stay plain LIKE scans
+#  - Falls back to LIKE until built with --build_fts
+#
+import re
+import time
+import sqlite3
+import logging
+from . import compact
+
+logger = logging.getLogger('ads-search')
+
+conn = None
+
+PLANES_COLUMNS = ["owner", "model", "registration", "ident", "country"]
+TYPES_COLUMNS = ["manufacturer", "model"]
+
+# Set when the FTS (and trigram) tables exist
+enabled = False
+trigram = False
+
+# Trigram tokenizer (and LIKE on it) needs SQLite 3.34
+TRIGRAM_VERSION = (3, 34)
+
+
+def planes_rowid():
+    "Integer key shared by planes and planes_fts (icao on compact databases)"
+
+    if compact.enabled:
+        return "icao"
+    return "rowid"
+
+
+def fts_tables(table, fts, columns, rowid, tokenize="unicode61 tokenchars '-'"):
+    "FTS5 external content table and sync triggers for a table"
+
+    cols = ", ".join(columns)
+    new = ", ".join(f"new.{c}" for c in columns)
+    old = ", ".join(f"old.{c}" for c in columns)
+    changed = " OR ".join(f"old.{c} IS NOT new.{c}" for c in columns)
+    return [
+        f"""CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({cols}, content='{table}', content_rowid='{rowid}',
+            tokenize="{tokenize}")""",
+        f"""CREATE TRIGGER IF NOT EXISTS {fts}_insert AFTER INSERT ON {table} BEGIN
+            INSERT INTO {fts}(rowid, {cols}) VALUES (new.{rowid}, {new});
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {fts}_delete AFTER DELETE ON {table} BEGIN
+            INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.{rowid}, {old});
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {fts}_update AFTER UPDATE OF {cols} ON {table} WHEN {changed} BEGIN
+            INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.{rowid}, {old});
+            INSERT INTO {fts}(rowid, {cols}) VALUES (new.{rowid}, {new});
+        END""",
+    ]
+
+
+def build():
+    "Create (or rebuild) the FTS and trigram indexes and triggers"
+    global enabled, trigram
+
+    start = time.time()
+    cur = conn.cursor()
+    indexes = [("planes", PLANES_COLUMNS, planes_rowid()), ("plane_types", TYPES_COLUMNS, "rowid")]
+    suffixes = ["fts"]
+    if sqlite3.sqlite_version_info >= TRIGRAM_VERSION:
+        suffixes.append("trigram")
+    else:
+        logger.warning(f"SQLite {sqlite3.sqlite_version} has no trigram indexes, %contains% lookups stay LIKE scans")
+
+    for suffix in suffixes:
+        tokenize = "trigram" if suffix == "trigram" else "unicode61 tokenchars '-'"
+        for (table, columns, rowid) in indexes:
+            for sql in fts_tables(table, f"{table}_{suffix}", columns, rowid, tokenize):
+                cur.execute(sql)
+            cur.execute(f"INSERT INTO {table}_{suffix}({table}_{suffix}) VALUES('rebuild')")
+    conn.commit()
+    enabled = True
+    trigram = "trigram" in suffixes
+    logger.warning(f"Built full text search indexes in {time.time() - start:.1f}s")
+
+
+def setup():
+    "Use FTS (and trigram) indexes for lookups if they exist"
+    global enabled, trigram
+
+    cur = conn.cursor()
+    cur.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name IN ('planes_fts', 'planes_trigram')")
+    tables = {name for (name,) in cur.fetchall()}
+    enabled = "planes_fts" in tables
+    trigram = enabled and "planes_trigram" in tables
+    return enabled
+
+
+def fts_query(pattern):
+    "LIKE pattern to an FTS5 phrase query matching at least the same rows (None if FTS can't narrow it)"
+
+    if pattern.startswith(("%", "_")) or "_" in pattern:
+        return None
+    prefix = pattern.endswith("%")
+    words = pattern.rstrip("%")
+    if "%" in words:
+        return None
+
+    # A quote splits tokens like any other separator
+    words = words.replace('"', " ").split()
+    if not words:
+        return None
+    return '^"' + " ".join(words) + '"' + ("*" if prefix else "")
+
+
+def trigram_like(pattern):
+    "Pattern has a run of 3 characters a trigram index can look up"
+
+    return any(len(run) >= 3 for run in re.split(r"[%_]", pattern))
+
+
+def match_sql(column, pattern, table="planes"):
+    "WHERE clause and named parameters for a LIKE lookup, narrowed by an FTS or trigram match when available"
+
+    query = None
+    if enabled:
+        query = fts_query(pattern)
+    rowid = planes_rowid() if table == "planes" else "rowid"
+    if not query:
+        if trigram and trigram_like(pattern):
+            return (
+                f"{rowid} IN (SELECT rowid FROM {table}_trigram WHERE {column} LIKE :{column}) AND {column} LIKE :{column}",
+                {column: pattern},
+            )
+        return (f"{column} LIKE :{column}", {column: pattern})
+
+    return (
+        f"{rowid} IN (SELECT rowid FROM {table}_fts WHERE {table}_fts MATCH :{column}_fts) AND {column} LIKE :{column}",
+        {column: pattern, f"{column}_fts": f"{column} : ({query})"},
+    )
+
+
+def benchmark(patterns, repeat=5):
+    "Compare LIKE scans with FTS matches for lookup patterns"
+
+    cur = conn.cursor()
+    if not enabled:
+        logger.critical("Full text search indexes not built (--build_fts)")
+        return
+
+    print(f"\n{'COLUMN':<14} {'PATTERN':<16} {'LIKE ms':>9} {'ROWS':>7} {'FTS ms':>9} {'ROWS':>7}")
+    print(f"{'-' * 14} {'-' * 16} {'-' * 9} {'-' * 7} {'-' * 9} {'-' * 7}")
+    for (table, column, pattern) in patterns:
+        results = list()
+        for use_fts in [False, True]:
+            (where, params) = (f"{column} LIKE :{column}", {column: pattern})
+            if use_fts:
+                (where, params) = match_sql(column, pattern, table=table)
+                if where == f"{column} LIKE :{column}":
+                    results.append((0, "-"))
+                    continue
+            start = time.perf_counter()
+            for i in range(repeat):
+                rows = cur.execute(f"SELECT COUNT(*) FROM {table} WHERE {where}", params).fetchone()[0]
+            results.append(((time.perf_counter() - start) / repeat * 1000, rows))
+
+        ((like_ms, like_rows), (fts_ms, fts_rows)) = results
+        print(f"{column:<14} {pattern:<16} {like_ms:>9.2f} {like_rows:>7} {fts_ms:>9.2f} {fts_rows:>7}")
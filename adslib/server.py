@@ -0,0 +1,280 @@
+# Query Server
+#  - Local HTTP endpoints returning lookups and stats as JSON (./ads-db.py --serve)
+#  - Requests share a pool of read-only connections (WAL readers never block the daemon)
+#  - Responses are cached (LRU) until PRAGMA data_version shows another connection committed,
+#    relative time queries (hours=, /stats) also expire after WINDOW seconds as their window moves
+#
+#  GET /stats
+#  GET /planes?type=B77%&owner=&military=1&cat=3&a0=0&low=&days=&hours=&limit=&offset=
+#  GET /planes/<icao>           plane and its plane days
+#  GET /ident/<ident>           planes by ident (LIKE pattern)
+#  GET /registration/<reg>      planes by registration (LIKE pattern)
+#  GET /flights?flight=DAL%&hours=&low=&route=&airport=&limit=&offset=
+#  GET /types?type=B7%&mfr=&hours=&limit=&offset=
+#
+import time
+import queue
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+from .compact import icao_key
+from .export import json_encode
+from .helpers import connect_read_only, flights_where, page_sql, planes_where
+from . import search, stats
+
+logger = logging.getLogger('ads-server')
+
+PORT = 8090
+BIND = "127.0.0.1"
+POOL_SIZE = 4
+CACHE_SIZE = 256
+
+# Seconds a relative time response is reused
+WINDOW = 60
+
+# Row limit when a request doesn't give one
+MAX_ROWS = 1000
+
+# Seconds to wait on a pool connection or a locked database
+TIMEOUT = 5
+
+pool = queue.Queue()
+cache = OrderedDict()
+cache_lock = threading.Lock()
+state = {"version": None, "hits": 0, "misses": 0}
+version_conn = None
+
+
+def connect(db_file):
+    "Read-only connection usable from the request threads"
+
+    return connect_read_only(db_file, timeout=TIMEOUT, check_same_thread=False)
+
+
+def load_config(config):
+    "Server settings from the [server] config section"
+    global PORT, BIND, POOL_SIZE, CACHE_SIZE, WINDOW
+
+    if "server" not in config:
+        return
+    PORT = int(config["server"].get("port", PORT))
+    BIND = config["server"].get("bind", BIND)
+    POOL_SIZE = int(config["server"].get("pool", POOL_SIZE))
+    CACHE_SIZE = int(config["server"].get("cache", CACHE_SIZE))
+    WINDOW = int(config["server"].get("window", WINDOW))
+
+
+def data_version():
+    "Bumps whenever another connection (the daemon) commits"
+
+    with cache_lock:
+        (version,) = version_conn.execute("PRAGMA data_version").fetchone()
+        if version != state["version"]:
+            cache.clear()
+            state["version"] = version
+    return version
+
+
+def cache_key(path, query):
+    "Responses for relative time queries are keyed by the WINDOW they were run in"
+
+    key = (path, tuple(sorted(query.items())))
+    if "hours" in query or path.strip("/") == "stats":
+        key += (int(time.time() // WINDOW),)
+    return key
+
+
+def cache_get(key):
+
+    with cache_lock:
+        if key in cache:
+            cache.move_to_end(key)
+            state["hits"] += 1
+            return cache[key]
+        state["misses"] += 1
+    return None
+
+
+def cache_put(key, version, body):
+
+    with cache_lock:
+        if version != state["version"]:
+            return
+        cache[key] = body
+        if len(cache) > CACHE_SIZE:
+            cache.popitem(last=False)
+
+
+def fetch_rows(cur):
+
+    columns = [d[0] for d in cur.description]
+    return [dict(zip(columns, row)) for row in cur]
+
+
+def page(query):
+    return page_sql(query.get("limit", MAX_ROWS), query.get("offset"))
+
+
+def get_stats(db, query):
+
+    (values, updated) = stats.get_stats(db, read_only=True)
+    return {"stats": values, "updated": updated}
+
+
+def get_planes(db, query):
+
+    (where, params) = planes_where(
+        query.get("type", "%"),
+        count=int(query.get("days", 0)),
+        cat_min=int(query.get("cat", 0)),
+        low_alt=int(query.get("low", 0)),
+        no_a0=query.get("a0") == "0",
+        military=query.get("military") == "1",
+        hours=float(query.get("hours", 0)),
+        owner=query.get("owner"),
+    )
+    cur = db.execute(f"SELECT * FROM planes WHERE {where} ORDER BY lastseen DESC{page(query)}", params)
+    return {"planes": fetch_rows(cur)}
+
+
+def get_plane(db, query, icao):
+
+    planes = fetch_rows(db.execute("SELECT * FROM planes WHERE icao = ?", (icao_key(icao),)))
+    days = fetch_rows(
+        db.execute(
+            f"SELECT * FROM plane_days WHERE icao = ? ORDER BY lastseen DESC{page(query)}", (icao_key(icao),)
+        )
+    )
+    return {"plane": planes[0] if planes else None, "plane_days": days}
+
+
+def get_planes_by(column):
+    "Planes by ident or registration pattern"
+
+    def get(db, query, value):
+        (where, params) = search.match_sql(column, value)
+        cur = db.execute(f"SELECT * FROM planes WHERE {where} ORDER BY lastseen DESC{page(query)}", params)
+        return {"planes": fetch_rows(cur)}
+
+    return get
+
+
+def get_flights(db, query):
+
+    (where, params) = flights_where(
+        query.get("flight", "%"),
+        hours=float(query.get("hours", 0)),
+        low_alt=int(query.get("low", 0)),
+        route_distance=int(query.get("route", 0)),
+        airport=query.get("airport"),
+    )
+    cur = db.execute(f"SELECT * FROM flights WHERE {where} ORDER BY lastseen DESC{page(query)}", params)
+    return {"flights": fetch_rows(cur)}
+
+
+def get_types(db, query):
+
+    where = "ptype LIKE :ptype"
+    params = {"ptype": query.get("type", "%")}
+    if query.get("mfr"):
+        (where, params) = search.match_sql("manufacturer", query["mfr"], table="plane_types")
+    if query.get("hours"):
+        where += " AND lastseen >= :hours_ago"
+        params["hours_ago"] = datetime.now() - timedelta(hours=float(query["hours"]))
+    cur = db.execute(f"SELECT * FROM plane_types WHERE {where} ORDER BY count DESC{page(query)}", params)
+    return {"types": fetch_rows(cur)}
+
+
+# Path -> handler (a second path part is passed as the last argument)
+ROUTES = {
+    "stats": get_stats,
+    "planes": get_planes,
+    "flights": get_flights,
+    "types": get_types,
+}
+ITEM_ROUTES = {
+    "planes": get_plane,
+    "ident": get_planes_by("ident"),
+    "registration": get_planes_by("registration"),
+}
+
+
+def run_query(path, query):
+    "JSON response body for a request path (None if not found)"
+
+    parts = [unquote(p) for p in path.strip("/").split("/")]
+    if len(parts) == 1 and parts[0] in ROUTES:
+        (handler, args) = (ROUTES[parts[0]], [])
+    elif len(parts) == 2 and parts[0] in ITEM_ROUTES:
+        (handler, args) = (ITEM_ROUTES[parts[0]], [parts[1]])
+    else:
+        return None
+
+    db = pool.get(timeout=TIMEOUT)
+    try:
+        return json_encode(handler(db, query, *args)).encode()
+    finally:
+        pool.put(db)
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        start = time.perf_counter()
+        url = urlsplit(self.path)
+        query = {k: v[-1] for (k, v) in parse_qs(url.query).items()}
+        key = cache_key(url.path, query)
+
+        status = 200
+        version = data_version()
+        body = cache_get(key)
+        cached = body is not None
+        try:
+            if not cached:
+                body = run_query(url.path, query)
+                if body is None:
+                    (status, body) = (404, b'{"error": "not found"}')
+                else:
+                    cache_put(key, version, body)
+        except ValueError as e:
+            (status, body) = (400, json_encode({"error": str(e)}).encode())
+        except (queue.Empty, sqlite3.OperationalError) as e:
+            (status, body) = (503, json_encode({"error": str(e)}).encode())
+
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        logger.debug(
+            f"{self.path} {status} {len(body):,}b {(time.perf_counter() - start) * 1000:.1f}ms{' cached' if cached else ''}"
+        )
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(db_file, port=None):
+    "Run the query server until interrupted"
+    global version_conn
+
+    version_conn = connect(db_file)
+    for i in range(POOL_SIZE):
+        pool.put(connect(db_file))
+
+    httpd = ThreadingHTTPServer((BIND, port or PORT), QueryHandler)
+    httpd.daemon_threads = True
+    logger.warning(f"Query server on http://{BIND}:{port or PORT}/ ({POOL_SIZE} connections, {CACHE_SIZE} cached responses)")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        logger.info(f"Query server stopped, cache hits: {state['hits']:,} misses: {state['misses']:,}")
+    finally:
+        httpd.server_close()
+        while not pool.empty():
+            pool.get().close()
+        version_conn.close()
@@ -0,0 +1,339 @@
+# Enrichment Workers
+#  - Optional for many receiver deployments ([shards] workers = N): each cycle's aircraft are sharded
+#    by ICAO hash across N worker processes, so an aircraft always lands on the same worker and cache
+#  - Workers parse receiver reports, look up BaseStation fields, compute distance and resolve routes
+#    (flight cache, StandingData) on their own read-only connections
+#  - Enriched aircraft come back to the daemon, which stays the single SQLite writer and runs
+#    persistence, alerts and events in receive order
+#  - Without workers the same enrichment runs in the daemon process
+#  - BaseStation and route lookups are cached (LRU, CACHE_SIZE entries) for CACHE_TTL seconds, so
+#    BaseStation updates (-u) reach the daemon after at most CACHE_TTL
+#  - Worker log records go back through a multiprocessing queue to the daemon's own logging
+#  - ./ads-db.py --bench_shards N measures enrichment throughput from 1 to N workers
+#
+import time
+import zlib
+import random
+import signal
+import logging
+import multiprocessing
+from collections import OrderedDict
+from logging.handlers import QueueHandler, QueueListener
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import mpu
+from .constants import AIRCRAFT_COLUMNS
+from .helpers import aircraft_fields, connect_read_only
+
+logger = logging.getLogger('ads-shards')
+
+# Seconds BaseStation and flight cache lookups are reused, entries kept per cache
+CACHE_TTL = 300
+CACHE_SIZE = 20000
+
+# Receiver location (lat, lon) for distances
+home = None
+
+# BaseStation, StandingData and ads-db connections (the daemon's own without workers)
+lookup = None
+flight_conn = None
+conn = None
+
+aircraft_cache = OrderedDict()
+route_cache = OrderedDict()
+
+executors = list()
+settings = dict()
+
+# Worker records -> daemon logging
+log_listener = None
+
+
+def load_config(config):
+    "Worker count (and cache settings) from the [shards] config section"
+    global CACHE_TTL, CACHE_SIZE
+
+    if "shards" not in config:
+        return 0
+    CACHE_TTL = int(config["shards"].get("cache_ttl", CACHE_TTL))
+    CACHE_SIZE = int(config["shards"].get("cache_size", CACHE_SIZE))
+    return int(config["shards"].get("workers", 0))
+
+
+def normalize_icao(hex_code):
+    "Receiver hex code -> ICAO (non-ICAO addresses are prefixed with ~)"
+
+    return hex_code.upper().replace("~", "")
+
+
+def shard(icao):
+    "Worker for an aircraft, stable across cycles"
+
+    return zlib.crc32(icao.encode()) % len(executors)
+
+
+class DaemonHandler(logging.Handler):
+    "Hand worker records to the daemon's loggers (and so its queue and log listener)"
+
+    def emit(self, record):
+        logging.getLogger(record.name).handle(record)
+
+
+def start(workers, base_station, standing_data=None, db_file=None):
+    "Start the worker processes (daemon, before the live feed and alert threads start)"
+    global log_listener
+
+    settings.update(base_station=base_station, standing_data=standing_data, db_file=db_file)
+    stop()
+    # Fork, ads-db.py is a script and can't be re-imported by spawned workers. The log listener
+    # thread (and on a restart, every daemon thread) is running at fork, workers only use their own
+    # connections and the log queue below, logging's handler locks are reset in the child
+    context = multiprocessing.get_context("fork")
+    log_queue = context.Queue()
+    log_listener = QueueListener(log_queue, DaemonHandler())
+    log_listener.start()
+    for i in range(workers):
+        executors.append(
+            ProcessPoolExecutor(
+                max_workers=1,
+                mp_context=context,
+                initializer=init_worker,
+                initargs=(base_station, standing_data, db_file, home, log_queue, logging.getLogger().level),
+            )
+        )
+    # Start the processes now rather than on the first cycle
+    for e in executors:
+        e.submit(time.time).result()
+    logger.info(f"Started {workers} enrichment workers")
+
+
+def stop():
+    global log_listener
+
+    while executors:
+        executors.pop().shutdown(wait=True, cancel_futures=True)
+    if log_listener:
+        log_listener.stop()
+        log_listener = None
+
+
+def init_worker(base_station, standing_data, db_file, location, log_queue=None, level=logging.INFO):
+    "Worker process: own read-only connections, the daemon handles signals and logging"
+    global home
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGHUP, signal.SIG_DFL)
+
+    # The inherited queue handler's listener only runs in the daemon
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(QueueHandler(log_queue) if log_queue else logging.StreamHandler())
+    root.setLevel(level)
+
+    home = location
+    open_connections(base_station, standing_data, db_file)
+
+
+def open_connections(base_station, standing_data=None, db_file=None):
+    global lookup, flight_conn, conn
+
+    aircraft_cache.clear()
+    route_cache.clear()
+    lookup = connect_read_only(base_station)
+    flight_conn = connect_read_only(standing_data) if standing_data else None
+    conn = connect_read_only(db_file) if db_file else None
+
+
+def cache_get(cache, key):
+    "Cached value if younger than CACHE_TTL (None if missing or expired)"
+
+    entry = cache.get(key)
+    if entry is None or time.time() - entry[0] >= CACHE_TTL:
+        return None
+    cache.move_to_end(key)
+    return entry[1]
+
+
+def cache_put(cache, key, value):
+    "Cache a value, dropping the least recently used entries over CACHE_SIZE"
+
+    cache[key] = (time.time(), value)
+    cache.move_to_end(key)
+    while len(cache) > CACHE_SIZE:
+        cache.popitem(last=False)
+
+
+def lookup_model_mfr(icao):
+    "BaseStation fields for an aircraft (cached for CACHE_TTL)"
+
+    fields = cache_get(aircraft_cache, icao)
+    if fields is not None:
+        return fields
+
+    cur = lookup.cursor()
+    cur.execute(
+        f"SELECT {','.join(AIRCRAFT_COLUMNS)} FROM Aircraft WHERE ModeS = ?",
+        (icao,),
+    )
+    rows = cur.fetchall()
+
+    if not rows:
+        fields = ("", "", "", "", "", ".", "", "", "", "")
+    else:
+        fields = aircraft_fields(rows[-1])
+    cache_put(aircraft_cache, icao, fields)
+    return fields
+
+
+def lookup_routes(flight):
+    "Flight cache and StandingData routes for a flight (workers, see get_flight_data)"
+
+    routes = cache_get(route_cache, flight)
+    if routes is not None:
+        return routes
+
+    cached = ("", "", 0)
+    row = conn.execute(
+        "SELECT from_airport, to_airport, distance FROM flight_cache WHERE flight = ?", (flight,)
+    ).fetchone()
+    if row:
+        cached = tuple(row)
+
+    route_view = None
+    if flight_conn:
+        row = flight_conn.execute(
+            "SELECT FromAirportIcao, ToAirportIcao FROM RouteView WHERE Callsign = ?", (flight,)
+        ).fetchone()
+        if row:
+            route_view = (str(row[0]), str(row[1]))
+
+    cache_put(route_cache, flight, (cached, route_view))
+    return (cached, route_view)
+
+
+def enrich_aircraft(site, p, routes=False):
+    "Receiver report -> aircraft record with BaseStation fields and distance"
+
+    a = {
+        "site": site,
+        "icao": normalize_icao(p["hex"]),
+        "flight": p["flight"].rstrip() if "flight" in p else "",
+        "squawk": p["squawk"].rstrip() if "squawk" in p else "",
+        "category": p.get("category", ""),
+        "baro_rate": p.get("baro_rate", 0),
+        "emergency": p.get("emergency"),
+        "lat": p["lat"],
+        "lon": p["lon"],
+        "heading": int(p["track"]) if "track" in p else 0,
+        "altitude": p.get("alt_baro", 0),
+        "speed": int(p["gs"]) if "gs" in p else 0,
+        "routes": None,
+    }
+    if a["altitude"] == "ground":
+        a["altitude"] = 0
+
+    # KM -> NM
+    distance = mpu.haversine_distance((a["lat"], a["lon"]), home)
+    a["distance"] = round(distance * 0.621371, 1)
+
+    (
+        a["ptype"],
+        a["mfr"],
+        a["model"],
+        a["country"],
+        a["owner"],
+        a["military"],
+        a["reg"],
+        a["status"],
+        a["opcode"],
+        a["serial"],
+    ) = lookup_model_mfr(a["icao"])
+
+    if routes and a["flight"] and conn:
+        a["routes"] = lookup_routes(a["flight"])
+    return a
+
+
+def enrich_batch(batch, routes=True):
+    "Enrich an (index, site, report) batch, skipping malformed reports"
+
+    enriched = list()
+    for (i, site, p) in batch:
+        try:
+            enriched.append((i, enrich_aircraft(site, p, routes)))
+        except (KeyError, TypeError, ValueError) as e:
+            logger.warning(f"Bad aircraft report from {site}: {e}")
+    return enriched
+
+
+def enrich(received, routes=False):
+    "Enrich a cycle's (site, report) list, sharded across the workers when running (routes: resolve routes too)"
+
+    reports = [(i, site, p) for (i, (site, p)) in enumerate(received)]
+    if not executors:
+        return [a for (i, a) in enrich_batch(reports, routes)]
+
+    batches = [list() for e in executors]
+    for report in reports:
+        batches[shard(normalize_icao(report[2]["hex"]))].append(report)
+    try:
+        futures = [e.submit(enrich_batch, batch, routes) for (e, batch) in zip(executors, batches) if batch]
+        results = [result for f in futures for result in f.result()]
+    except BrokenProcessPool as e:
+        logger.critical(f"Enrichment worker died, restarting workers: {e}")
+        start(len(executors), **settings)
+        return [a for (i, a) in enrich_batch(reports, routes)]
+
+    # Back in receive order for the writer
+    return [a for (i, a) in sorted(results, key=lambda r: r[0])]
+
+
+def benchmark(db_file, base_station, standing_data=None, max_workers=4, aircraft=2000, cycles=5):
+    "Enrichment throughput with 0 (in process) to max_workers workers"
+
+    bs = connect_read_only(base_station)
+    icaos = [r[0] for r in bs.execute("SELECT ModeS FROM Aircraft WHERE ModeS IS NOT NULL LIMIT ?", (aircraft,))]
+    bs.close()
+    db = connect_read_only(db_file)
+    flights = [r[0] for r in db.execute("SELECT flight FROM flights ORDER BY lastseen DESC LIMIT ?", (aircraft,))]
+    db.close()
+    if not icaos:
+        print("No BaseStation aircraft to benchmark with")
+        return
+
+    received = list()
+    for i in range(aircraft):
+        p = {
+            "hex": icaos[i % len(icaos)] if i < len(icaos) else f"{random.randrange(0xFFFFFF):06x}",
+            "lat": home[0] + random.uniform(-2, 2),
+            "lon": home[1] + random.uniform(-2, 2),
+            "alt_baro": random.randrange(0, 40000),
+            "track": random.uniform(0, 360),
+            "gs": random.uniform(100, 500),
+        }
+        if flights:
+            p["flight"] = flights[i % len(flights)]
+        received.append((f"site{i % 12}", p))
+
+    print(f"\nEnrichment throughput ({aircraft} aircraft, {len(set(icaos))} in BaseStation, {cycles} cycles)")
+    print(f"{'WORKERS':>7} {'FIRST CYCLE':>12} {'AIRCRAFT/S':>12} {'CYCLE':>9}")
+    print(f"{'-' * 7} {'-' * 12} {'-' * 12} {'-' * 9}")
+    for workers in range(0, max_workers + 1):
+        if workers:
+            start(workers, base_station, standing_data, db_file)
+        else:
+            open_connections(base_station, standing_data, db_file)
+
+        begin = time.perf_counter()
+        enrich(received, routes=True)
+        first = time.perf_counter() - begin
+
+        begin = time.perf_counter()
+        for i in range(cycles):
+            enrich(received, routes=True)
+        elapsed = (time.perf_counter() - begin) / cycles
+        stop()
+
+        print(f"{workers or 'none':>7} {first * 1000:>10.0f}ms {aircraft / elapsed:>12,.0f} {elapsed * 1000:>7.0f}ms")
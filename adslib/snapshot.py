@@ -0,0 +1,122 @@
+# BaseStation Snapshots
+#  - Fingerprint of the registration data for each ModeS in the last applied BaseStation.sqb
+#  - A new snapshot is diffed against it so only changed airframes are re-validated
+#  - Expects the new BaseStation database attached as bs
+#
+import hashlib
+import logging
+from datetime import datetime
+from .compact import icao_sql
+from .constants import AIRCRAFT_COLUMNS, sql_create_snapshot_table
+
+logger = logging.getLogger('ads-snapshot')
+
+conn = None
+
+sql_create_snapshot_tables = [
+    f"""CREATE TEMP TABLE snapshot_new AS
+        SELECT ModeS AS modes, Registration AS registration, Status AS status, ICAOTypeCode AS ptype,
+            fingerprint({",".join(dict.fromkeys(AIRCRAFT_COLUMNS))}) AS fingerprint
+        FROM bs.Aircraft WHERE ModeS IS NOT NULL""",
+    """CREATE TEMP TABLE snapshot_changes AS
+        SELECT n.modes, n.registration, n.status, n.ptype, n.fingerprint,
+            s.registration AS old_registration, s.status AS old_status, s.modes IS NOT NULL AS seen
+        FROM temp.snapshot_new n LEFT JOIN main.bs_snapshot s ON s.modes = n.modes
+        WHERE s.fingerprint IS NOT n.fingerprint""",
+    "CREATE INDEX temp.snapshot_changes_idx ON snapshot_changes(modes)",
+]
+
+
+def fingerprint(*values):
+    "Stable 64bit fingerprint of a row of values"
+
+    digest = hashlib.blake2b(repr(values).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+
+def stage():
+    "Diff the attached BaseStation snapshot against the last applied one into temp.snapshot_changes"
+
+    cur = conn.cursor()
+    conn.create_function("fingerprint", -1, fingerprint, deterministic=True)
+    cur.execute(sql_create_snapshot_table)
+    cur.execute("DROP TABLE IF EXISTS temp.snapshot_new")
+    cur.execute("DROP TABLE IF EXISTS temp.snapshot_changes")
+    for sql in sql_create_snapshot_tables:
+        cur.execute(sql)
+
+    changes = dict()
+    (changes["total"],) = cur.execute("SELECT COUNT(*) FROM temp.snapshot_new").fetchone()
+    (changes["added"], changes["changed"]) = cur.execute(
+        "SELECT COALESCE(SUM(NOT seen), 0), COALESCE(SUM(seen), 0) FROM temp.snapshot_changes"
+    ).fetchone()
+    (changes["removed"],) = cur.execute(
+        "SELECT COUNT(*) FROM main.bs_snapshot WHERE modes NOT IN (SELECT modes FROM temp.snapshot_new)"
+    ).fetchone()
+
+    # Changes to airframes in our database
+    known = f"FROM temp.snapshot_changes c JOIN planes p ON {icao_sql('p.icao')} = c.modes"
+    changes["new_types"] = cur.execute(
+        f"""SELECT c.ptype, COUNT(*) {known}
+            WHERE c.ptype != '' AND c.ptype NOT IN (SELECT ptype FROM plane_types)
+            GROUP BY c.ptype ORDER BY c.ptype"""
+    ).fetchall()
+    changes["registrations"] = cur.execute(
+        f"""SELECT c.modes, p.ptype, c.old_registration, c.registration {known}
+            WHERE c.seen AND c.registration != '' AND c.old_registration != '' AND c.registration IS NOT c.old_registration
+            ORDER BY p.ptype, c.registration"""
+    ).fetchall()
+    changes["retirements"] = cur.execute(
+        f"""SELECT c.modes, p.ptype, c.registration, c.old_status, c.status {known}
+            WHERE c.seen AND c.status NOT IN ('', 'A') AND c.status IS NOT c.old_status
+            ORDER BY p.ptype, c.registration"""
+    ).fetchall()
+
+    logger.info(
+        f"BaseStation snapshot: {changes['total']:,} airframes, {changes['added']:,} new, "
+        f"{changes['changed']:,} changed, {changes['removed']:,} removed"
+    )
+    return changes
+
+
+def save():
+    "Record the staged snapshot as applied (inside the current transaction)"
+
+    cur = conn.cursor()
+    cur.execute(
+        """INSERT INTO main.bs_snapshot(modes, registration, status, fingerprint, lastseen)
+            SELECT modes, registration, status, fingerprint, ? FROM temp.snapshot_changes WHERE true
+            ON CONFLICT(modes) DO UPDATE SET
+                registration = excluded.registration,
+                status = excluded.status,
+                fingerprint = excluded.fingerprint,
+                lastseen = excluded.lastseen""",
+        (datetime.now(),),
+    )
+    cur.execute("DELETE FROM main.bs_snapshot WHERE modes NOT IN (SELECT modes FROM temp.snapshot_new)")
+    cur.execute("DROP TABLE temp.snapshot_new")
+    cur.execute("DROP TABLE temp.snapshot_changes")
+
+
+def print_summary(changes):
+    "Print new types, re-registrations and retirements from a staged snapshot"
+
+    print(
+        f"\nBaseStation Snapshot: {changes['total']:,} airframes, {changes['added']:,} new, "
+        f"{changes['changed']:,} changed, {changes['removed']:,} removed"
+    )
+
+    if changes["new_types"]:
+        print("\n New Types:")
+    for (ptype, count) in changes["new_types"]:
+        print(f"   {ptype:<6} {count} planes")
+
+    if changes["registrations"]:
+        print("\n Re-registrations:")
+    for (icao, ptype, old, new) in changes["registrations"]:
+        print(f"   {icao} {ptype or '':<6} {old} -> {new}")
+
+    if changes["retirements"]:
+        print("\n Retirements:")
+    for (icao, ptype, reg, old, new) in changes["retirements"]:
+        print(f"   {icao} {ptype or '':<6} {reg or '':<8} {old or '-'} -> {new}")
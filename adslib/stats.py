@@ -0,0 +1,157 @@
+# Database Stats
+#  - Summary counts for -st kept in a db_stats table
+#  - The daemon counts new planes and flights as they are inserted and
+#    refreshes the 30day/24hr windows from the lastseen indexes every few minutes
+#
+import time
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta
+from .constants import sql_create_stats_table
+
+logger = logging.getLogger('ads-stats')
+
+conn = None
+
+# Seconds between window refreshes
+REFRESH = 300
+
+# Counts since the last flush
+pending = defaultdict(int)
+state = {"refreshed": 0}
+
+STATS = [
+    "flights", "flights_30d", "flights_24h", "flights_new",
+    "planes", "planes_30d", "planes_24h", "planes_new",
+    "types", "types_30d", "types_24h", "types_new",
+]
+
+
+def window_stats(db=None):
+    "30day, 24hr and new counts (range scans on lastseen)"
+
+    cur = (db or conn).cursor()
+    params = {
+        "day": datetime.now() - timedelta(days=1),
+        "month": datetime.now() - timedelta(days=30),
+    }
+    values = dict()
+
+    (values["planes_30d"], values["planes_24h"], values["planes_new"], values["types_30d"]) = cur.execute(
+        """SELECT COUNT(*), COALESCE(SUM(lastseen > :day), 0), COALESCE(SUM(lastseen > :day AND firstseen > :day), 0), COUNT(DISTINCT ptype)
+            FROM planes WHERE lastseen > :month""",
+        params,
+    ).fetchone()
+    (values["types_24h"],) = cur.execute(
+        "SELECT COUNT(DISTINCT ptype) FROM planes WHERE lastseen > :day", params
+    ).fetchone()
+
+    # Types first seen in the last day
+    (values["types_new"],) = cur.execute(
+        """SELECT COUNT(DISTINCT p.ptype) FROM planes p
+            WHERE p.lastseen > :day AND p.firstseen > :day AND p.ptype != ''
+            AND NOT EXISTS (SELECT 1 FROM planes o WHERE o.ptype = p.ptype AND o.firstseen <= :day)""",
+        params,
+    ).fetchone()
+
+    (values["flights_30d"], values["flights_24h"], values["flights_new"]) = cur.execute(
+        """SELECT COUNT(*), COALESCE(SUM(lastseen > :day), 0), COALESCE(SUM(lastseen > :day AND firstseen > :day), 0)
+            FROM flights WHERE lastseen > :month""",
+        params,
+    ).fetchone()
+
+    return values
+
+
+def total_stats(db=None):
+    "Table totals"
+
+    cur = (db or conn).cursor()
+    values = dict()
+    (values["planes"], values["types"]) = cur.execute("SELECT COUNT(*), COUNT(DISTINCT ptype) FROM planes").fetchone()
+    (values["flights"],) = cur.execute("SELECT COUNT(*) FROM flights").fetchone()
+    return values
+
+
+def save(values):
+    "Write stats values (inside the current transaction)"
+
+    now = datetime.now()
+    conn.cursor().executemany(
+        """INSERT INTO db_stats(name, value, lastseen) VALUES(?, ?, ?)
+            ON CONFLICT(name) DO UPDATE SET value = excluded.value, lastseen = excluded.lastseen""",
+        [(name, value, now) for (name, value) in values.items()],
+    )
+
+
+def rebuild():
+    "Recompute all stats from the planes and flights tables"
+
+    start = time.time()
+    cur = conn.cursor()
+    cur.execute(sql_create_stats_table)
+
+    values = total_stats()
+    values.update(window_stats())
+    save(values)
+    conn.commit()
+    pending.clear()
+    state["refreshed"] = time.time()
+
+    logger.info(f"Rebuilt database stats in {time.time() - start:.2f}s")
+    return values
+
+
+def count(name, n=1):
+    "Count a new plane or flight towards its total and windows"
+
+    for stat in [name, f"{name}_30d", f"{name}_24h", f"{name}_new"]:
+        pending[stat] += n
+
+
+def flush():
+    "Apply pending counts and refresh windows when due (daemon save cycle)"
+
+    cur = conn.cursor()
+    if time.time() - state["refreshed"] > REFRESH:
+        values = window_stats()
+        (values["types"],) = cur.execute("SELECT COUNT(DISTINCT ptype) FROM planes").fetchone()
+        for name in list(pending):
+            if name in values:
+                del pending[name]
+        save(values)
+        state["refreshed"] = time.time()
+
+    if pending:
+        now = datetime.now()
+        cur.executemany(
+            "UPDATE db_stats SET value = value + ?, lastseen = ? WHERE name = ?",
+            [(n, now, name) for (name, n) in pending.items()],
+        )
+        pending.clear()
+
+
+def get_stats(db=None, read_only=False):
+    "Stats values and last update time, rebuilt if missing (computed without saving if read_only)"
+
+    cur = (db or conn).cursor()
+    try:
+        rows = cur.execute("SELECT name, value, lastseen FROM db_stats").fetchall()
+    except Exception:
+        rows = list()
+
+    values = {name: value for (name, value, lastseen) in rows}
+    if any(name not in values for name in STATS):
+        if read_only:
+            values = total_stats(db)
+            values.update(window_stats(db))
+        else:
+            values = rebuild()
+        return (values, datetime.now())
+
+    # Daemon not running, windows from the lastseen indexes
+    updated = max(lastseen for (name, value, lastseen) in rows)
+    if datetime.now() - updated > timedelta(seconds=REFRESH):
+        values.update(window_stats(db))
+
+    return (values, updated)
@@ -0,0 +1,19 @@
+import sys
+import types
+
+from adslib import alerts
+
+
+def test_sound_sink_plays_longest_list(monkeypatch):
+    played = list()
+    monkeypatch.setitem(sys.modules, "playsound", types.SimpleNamespace(playsound=played.append))
+    monkeypatch.setattr(alerts, "sounds", True)
+    monkeypatch.setattr(alerts, "check_quiet_time", lambda: True)
+
+    batch = [
+        {"sounds": ["ding-low.mp3"]},
+        {"sounds": ["ding-low.mp3", "ding-low-fast.mp3"]},
+        {"sounds": ["ding-low.mp3"]},
+    ]
+    alerts.sound_sink("landing", batch)
+    assert played == [f"{alerts.SOUND_DIR}/ding-low.mp3", f"{alerts.SOUND_DIR}/ding-low-fast.mp3"]
@@ -0,0 +1,69 @@
+import sqlite3
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from adslib import archive, compact
+from adslib.constants import sql_create_plane_days_table
+
+DETECT = sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES
+
+DAY = date.today() - timedelta(days=archive.ARCHIVE_DAYS + 30)
+SEEN = datetime.combine(DAY, datetime.min.time()).replace(hour=12)
+
+
+@pytest.fixture
+def db(tmp_path):
+    db_file = str(tmp_path / "ads-db-planes.sqb")
+    conn = sqlite3.connect(db_file, detect_types=DETECT, factory=compact.Connection)
+    conn.execute(sql_create_plane_days_table)
+    conn.execute("CREATE UNIQUE INDEX plane_days_key_idx ON plane_days(icao, day, ident);")
+    conn.execute("CREATE INDEX plane_day_idx ON plane_days(day);")
+    archive.conn = conn
+    yield (conn, db_file)
+    conn.close()
+
+
+def add_day(conn, icao, ident, distance, altitude, firstseen, lastseen):
+    conn.execute(
+        "INSERT INTO plane_days (icao, day, ident, distance, closest, altitude, lowest_altitude, firstseen, lastseen)"
+        " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (icao, DAY, ident, distance, distance, altitude, altitude, firstseen, lastseen),
+    )
+    conn.commit()
+
+
+def archived(db_file):
+    aconn = sqlite3.connect(archive.archive_file(db_file, DAY.year), detect_types=DETECT)
+    rows = aconn.execute(
+        "SELECT icao, ident, distance, closest, altitude, lowest_altitude, firstseen, lastseen FROM plane_days ORDER BY icao"
+    ).fetchall()
+    aconn.close()
+    return rows
+
+
+def test_archive_twice_keeps_rows(db):
+    (conn, db_file) = db
+    add_day(conn, "ABC123", "DAL1", 10, 5000, SEEN, SEEN + timedelta(hours=1))
+    add_day(conn, "ABC124", "N124", 20, 3000, SEEN, SEEN)
+    assert archive.archive_plane_days(db_file) == 2
+
+    # Same keys back in main (restored backup, daemon writing the day again)
+    add_day(conn, "ABC123", "DAL1", 4, 8000, SEEN - timedelta(hours=2), SEEN + timedelta(hours=3))
+    assert archive.archive_plane_days(db_file) == 1
+
+    assert conn.execute("SELECT COUNT(*) FROM plane_days").fetchone() == (0,)
+    assert archived(db_file) == [
+        ("ABC123", "DAL1", 4, 4, 8000, 5000, SEEN - timedelta(hours=2), SEEN + timedelta(hours=3)),
+        ("ABC124", "N124", 20, 20, 3000, 3000, SEEN, SEEN),
+    ]
+
+
+def test_archive_older_copy_keeps_latest_values(db):
+    (conn, db_file) = db
+    add_day(conn, "ABC123", "DAL1", 10, 5000, SEEN, SEEN + timedelta(hours=5))
+    archive.archive_plane_days(db_file)
+
+    add_day(conn, "ABC123", "DAL1", 30, 9000, SEEN, SEEN + timedelta(hours=1))
+    assert archive.archive_plane_days(db_file) == 1
+    assert archived(db_file) == [("ABC123", "DAL1", 10, 10, 5000, 5000, SEEN, SEEN + timedelta(hours=5))]
@@ -0,0 +1,48 @@
+import sqlite3
+from datetime import date, datetime
+
+from adslib import compact
+from adslib.constants import sql_create_planes_table as sql_create_text_planes_table
+
+DETECT = sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES
+
+
+def compact_db(path):
+    conn = sqlite3.connect(path, detect_types=DETECT, factory=compact.Connection)
+    conn.execute(compact.sql_create_planes_table)
+    conn.execute(f"PRAGMA user_version = {compact.SCHEMA_VERSION}")
+    conn.close()
+    return sqlite3.connect(path, detect_types=DETECT, factory=compact.Connection)
+
+
+def test_compact_binds_epoch(tmp_path, monkeypatch):
+    monkeypatch.setattr(compact, "enabled", False)
+    conn = compact_db(tmp_path / "c.sqb")
+    assert conn.compact and compact.setup(conn)
+
+    seen = datetime(2024, 1, 2, 3, 4, 5)
+    conn.execute("INSERT INTO planes (icao, firstseen, lastseen) VALUES (?, ?, ?)", (compact.icao_key("ABC123"), seen, seen))
+    assert conn.execute("SELECT typeof(lastseen) FROM planes").fetchone() == ("integer",)
+    assert conn.execute("SELECT icao, lastseen FROM planes").fetchone() == ("ABC123", seen)
+    assert conn.execute("SELECT COUNT(*) FROM planes WHERE lastseen >= :t", {"t": seen}).fetchone() == (1,)
+
+
+def test_text_connections_unaffected(tmp_path):
+    compact_db(tmp_path / "c.sqb")
+
+    text = sqlite3.connect(":memory:", detect_types=DETECT)
+    text.execute("CREATE TABLE x (seen timestamp, day date)")
+    text.execute("INSERT INTO x VALUES (?, ?)", (datetime(2024, 1, 2, 3, 4, 5), date(2024, 1, 2)))
+    assert text.execute("SELECT typeof(seen), typeof(day) FROM x").fetchone() == ("text", "text")
+    assert text.execute("SELECT seen, day FROM x").fetchone() == (datetime(2024, 1, 2, 3, 4, 5), date(2024, 1, 2))
+
+
+def test_text_icao_unchanged(tmp_path):
+    compact_db(tmp_path / "c.sqb")
+
+    text = sqlite3.connect(":memory:", detect_types=DETECT)
+    text.execute(sql_create_text_planes_table)
+    text.executemany("INSERT INTO planes (icao) VALUES (?)", [("A1B2C3",), ("123456",)])
+    assert text.execute("SELECT icao FROM planes ORDER BY icao").fetchall() == [("123456",), ("A1B2C3",)]
+    assert compact.convert_icao(b"A1B2C3") == "A1B2C3"
+    assert compact.convert_icao(b"11256099") == "ABC123"
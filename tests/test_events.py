@@ -0,0 +1,46 @@
+import io
+
+from adslib import events
+
+
+class FakeHandler:
+
+    def __init__(self, path, headers=None):
+        self.path = path
+        self.headers = headers or {}
+        self.wfile = io.BytesIO()
+        self.errors = list()
+        self.responses = list()
+
+    def send_error(self, code, message=None):
+        self.errors.append(code)
+
+    def send_response(self, code):
+        self.responses.append(code)
+
+
+def test_bad_last_event_id_is_rejected():
+    handler = FakeHandler("/events", {"Last-Event-ID": "abc"})
+    events.serve_sse(handler)
+    assert handler.errors == [400]
+    assert handler.responses == []
+
+
+def test_replay_after_restart():
+    events.publish("new_plane", icao="ABC123")
+    events.publish("landing", icao="ABC123")
+    (first, second) = [item[0] for item in list(events.buffer)[-2:]]
+
+    (q, backlog) = events.subscribe(first)
+    events.unsubscribe(q)
+    assert [item[0] for item in backlog] == [second]
+
+    # Id from an earlier daemon run (started before this one)
+    (q, backlog) = events.subscribe(5)
+    events.unsubscribe(q)
+    assert [item[0] for item in backlog][-2:] == [first, second]
+
+    # Id ahead of anything published here
+    (q, backlog) = events.subscribe(second + 1000)
+    events.unsubscribe(q)
+    assert [item[0] for item in backlog][-2:] == [first, second]
@@ -0,0 +1,22 @@
+import io
+import sys
+
+from adslib import export
+
+
+def test_close_output_keeps_stdout_open(monkeypatch):
+    stdout = io.StringIO()
+    monkeypatch.setattr(sys, "stdout", stdout)
+    assert export.open_output(None) is stdout
+
+    # ads-db.py sends summaries to stderr while exporting lookups
+    monkeypatch.setattr(sys, "stdout", io.StringIO())
+    export.close_output()
+    assert not stdout.closed
+    assert export.out is None
+
+
+def test_close_output_closes_file(tmp_path):
+    out = export.open_output(str(tmp_path / "planes.ndjson"))
+    export.close_output()
+    assert out.closed
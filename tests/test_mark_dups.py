@@ -0,0 +1,52 @@
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+
+from adslib import compact
+from adslib.constants import sql_create_planes_table
+from adslib.helpers import dict_gen, dup_serials_sql
+
+DETECT = sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES
+
+NOW = datetime(2024, 5, 1, 12, 0, 0)
+
+# Same type and serial: latest first, then a hex and an all-digit ICAO
+PLANES = [
+    ("A1B2C3", "B738", "1234", "N1", NOW),
+    ("123456", "B738", "1234", "N2", NOW - timedelta(days=400)),
+    ("C0FFEE", "B738", "1234", "N3", NOW - timedelta(days=10)),
+]
+
+
+def dups(conn):
+    params = dict(year_ago=NOW - timedelta(days=365))
+    return sorted((r["icao"], r["n_icao"], r["aged"]) for r in dict_gen(conn.execute(dup_serials_sql(), params)))
+
+
+def test_text_schema(monkeypatch):
+    monkeypatch.setattr(compact, "enabled", False)
+    conn = sqlite3.connect(":memory:", detect_types=DETECT, factory=compact.Connection)
+    conn.execute(sql_create_planes_table)
+    conn.executemany(
+        "INSERT INTO planes (icao, ptype, serial, registration, firstseen, lastseen) VALUES (?, ?, ?, ?, ?, ?)",
+        [(icao, ptype, serial, reg, seen - timedelta(days=30), seen) for (icao, ptype, serial, reg, seen) in PLANES],
+    )
+    assert dups(conn) == [("123456", "A1B2C3", 1), ("C0FFEE", "A1B2C3", 0)]
+
+
+def test_compact_schema(tmp_path, monkeypatch):
+    path = tmp_path / "c.sqb"
+    conn = sqlite3.connect(path, detect_types=DETECT, factory=compact.Connection)
+    conn.execute(compact.sql_create_planes_table)
+    conn.execute(f"PRAGMA user_version = {compact.SCHEMA_VERSION}")
+    conn.close()
+    conn = sqlite3.connect(path, detect_types=DETECT, factory=compact.Connection)
+    monkeypatch.setattr(compact, "enabled", False)
+    assert compact.setup(conn)
+
+    conn.executemany(
+        "INSERT INTO planes (icao, ptype, serial, registration, firstseen, lastseen) VALUES (?, ?, ?, ?, ?, ?)",
+        [(compact.icao_key(icao), ptype, serial, reg, seen - timedelta(days=30), seen) for (icao, ptype, serial, reg, seen) in PLANES],
+    )
+    assert dups(conn) == [("123456", "A1B2C3", 1), ("C0FFEE", "A1B2C3", 0)]
@@ -0,0 +1,73 @@
+import pytest
+
+from adslib import receivers
+
+SITE = "10.0.0.1:8080"
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(receivers.time, "time", lambda: now[0])
+    monkeypatch.setattr(receivers, "sites", dict())
+    return now
+
+
+def fail_when_due(clock, refresh):
+    "Advance the fake clock to the next poll and fail it, returning the wait"
+
+    state = receivers.site_state(SITE)
+    wait = max(0, state["next_poll"] - clock[0])
+    clock[0] += wait
+    assert receivers.due(SITE)
+    receivers.failure(SITE, "timeout", refresh)
+    assert not receivers.due(SITE)
+    return wait
+
+
+def test_backoff_then_open_circuit(clock, monkeypatch):
+    monkeypatch.setattr(receivers, "OPEN_AFTER", 5)
+    monkeypatch.setattr(receivers, "MAX_BACKOFF", 120)
+    monkeypatch.setattr(receivers, "PROBE", 60)
+
+    waits = [fail_when_due(clock, 10) for i in range(7)]
+    state = receivers.site_state(SITE)
+
+    # 20, 40, 80, 120 (capped), then open: probes never sooner than the last backoff
+    assert waits[1:] == [20, 40, 80, 120, 120, 120]
+    assert state["status"] == "open"
+    assert state["next_poll"] - clock[0] == 120
+
+
+def test_probe_when_longer_than_backoff(clock, monkeypatch):
+    monkeypatch.setattr(receivers, "OPEN_AFTER", 3)
+    monkeypatch.setattr(receivers, "PROBE", 300)
+
+    waits = [fail_when_due(clock, 5) for i in range(5)]
+    assert waits[1:] == [10, 20, 300, 300]
+    assert receivers.site_state(SITE)["status"] == "open"
+
+
+def test_recovery_resets(clock, monkeypatch):
+    monkeypatch.setattr(receivers, "OPEN_AFTER", 2)
+
+    for i in range(3):
+        fail_when_due(clock, 10)
+    assert receivers.site_state(SITE)["status"] == "open"
+
+    class Response:
+        def raise_for_status(self):
+            pass
+
+        def json(self):
+            return {"aircraft": [{"hex": "abc123"}]}
+
+    monkeypatch.setattr(receivers.requests, "get", lambda url, timeout: Response())
+    clock[0] = receivers.site_state(SITE)["next_poll"]
+    assert receivers.fetch(SITE, 10) == {"aircraft": [{"hex": "abc123"}]}
+
+    state = receivers.site_state(SITE)
+    assert (state["status"], state["failures"], state["delay"]) == ("up", 0, 0)
+    assert receivers.due(SITE)
+    receivers.failure(SITE, "timeout", 10)
+    assert state["next_poll"] - clock[0] == 20
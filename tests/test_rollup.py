@@ -0,0 +1,75 @@
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+
+from adslib import compact, rollup
+from adslib.constants import sql_create_plane_days_table, sql_create_planes_table
+
+DETECT = sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES
+
+
+@pytest.fixture
+def conn(monkeypatch):
+    monkeypatch.setattr(compact, "enabled", False)
+    monkeypatch.setattr(rollup, "hours", dict())
+    monkeypatch.setattr(rollup, "days", dict())
+    conn = sqlite3.connect(":memory:", detect_types=DETECT, factory=compact.Connection)
+    conn.execute(sql_create_planes_table)
+    conn.execute(sql_create_plane_days_table)
+    rollup.conn = conn
+    rollup.create_tables()
+    yield conn
+    conn.close()
+
+
+def seen(conn, icao, ident, when):
+    "What the daemon stores and records for an aircraft"
+
+    conn.execute(
+        "INSERT OR REPLACE INTO planes (icao, ident, ptype, category, military, owner) VALUES (?, ?, 'B738', 'A3', '.', 'Delta')",
+        (icao, ident),
+    )
+    conn.execute(
+        "INSERT INTO plane_days (icao, day, ident, firstseen, lastseen) VALUES (?, ?, ?, ?, ?)",
+        (icao, when.date(), ident, when, when),
+    )
+    rollup.record(icao, ident, "B738", "A3", ".", "Delta", when)
+
+
+def counts(conn):
+    now = datetime.now()
+    hour = now.replace(minute=0, second=0, microsecond=0)
+    day = conn.execute("SELECT planes, flights FROM rollup_days WHERE day = ?", (now.date(),)).fetchone()
+    hourly = conn.execute("SELECT planes, flights FROM rollup_hours WHERE hour = ?", (hour,)).fetchone()
+    return (day, hourly)
+
+
+def test_restart_keeps_current_counts(conn):
+    now = datetime.now()
+    seen(conn, "A00001", "DAL1", now.replace(minute=0, second=0, microsecond=0))
+    seen(conn, "A00002", "DAL2", now)
+    rollup.flush()
+    expected = counts(conn)
+
+    # Daemon restart: in-memory buckets are gone, a new plane shows up
+    rollup.hours.clear()
+    rollup.days.clear()
+    rollup.load_current()
+    seen(conn, "A00003", "DAL3", now)
+    rollup.flush()
+
+    (day, hourly) = counts(conn)
+    assert day == (expected[0][0] + 1, expected[0][1] + 1)
+    assert hourly == (expected[1][0] + 1, expected[1][1] + 1)
+
+
+def test_report_window_includes_partial_day(conn):
+    start = datetime.now() - timedelta(hours=36)
+    for (day, planes) in [(start.date() - timedelta(days=1), 5), (start.date(), 7)]:
+        conn.execute(
+            "INSERT INTO rollup_days (day, ptype, category, military, owner, planes, flights) VALUES (?, 'B738', 'A3', '.', '', ?, 0)",
+            (day, planes),
+        )
+    rows = rollup.report("day", hours_ago=36)
+    assert [(r[0], r[1]) for r in rows] == [(start.date(), 7)]
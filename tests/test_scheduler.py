@@ -0,0 +1,86 @@
+import logging
+
+import pytest
+
+from adslib import scheduler
+
+PERIOD = 10
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(scheduler.time, "monotonic", lambda: now[0])
+    monkeypatch.setattr(scheduler, "OVERRUNS", 3)
+    monkeypatch.setattr(scheduler, "RECOVER", 5)
+    monkeypatch.setattr(scheduler, "BUDGET", 0.8)
+    for key in ["target", "start", "period", "log_level"]:
+        monkeypatch.setitem(scheduler.state, key, None)
+    for key in ["cycles", "overruns", "shed", "late", "under"]:
+        monkeypatch.setitem(scheduler.state, key, 0)
+    level = logging.getLogger().level
+    yield now
+    logging.getLogger().setLevel(level)
+
+
+def cycle(clock, elapsed):
+    scheduler.start_cycle()
+    clock[0] += elapsed
+    clock[0] += scheduler.end_cycle(PERIOD)
+
+
+def test_single_overrun_sheds_nothing(clock):
+    cycle(clock, 9)
+    for i in range(3):
+        cycle(clock, 1)
+    cycle(clock, 9)
+    assert scheduler.state["shed"] == 0
+    assert scheduler.enabled("ptypes")
+    assert scheduler.state["overruns"] == 2
+
+
+def test_consecutive_overruns_shed_in_order(clock):
+    for i in range(3):
+        cycle(clock, 9)
+    assert not scheduler.enabled("ptypes")
+    assert scheduler.enabled("routes")
+
+    for i in range(3):
+        cycle(clock, 9)
+    assert not scheduler.enabled("routes")
+
+    for i in range(3):
+        cycle(clock, 9)
+    assert not scheduler.enabled("debug")
+    assert logging.getLogger().level >= logging.INFO
+
+
+def test_recover_needs_consecutive_fast_cycles(clock):
+    for i in range(6):
+        cycle(clock, 9)
+    assert scheduler.state["shed"] == 2
+
+    # A middle band cycle (under budget, not well under) restarts the recovery count
+    for i in range(4):
+        cycle(clock, 1)
+    cycle(clock, 5)
+    for i in range(4):
+        cycle(clock, 1)
+    assert scheduler.state["shed"] == 2
+
+    cycle(clock, 1)
+    assert scheduler.state["shed"] == 1
+    for i in range(5):
+        cycle(clock, 1)
+    assert scheduler.state["shed"] == 0
+    assert scheduler.enabled("ptypes")
+
+
+def test_fixed_rate(clock):
+    scheduler.start_cycle()
+    clock[0] += 3
+    assert scheduler.end_cycle(PERIOD) == pytest.approx(7)
+    clock[0] += 7
+    scheduler.start_cycle()
+    clock[0] += 15
+    assert scheduler.end_cycle(PERIOD) == 0
@@ -0,0 +1,103 @@
+import sqlite3
+
+import pytest
+
+from adslib import search
+from adslib.constants import sql_create_planes_table, sql_create_types_table
+
+OWNERS = [
+    "Delta Air Lines",
+    "Air Force",
+    "United States Air Force",
+    "Royal Air Force",
+    "Air Forces Museum",
+    "Air-Force Club",
+    "Delta",
+    'Jo"hnson Aviation',
+    "DELTA AIR LINES INC",
+    "Southwest Airlines",
+    "Aerodelta",
+    "Deltaflight",
+    None,
+]
+
+IDENTS = ["DAL123", "DAL1", "DAL12", "SWA1", "N1DAL", "D4L1", "AAL45"]
+
+
+@pytest.fixture
+def db():
+    conn = sqlite3.connect(":memory:")
+    conn.execute(sql_create_planes_table)
+    conn.execute(sql_create_types_table)
+    for (i, owner) in enumerate(OWNERS):
+        conn.execute(
+            "INSERT INTO planes (icao, owner, ident, registration) VALUES (?, ?, ?, ?)",
+            (f"{i:06X}", owner, IDENTS[i % len(IDENTS)], f"N{i}"),
+        )
+    search.conn = conn
+    search.build()
+    yield conn
+    search.enabled = False
+    conn.close()
+
+
+def like(conn, column, pattern):
+    return sorted(r[0] for r in conn.execute(f"SELECT icao FROM planes WHERE {column} LIKE ?", (pattern,)))
+
+
+def fts(conn, column, pattern):
+    (where, params) = search.match_sql(column, pattern)
+    return sorted(r[0] for r in conn.execute(f"SELECT icao FROM planes WHERE {where}", params))
+
+
+@pytest.mark.parametrize(
+    "column, pattern",
+    [
+        ("owner", "Delta%"),
+        ("owner", "delta"),
+        ("owner", "Air Force"),
+        ("owner", "air force%"),
+        ("owner", "Air Force%"),
+        ("owner", "Royal Air%"),
+        ("owner", "%Air Force"),
+        ("owner", "%delta%"),
+        ("owner", "%Airlines"),
+        ("owner", "_elta%"),
+        ("owner", "Delta%Lines"),
+        ("owner", "Air_Force%"),
+        ("owner", 'Jo"hn%'),
+        ("owner", "%orce Mus%"),
+        ("owner", "%ir%"),
+        ("owner", "%a%r_l%"),
+        ("ident", "DAL%"),
+        ("ident", "DAL1"),
+        ("ident", "%DAL"),
+        ("ident", "D_L1"),
+    ],
+)
+def test_fts_matches_like(db, column, pattern):
+    assert search.enabled
+    assert fts(db, column, pattern) == like(db, column, pattern)
+
+
+@pytest.mark.parametrize("pattern", ["%Air Force", "%delta%", "_elta%", "Delta%Lines", "Air_Force%", "%"])
+def test_fts_falls_back_to_like(pattern):
+    assert search.fts_query(pattern) is None
+
+
+def test_multi_word_pattern_is_a_phrase():
+    assert search.fts_query("air force%") == '^"air force"*'
+    assert search.fts_query("DAL1") == '^"DAL1"'
+
+
+def test_quote_splits_tokens():
+    assert search.fts_query('Jo"hn%') == '^"Jo hn"*'
+
+
+@pytest.mark.parametrize("pattern, index", [("%delta%", "trigram"), ("%Airlines", "trigram"), ("%ir%", None), ("DAL%", "fts")])
+def test_contains_patterns_use_trigram(db, pattern, index):
+    (where, params) = search.match_sql("owner", pattern)
+    if index:
+        assert f"planes_{index}" in where
+    else:
+        assert where == "owner LIKE :owner"
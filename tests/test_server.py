@@ -0,0 +1,15 @@
+from adslib import server
+
+
+def test_relative_queries_expire_with_the_window(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(server.time, "time", lambda: clock[0])
+
+    hours = server.cache_key("/planes", {"hours": "1"})
+    stats = server.cache_key("/stats", {})
+    plane = server.cache_key("/planes/ABC123", {})
+    clock[0] += server.WINDOW
+
+    assert server.cache_key("/planes", {"hours": "1"}) != hours
+    assert server.cache_key("/stats", {}) != stats
+    assert server.cache_key("/planes/ABC123", {}) == plane
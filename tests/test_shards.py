@@ -0,0 +1,107 @@
+import logging
+import os
+import sqlite3
+
+import pytest
+
+from adslib import shards
+from adslib.constants import AIRCRAFT_COLUMNS, sql_create_flight_cache_table
+
+HOME = (32.78, -79.94)
+
+AIRCRAFT = [
+    ("A1B2C3", "DAL", "", "United States", "United States", "", "", "", "BOEING", "737-932ER", "Delta Air Lines", "N801DZ", "B739", "A", "DAL", "31914"),
+    ("AE1234", "", "", "United States", "United States", "", "", "", "LOCKHEED", "C-130H", "United States Air Force", "92-1531", "C130", "A", "", ""),
+    ("C0FFEE", "", "", "Canada", "Canada", "", "", "", "CESSNA", "172", "Private", "C-FABC", "C172", "A", "", ""),
+]
+
+
+@pytest.fixture
+def dbs(tmp_path):
+    base_station = str(tmp_path / "BaseStation.sqb")
+    conn = sqlite3.connect(base_station)
+    columns = list(dict.fromkeys(AIRCRAFT_COLUMNS))
+    conn.execute(f"CREATE TABLE Aircraft ({', '.join(columns)})")
+    conn.executemany(
+        f"INSERT INTO Aircraft VALUES ({', '.join('?' * len(columns))})",
+        [tuple(dict(zip(AIRCRAFT_COLUMNS, row)).values()) for row in AIRCRAFT],
+    )
+    conn.commit()
+    conn.close()
+
+    standing_data = str(tmp_path / "StandingData.sqb")
+    conn = sqlite3.connect(standing_data)
+    conn.execute("CREATE TABLE RouteView (Callsign, FromAirportIcao, ToAirportIcao)")
+    conn.execute("INSERT INTO RouteView VALUES ('DAL100', 'KATL', 'KCHS')")
+    conn.commit()
+    conn.close()
+
+    db_file = str(tmp_path / "ads-db-planes.sqb")
+    conn = sqlite3.connect(db_file)
+    conn.execute(sql_create_flight_cache_table)
+    conn.execute("INSERT INTO flight_cache (flight, from_airport, to_airport, distance) VALUES ('DAL200', 'KJFK', 'KCHS', 550)")
+    conn.commit()
+    conn.close()
+
+    shards.home = HOME
+    yield (base_station, standing_data, db_file)
+    shards.stop()
+
+
+def reports():
+    received = list()
+    for (i, icao) in enumerate(["a1b2c3", "~ae1234", "C0FFEE", "abcdef", "A1B2C3"]):
+        p = {"hex": icao, "lat": HOME[0] + i / 10, "lon": HOME[1] - i / 10, "alt_baro": 1000 * i, "track": 90.5, "gs": 250.2}
+        if i < 3:
+            p["flight"] = ["DAL100  ", "DAL200", "N1"][i]
+        received.append((f"site{i % 2}", p))
+    # Malformed report (no lat) is skipped either way
+    received.append(("site0", {"hex": "123456", "lon": HOME[1]}))
+    return received
+
+
+def test_workers_match_in_process(dbs):
+    received = reports()
+
+    shards.open_connections(*dbs)
+    in_process = shards.enrich(received, routes=True)
+    in_process_no_routes = shards.enrich(received, routes=False)
+
+    shards.start(2, *dbs)
+    assert shards.enrich(received, routes=True) == in_process
+    assert shards.enrich(received, routes=False) == in_process_no_routes
+
+    assert [a["icao"] for a in in_process] == ["A1B2C3", "AE1234", "C0FFEE", "ABCDEF", "A1B2C3"]
+    assert in_process[0]["routes"] == (("", "", 0), ("KATL", "KCHS"))
+    assert in_process[1]["routes"] == (("KJFK", "KCHS", 550), None)
+    assert in_process[1]["military"] == "M"
+    assert all(a["routes"] is None for a in in_process_no_routes)
+
+
+def test_shard_uses_normalized_icao(dbs):
+    shards.start(3, *dbs)
+    assert shards.shard(shards.normalize_icao("~ae1234")) == shards.shard("AE1234")
+
+
+def test_worker_logs_reach_daemon(dbs, caplog):
+    shards.start(1, *dbs)
+    with caplog.at_level(logging.WARNING, logger="ads-shards"):
+        shards.enrich([("site9", {"hex": "123456", "lon": HOME[1]})])
+        shards.stop()
+    assert any("Bad aircraft report from site9" in r.getMessage() and r.process != os.getpid() for r in caplog.records)
+
+
+def test_cache_is_bounded_and_expires(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(shards.time, "time", lambda: clock[0])
+    monkeypatch.setattr(shards, "CACHE_SIZE", 2)
+    cache = shards.OrderedDict()
+
+    shards.cache_put(cache, "A", 1)
+    shards.cache_put(cache, "B", 2)
+    assert shards.cache_get(cache, "A") == 1
+    shards.cache_put(cache, "C", 3)
+    assert list(cache) == ["A", "C"]
+
+    clock[0] += shards.CACHE_TTL
+    assert shards.cache_get(cache, "A") is None
@@ -0,0 +1,52 @@
+import sqlite3
+from datetime import date, datetime
+
+import pytest
+
+from adslib import helpers
+from adslib.constants import (
+    sql_create_flights_table,
+    sql_create_plane_days_table,
+    sql_create_planes_table,
+    sql_new_flights,
+    sql_new_plane_days,
+    sql_new_planes,
+    sql_upsert_flights,
+    sql_upsert_plane_days,
+    sql_upsert_planes,
+)
+
+NOW = datetime(2024, 5, 1, 12, 0, 0)
+LATER = datetime(2024, 5, 1, 12, 0, 10)
+
+
+@pytest.fixture(params=[True, False], ids=["returning", "read-back"])
+def cur(request, monkeypatch):
+    if request.param and sqlite3.sqlite_version_info < (3, 35):
+        pytest.skip("SQLite without RETURNING")
+    monkeypatch.setattr(helpers, "RETURNING", request.param)
+    conn = sqlite3.connect(":memory:", detect_types=sqlite3.PARSE_DECLTYPES)
+    conn.execute(sql_create_planes_table)
+    conn.execute(sql_create_plane_days_table)
+    conn.execute("CREATE UNIQUE INDEX plane_days_key_idx ON plane_days(icao, day, ident);")
+    conn.execute(sql_create_flights_table)
+    yield conn.cursor()
+    conn.close()
+
+
+def plane(now):
+    return dict(
+        icao="ABC123", ident="DAL1", ptype="B738", squawk="", speed=250, altitude=3000, distance=5, heading=90,
+        now=now, today=datetime(2024, 5, 1), reg="N1", country="USA", owner="Delta", military=".", category="A3",
+        status="A", opcode="DAL", model="737", serial="1", day=date(2024, 5, 1), flight="DAL1",
+        from_airport="", to_airport="", route_distance=0,
+    )
+
+
+@pytest.mark.parametrize(
+    "sql, new_sql",
+    [(sql_upsert_planes, sql_new_planes), (sql_upsert_plane_days, sql_new_plane_days), (sql_upsert_flights, sql_new_flights)],
+)
+def test_upsert_reports_new_rows(cur, sql, new_sql):
+    assert helpers.upsert(cur, sql, plane(NOW), new_sql) is True
+    assert helpers.upsert(cur, sql, plane(LATER), new_sql) is False